@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import zipfile
+import logging
+from functools import partial
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from executor import PoolBusy
+
+logger = logging.getLogger(__name__)
+
+HTML_EXTENSIONS = ('.html', '.htm')
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))
+
+# One HTML document of a batch; read() returns its bytes.
+BatchMember = namedtuple('BatchMember', ['name', 'size', 'read'])
+
+
+class ZipStream:
+    """Unseekable sink for zipfile that keeps what was written until it is drained.
+
+    zipfile falls back to data descriptors for unseekable files, so a ZIP can be sent while it is
+    still being written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _read_upload(stream):
+    stream.seek(0)
+    return stream.read()
+
+
+def batch_members(uploads):
+    """List the documents of a batch given as (filename, seekable binary stream) pairs.
+
+    Streams named *.zip are archives and contribute each of their files; any other stream is one
+    document. Raises zipfile.BadZipFile for a damaged archive.
+    """
+    members = []
+    for filename, stream in uploads:
+        if not filename.lower().endswith('.zip'):
+            stream.seek(0, os.SEEK_END)
+            members.append(BatchMember(filename, stream.tell(), partial(_read_upload, stream)))
+            continue
+        archive = zipfile.ZipFile(stream)
+        for info in archive.infolist():
+            # Folders, and the resource forks macOS adds to archives it creates, are not documents.
+            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                continue
+            members.append(BatchMember(info.filename, info.file_size, partial(archive.read, info)))
+    return members
+
+
+def output_name(name, extension, taken):
+    """Archive name for the output of member name: its extension swapped, made unique among taken."""
+    root = os.path.splitext(name)[0]
+    candidate = root + extension
+    suffix = 1
+    while candidate in taken:
+        suffix += 1
+        candidate = f'{root}-{suffix}{extension}'
+    taken.add(candidate)
+    return candidate
+
+
+def convert_batch(members, start, extension, max_member_bytes, max_in_flight):
+    """Yield a ZIP of the converted members and a manifest.json, in pieces as each member finishes.
+
+    start(html_bytes, wait) begins converting one document and returns a Future of (output bytes,
+    stats); without wait it may raise PoolBusy. At most max_in_flight members are converted at once,
+    and outputs are added in the order they finish. Members that are not HTML, are larger than
+    max_member_bytes or fail to convert get an entry in the manifest instead of an output.
+    """
+    sink = ZipStream()
+    archive = zipfile.ZipFile(sink, 'w')
+    compress_type = zipfile.ZIP_STORED if extension == '.xlsx' else zipfile.ZIP_DEFLATED
+    taken = {MANIFEST_NAME}
+    files = []
+    pending = {}
+    queue = deque(members)
+    data = None
+    batch_started = time.perf_counter()
+    try:
+        while queue or pending:
+            while queue and len(pending) < max_in_flight:
+                member = queue[0]
+                if not member.name.lower().endswith(HTML_EXTENSIONS):
+                    files.append({'source': member.name, 'status': 'skipped', 'error': 'Not an HTML file'})
+                    queue.popleft()
+                    continue
+                if member.size > max_member_bytes:
+                    files.append({'source': member.name, 'status': 'error', 'error': 'File too large'})
+                    queue.popleft()
+                    continue
+                try:
+                    if data is None:
+                        data = member.read()
+                    # With nothing of ours in flight, wait for a worker rather than stall the batch.
+                    future = start(data, not pending)
+                except PoolBusy:
+                    break
+                except Exception as e:
+                    files.append({'source': member.name, 'status': 'error', 'error': str(e) or type(e).__name__})
+                    queue.popleft()
+                    data = None
+                    continue
+                pending[future] = (member, time.perf_counter())
+                queue.popleft()
+                data = None
+
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                member, member_started = pending.pop(future)
+                record = {'source': member.name}
+                try:
+                    output, stats = future.result()
+                except Exception as e:
+                    logger.error(f"Batch conversion of {member.name} failed: {e}")
+                    record.update(status='error', error=str(e) or type(e).__name__)
+                else:
+                    name = output_name(member.name, extension, taken)
+                    archive.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), output, compress_type)
+                    record.update(status='ok', output=name, bytes=len(output), stats=stats)
+                record['seconds'] = round(time.perf_counter() - member_started, 3)
+                files.append(record)
+            yield sink.drain()
+
+        statuses = [record['status'] for record in files]
+        manifest = {
+            'converted': statuses.count('ok'),
+            'failed': statuses.count('error'),
+            'skipped': statuses.count('skipped'),
+            'seconds': round(time.perf_counter() - batch_started, 3),
+            'files': files,
+        }
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+        archive.close()
+        yield sink.drain()
+    finally:
+        # The client may go away mid-batch; what has not started yet never will.
+        for future in pending:
+            future.cancel()
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""Per-request memory of the JSON and binary variants of /api/convert.
+
+Posts the same synthetic report to the Flask app both ways through the test client and reports the
+peak memory traced while each request is handled, and its time. Request bodies are built before
+tracing starts, so only the server side (and the test client's copy of the body) is counted.
+
+Usage: python benchmarks/bench_api.py [--rows 20000] [--cols 8] [--app final]
+"""
+import io
+import os
+import sys
+import time
+import base64
+import logging
+import argparse
+import importlib
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_report
+
+
+def traced(post):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = post()
+    body_size = len(response.get_data())
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert response.status_code == 200, response.get_data()[:200]
+    return peak, elapsed, body_size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=20000)
+    arg_parser.add_argument('--cols', type=int, default=8)
+    arg_parser.add_argument('--app', default='final', help='Flask module to load (final or file)')
+    args = arg_parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    client = importlib.import_module(args.app).app.test_client()
+    html = synthetic_report(args.rows, args.cols).encode('utf-8')
+    json_body = {'html_content': base64.b64encode(html).decode('ascii')}
+
+    variants = (
+        ('json', lambda: client.post('/api/convert', json=json_body)),
+        ('text/html', lambda: client.post('/api/convert', data=html, content_type='text/html')),
+        ('multipart', lambda: client.post('/api/convert', data={'file': (io.BytesIO(html), 'report.html')})),
+    )
+    print(f"input {len(html) / 1e6:.1f} MB")
+    print(f"{'variant':>10} {'peak MB':>9} {'seconds':>8} {'response MB':>12}")
+    for name, post in variants:
+        peak, elapsed, body_size = traced(post)
+        print(f"{name:>10} {peak / 1e6:>9.1f} {elapsed:>8.2f} {body_size / 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
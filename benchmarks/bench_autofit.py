@@ -0,0 +1,50 @@
+"""Regression benchmark for row-height autofit on merge-heavy sheets.
+
+Converts reports whose every row carries a merged cell and reports the time per row for the
+cell-writing and save (autofit + workbook.save) stages. Autofit is linear when the time per row
+stays flat as the row count grows.
+
+Usage: python benchmarks/bench_autofit.py [--rows 10000] [--cols 6] [--engine openpyxl]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import sheet_writer
+from model import dom_document, top_level_tables
+from parsers import parse_html
+from benchmarks.synthetic import synthetic_report
+
+
+def run(rows, cols, engine):
+    document = dom_document(top_level_tables(parse_html(synthetic_report(rows, cols, merged_every=1))))
+    table_rows = document.tables[0].rows
+
+    start = time.perf_counter()
+    writer = sheet_writer(document.master_layout_pixels, document.styles, engine)
+    for row in table_rows:
+        writer.write_row(row)
+    written = time.perf_counter()
+    writer.save(io.BytesIO())
+    return written - start, time.perf_counter() - written
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=10000)
+    arg_parser.add_argument('--cols', type=int, default=6)
+    arg_parser.add_argument('--engine', default='openpyxl')
+    args = arg_parser.parse_args()
+
+    print(f"{'merged rows':>12} {'write s':>9} {'save s':>9} {'us/row':>9}")
+    for rows in (args.rows // 4, args.rows // 2, args.rows):
+        write_time, save_time = run(rows, args.cols, args.engine)
+        print(f"{rows:>12} {write_time:>9.2f} {save_time:>9.2f} {(write_time + save_time) / rows * 1e6:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
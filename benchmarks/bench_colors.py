@@ -0,0 +1,45 @@
+"""Per-cell cost of CSS color resolution, cold (uncached) versus repeated (memoized) colors.
+
+Usage: python benchmarks/bench_colors.py [--cells 200000]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from styles import html_color_to_openpyxl_argb
+
+# The kind of palette a generated report uses: a dozen colors across every syntax we accept.
+REPORT_COLORS = [
+    'navy', 'white', '#f2f2f2', '#333', '#1F4E79', '#ffcc0080', 'rgb(221, 235, 247)',
+    'rgba(255, 0, 0, 0.5)', 'rgb(0 128 0 / 75%)', 'hsl(210, 50%, 40%)', 'hsla(0, 0%, 0%, .2)', 'transparent',
+]
+
+
+def per_call_ns(resolve, colors, cells):
+    start = time.perf_counter()
+    for i in range(cells):
+        resolve(colors[i % len(colors)])
+    return (time.perf_counter() - start) / cells * 1e9
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--cells', type=int, default=200000)
+    args = arg_parser.parse_args()
+
+    uncached = html_color_to_openpyxl_argb.__wrapped__
+    html_color_to_openpyxl_argb.cache_clear()
+    cold = per_call_ns(uncached, REPORT_COLORS, args.cells)
+    warm = per_call_ns(html_color_to_openpyxl_argb, REPORT_COLORS, args.cells)
+
+    print(f"{len(REPORT_COLORS)} distinct colors over {args.cells} cells")
+    print(f"{'uncached':<10} {cold:>8.0f} ns/cell")
+    print(f"{'memoized':<10} {warm:>8.0f} ns/cell  ({cold / warm:.0f}x faster)")
+    print(html_color_to_openpyxl_argb.cache_info())
+
+
+if __name__ == '__main__':
+    main()
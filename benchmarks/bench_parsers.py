@@ -0,0 +1,53 @@
+"""Parse-time benchmark for the HTML parser backends on a large synthetic report table.
+
+Usage: python benchmarks/bench_parsers.py [--rows 20000] [--cols 12] [--repeat 3]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers import available_parsers, parse_html
+from model import table_cols, table_rows, top_level_tables
+from benchmarks.synthetic import synthetic_report
+
+
+def walk(document):
+    """Touch every node the converter touches so lazy backends pay their full cost."""
+    cells = 0
+    for table in top_level_tables(document):
+        table_cols(table)
+        for row in table_rows(table):
+            for cell in row.find_all(['td', 'th'], recursive=False):
+                cell.get_text(strip=True)
+                cell.get('style', '')
+                cells += 1
+    return cells
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=20000)
+    arg_parser.add_argument('--cols', type=int, default=12)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    html_content = synthetic_report(args.rows, args.cols)
+    print(f"Synthetic report: {len(html_content) / 1024 / 1024:.1f} MB, {args.rows} rows x {args.cols} cols")
+    print(f"{'backend':<12} {'parse s':>9} {'walk s':>9} {'cells':>9}")
+    for backend in available_parsers():
+        parse_times, walk_times = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            document = parse_html(html_content, backend)
+            parsed = time.perf_counter()
+            cells = walk(document)
+            parse_times.append(parsed - start)
+            walk_times.append(time.perf_counter() - parsed)
+        print(f"{backend:<12} {min(parse_times):>9.3f} {min(walk_times):>9.3f} {cells:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Time and peak memory of each conversion stage on synthetic reports from 1 KB to 100 MB.
+
+For every size a report is generated with benchmarks.synthetic.report_of_size and converted stage by
+stage, the way converter.convert_to_excel does it: parse, build (the model) and write on the DOM
+path; scan (the layout pass) and convert (building and writing interleave) on the streaming path.
+Each stage's time is the best of --repeat untraced runs; its peak memory is what tracemalloc saw
+during one more, traced run. Results go to stdout and, with --json, to a report that --compare
+lines up against an earlier one, stage by stage.
+
+Usage: python benchmarks/bench_pipeline.py [--sizes 1KB,100KB,1MB,10MB,100MB] [--mode auto] [--json out.json] [--compare base.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import STREAMING_MIN_BYTES, convert_to_excel, write_document
+from parsers import parse_html, resolve_parser, scan_table_layouts
+from model import dom_document, streamed_document, top_level_tables
+from benchmarks.synthetic import COLGROUP_LAYOUTS, parse_size, report_of_size
+
+
+def dom_stages(html, parser, engine):
+    """(stage, callable) pairs of the DOM path; each callable takes the previous stage's result."""
+    def write(document):
+        if not document.master_layout_pixels:
+            # No <col> layout: time the converter's fallback, which is what such a report gets.
+            return convert_to_excel(html, io.BytesIO(), parser, engine=engine)
+        return write_document(document, io.BytesIO(), engine)
+
+    return (
+        ('parse', lambda _: top_level_tables(parse_html(html, parser))),
+        ('build', dom_document),
+        ('write', write),
+    )
+
+
+def streaming_stages(html, engine):
+    source = html.encode('utf-8')
+    return (
+        ('scan', lambda _: scan_table_layouts(source)),
+        ('convert', lambda layouts: write_document(streamed_document(source, layouts), io.BytesIO(), engine)),
+    )
+
+
+def run_stages(stages, traced):
+    """Run the stages in order; return {stage: seconds or peak traced bytes} and the last result."""
+    measurements = {}
+    result = None
+    for name, stage in stages:
+        if traced:
+            tracemalloc.reset_peak()
+            result = stage(result)
+            measurements[name] = tracemalloc.get_traced_memory()[1]
+        else:
+            start = time.perf_counter()
+            result = stage(result)
+            measurements[name] = time.perf_counter() - start
+    return measurements, result
+
+
+def measure(stages, repeat):
+    timings = [run_stages(stages, traced=False)[0] for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        peaks, stats = run_stages(stages, traced=True)
+    finally:
+        tracemalloc.stop()
+    return {
+        name: {'seconds': round(min(timing[name] for timing in timings), 6), 'peak_bytes': peaks[name]}
+        for name in peaks
+    }, stats
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {(entry['size'], entry['mode']): entry for entry in baseline['results']}
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('revision')}); ratios above 1 are slower or larger")
+    print(f"{'size':>8} {'mode':>9} {'stage':>8} {'time x':>8} {'memory x':>9}")
+    for entry in results:
+        before = previous.get((entry['size'], entry['mode']))
+        if before is None:
+            continue
+        for name, stage in entry['stages'].items():
+            old = before['stages'].get(name)
+            if not old:
+                continue
+            time_ratio = stage['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+            memory_ratio = stage['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else float('nan')
+            print(f"{entry['size']:>8} {entry['mode']:>9} {name:>8} {time_ratio:>8.2f} {memory_ratio:>9.2f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--sizes', default='1KB,100KB,1MB,10MB,100MB')
+    arg_parser.add_argument('--mode', choices=('auto', 'dom', 'streaming', 'both'), default='auto',
+                            help='auto streams reports of 20 MB and more, like the web apps')
+    arg_parser.add_argument('--cols', type=int, default=8)
+    arg_parser.add_argument('--colspan-density', type=float, default=0.05)
+    arg_parser.add_argument('--colgroup', choices=COLGROUP_LAYOUTS, default='varied')
+    arg_parser.add_argument('--style-variety', type=int, default=8)
+    arg_parser.add_argument('--nested-every', type=int, default=0)
+    arg_parser.add_argument('--tables', type=int, default=1)
+    arg_parser.add_argument('--parser', help='HTML parser backend (default: parsers.DEFAULT_PARSER)')
+    arg_parser.add_argument('--engine', help='output engine (default: openpyxl on the DOM path, write_only streaming)')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--json', help='write the results to this file')
+    arg_parser.add_argument('--compare', help='earlier --json report to compare against')
+    args = arg_parser.parse_args()
+
+    params = {
+        'cols': args.cols, 'colspan_density': args.colspan_density, 'colgroup': args.colgroup,
+        'style_variety': args.style_variety, 'nested_every': args.nested_every, 'tables': args.tables,
+    }
+    parser = resolve_parser(args.parser)
+    results = []
+    print(f"{'size':>8} {'MB':>8} {'rows':>8} {'mode':>9} {'stage':>8} {'seconds':>9} {'peak MB':>9}")
+    for size in args.sizes.split(','):
+        html, rows = report_of_size(parse_size(size), **params)
+        html_bytes = len(html.encode('utf-8'))
+        if args.mode == 'both':
+            modes = ('dom', 'streaming')
+        elif args.mode == 'auto':
+            modes = ('streaming' if html_bytes >= STREAMING_MIN_BYTES else 'dom',)
+        else:
+            modes = (args.mode,)
+        for mode in modes:
+            if mode == 'dom':
+                stages = dom_stages(html, parser, args.engine)
+            else:
+                stages = streaming_stages(html, args.engine or 'write_only')
+            measured, stats = measure(stages, args.repeat)
+            results.append({
+                'size': size, 'bytes': html_bytes, 'rows': rows, 'mode': mode,
+                'cells': stats.get('cells'), 'stages': measured,
+                'total_seconds': round(sum(stage['seconds'] for stage in measured.values()), 6),
+            })
+            for name, stage in measured.items():
+                print(f"{size:>8} {html_bytes / 1e6:>8.2f} {rows:>8} {mode:>9} {name:>8} "
+                      f"{stage['seconds']:>9.3f} {stage['peak_bytes'] / 1e6:>9.1f}")
+        del html
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parser': parser,
+            'engine': args.engine,
+            'repeat': args.repeat,
+            'params': params,
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
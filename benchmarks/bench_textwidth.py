@@ -0,0 +1,110 @@
+"""Benchmark and accuracy check for wrapped-line estimation.
+
+Estimates the wrapped lines of a column of cells with the old per-cell length loop and with the
+vectorized, font-aware textwidth.line_counts, and compares both with a word-by-word greedy wrap
+measured on the same glyph tables. Reports the best time per call over --repeat runs and the share of cells each estimate gets
+within one line of the greedy wrap.
+
+Usage: python benchmarks/bench_textwidth.py [--cells 100000] [--width 20] [--repeat 5]
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import textwidth
+from textwidth import FONTS, font_index, line_counts
+
+WORDS = ('revenue', 'Q3', 'total', 'North America', 'adjusted EBITDA', 'W', 'iiii', '1,234,567.89',
+         'Operating margin', 'n/a', 'MMMM', 'see note 4', 'year-over-year', 'Total', '-', '%')
+
+
+def cell_texts(count, seed=1):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+        if rng.random() < 0.1:
+            text = text.replace(' ', '\n', 1)
+        texts.append(text)
+    return texts
+
+
+def legacy_lines(texts, width_units):
+    """The estimator textwidth replaced: character count over width / 1.1, or newlines."""
+    counts = []
+    for text in texts:
+        lines_from_wrapping = math.ceil(len(text) / (width_units / 1.1)) if width_units > 0 else 1
+        counts.append(max(text.count('\n') + 1, lines_from_wrapping))
+    return np.array(counts)
+
+
+def greedy_lines(text, width_units, font, size, bold):
+    """Word-by-word wrap, as Excel lays out wrapped text, measured with the textwidth glyph tables."""
+    metrics = textwidth._GLYPH_UNITS[font].tolist()
+    scale = size * textwidth.PX_PER_POINT / textwidth.UNITS_PER_EM * (textwidth.BOLD_WIDTH_FACTOR if bold else 1.0)
+    usable = max(float(textwidth.column_pixels(width_units)) - textwidth.CELL_PADDING_PX, 1.0)
+
+    def measure(word):
+        return sum(metrics[min(ord(char), textwidth._AVERAGE_GLYPH)] for char in word) * scale
+
+    space = measure(' ')
+    lines = 0
+    for paragraph in text.split('\n'):
+        lines += 1
+        used = 0.0
+        for word in paragraph.split(' '):
+            word_width = measure(word)
+            if used and used + space + word_width > usable:
+                lines += 1
+                used = 0.0
+            used += (space if used else 0.0) + word_width
+            while used > usable:
+                lines += 1
+                used -= usable
+    return lines
+
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--cells', type=int, default=100000)
+    arg_parser.add_argument('--width', type=float, default=20.0, help='column width in Excel units')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    texts = cell_texts(args.cells)
+    rng = random.Random(2)
+    fonts = np.array([font_index(rng.choice(FONTS)) for _ in texts])
+    sizes = np.array([rng.choice((9.0, 11.0, 14.0)) for _ in texts])
+    bold = np.array([rng.random() < 0.2 for _ in texts])
+
+    legacy, legacy_time = best_of(args.repeat, legacy_lines, texts, args.width)
+    estimated, vectorized_time = best_of(args.repeat, line_counts, texts, args.width, fonts, sizes, bold)
+
+    sample = range(0, len(texts), max(1, len(texts) // 5000))
+    reference = np.array([greedy_lines(texts[i], args.width, fonts[i], sizes[i], bold[i]) for i in sample])
+    indexes = list(sample)
+
+    print(f"{'estimator':>12} {'ms':>9} {'within 1 line':>14} {'exact':>7}")
+    for name, elapsed, counts in (('legacy loop', legacy_time, legacy), ('line_counts', vectorized_time, estimated)):
+        error = np.abs(counts[indexes] - reference)
+        print(f"{name:>12} {elapsed * 1000:>9.1f} {np.mean(error <= 1):>14.1%} {np.mean(error == 0):>7.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Synthetic HTML report generators shared by the benchmarks."""
+import random
+
+
+def synthetic_report(rows, cols, merged_every=0):
+    """A single-table report with a <colgroup> layout, a header row and rows of styled cells.
+
+    With merged_every=n, every n-th body row opens with a cell spanning two columns.
+    """
+    parts = ['<html><body><table><colgroup>']
+    parts.extend(f'<col style="width: {80 + (i % 4) * 20}px">' for i in range(cols))
+    parts.append('</colgroup>')
+    parts.append('<tr>' + ''.join(f'<th>Column {c}</th>' for c in range(cols)) + '</tr>')
+    for r in range(rows):
+        style = 'background-color: #f2f2f2;' if r % 2 else ''
+        merged = merged_every and r % merged_every == 0
+        cells = ''.join(
+            f'<td style="text-align: right; font-size: 13px">{r * cols + c}</td>' if c % 3 else
+            f'<td style="font-family: Arial; color: navy"><b>Item {r}</b> description {c}</td>'
+            for c in range(2 if merged else 0, cols)
+        )
+        if merged:
+            cells = f'<td colspan="2">Group {r}: a label long enough to wrap onto a second line</td>' + cells
+        parts.append(f'<tr style="{style}">{cells}</tr>')
+    parts.append('</table></body></html>')
+    return ''.join(parts)
+
+
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+WORDS = ('revenue', 'Q3', 'total', 'North America', 'adjusted EBITDA', 'n/a', 'operating margin', 'see note 4',
+         'year-over-year', 'EMEA', 'forecast', 'headcount', 'cost of sales', 'deferred revenue')
+COLORS = ('navy', '#333', '#c00000', 'rgb(0, 97, 0)', 'hsl(210, 60%, 40%)', '#7f7f7f', 'darkorange', 'teal')
+FILLS = (None, '#f2f2f2', '#dce6f1', 'rgba(255, 192, 0, 0.4)', '#ebf1de', 'lightyellow')
+FONTS = ('Arial', 'Calibri', 'Times New Roman', 'Verdana', 'Courier New')
+COLGROUP_LAYOUTS = ('uniform', 'varied', 'mixed', 'none')
+
+
+def parse_size(text):
+    """Bytes for a size such as '512', '1KB' or '100MB'."""
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def _styles(rng, variety):
+    """variety distinct inline cell styles drawn from fonts, sizes, colors, fills and alignments."""
+    styles = []
+    for _ in range(max(1, variety)):
+        declarations = [f'font-family: {rng.choice(FONTS)}', f'font-size: {rng.choice((9, 10, 11, 13, 16))}px',
+                        f'color: {rng.choice(COLORS)}', f'text-align: {rng.choice(("left", "right", "center"))}']
+        fill = rng.choice(FILLS)
+        if fill:
+            declarations.append(f'background-color: {fill}')
+        if rng.random() < 0.2:
+            declarations.append('font-weight: bold')
+        if rng.random() < 0.1:
+            declarations.append('font-style: italic')
+        styles.append('; '.join(declarations))
+    return styles
+
+
+def _colgroup(rng, cols, layout):
+    if layout == 'none':
+        return ''
+    if layout == 'uniform':
+        widths = [100] * cols
+    else:
+        widths = [rng.choice((40, 60, 80, 100, 120, 160, 240)) for _ in range(cols)]
+    return '<colgroup>' + ''.join(f'<col style="width: {width}px">' for width in widths) + '</colgroup>'
+
+
+def _cell_text(rng, row, col):
+    if col and rng.random() < 0.6:
+        return f'{rng.uniform(-1e6, 1e6):,.2f}'
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) + f' {row}'
+
+
+def _nested_table(rng):
+    rows = ''.join(
+        f'<tr><td>{rng.choice(WORDS)}</td><td>{rng.randint(0, 999)}</td></tr>' for _ in range(rng.randint(1, 3))
+    )
+    return f'<table>{rows}</table>'
+
+
+def generate_report(rows, cols=8, colspan_density=0.05, colgroup='varied', style_variety=8, nested_every=0,
+                    tables=1, seed=0):
+    """A report of tables with tunable shape, for benchmarks that need more than synthetic_report.
+
+    rows body rows are split evenly over tables tables of cols columns, each under a header row.
+    colspan_density is the share of cells that span two or three columns. colgroup picks the <col>
+    layouts: 'uniform' widths, 'varied' widths, 'mixed' (every other table has fewer, differently
+    sized columns, so tables are mapped onto the widest one) or 'none' (no layout at all, which takes
+    the converter's fallback path). Cells cycle through style_variety distinct inline styles, and
+    with nested_every=n every n-th row holds a table nested in one of its cells. Output is
+    deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    styles = _styles(rng, style_variety)
+    parts = ['<html><head><title>Synthetic report</title></head><body>']
+    rows_left = rows
+    for table_index in range(tables):
+        table_cols = cols
+        if colgroup == 'mixed' and table_index % 2:
+            table_cols = max(1, cols - 1 - table_index % 3)
+        table_rows = rows_left // (tables - table_index)
+        rows_left -= table_rows
+        parts.append('<table>')
+        parts.append(_colgroup(rng, table_cols, colgroup))
+        parts.append('<tr>' + ''.join(f'<th>Column {col}</th>' for col in range(table_cols)) + '</tr>')
+        for row in range(table_rows):
+            row_style = ' style="background-color: #fafafa"' if row % 2 else ''
+            cells = []
+            col = 0
+            nested = nested_every and row % nested_every == 0
+            while col < table_cols:
+                span = 1
+                if colspan_density and rng.random() < colspan_density:
+                    span = min(rng.choice((2, 3)), table_cols - col)
+                text = _nested_table(rng) if nested and col == 1 else _cell_text(rng, row, col)
+                colspan = f' colspan="{span}"' if span > 1 else ''
+                cells.append(f'<td style="{styles[(row + col) % len(styles)]}"{colspan}>{text}</td>')
+                col += span
+            parts.append(f'<tr{row_style}>{"".join(cells)}</tr>')
+        parts.append('</table><p>Notes and totals between tables.</p>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def report_of_size(target_bytes, **params):
+    """generate_report(**params) with the number of rows that brings it close to target_bytes of UTF-8."""
+    sample_rows = 200
+    sample = len(generate_report(sample_rows, **params).encode('utf-8'))
+    empty = len(generate_report(0, **params).encode('utf-8'))
+    per_row = max(1.0, (sample - empty) / sample_rows)
+    rows = max(1, round((target_bytes - empty) / per_row))
+    return generate_report(rows, **params), rows
@@ -0,0 +1,224 @@
+"""Convert HTML reports to Excel (or CSV) from the command line, in parallel worker processes.
+
+Takes files, directories (searched recursively for .html/.htm) and glob patterns, and converts each
+with the same engine as the web apps. Outputs go next to their inputs, or with --output-dir under
+that directory, keeping paths relative to a directory input. Outputs that are already up to date are
+skipped: by default when they are newer than their input (--skip mtime), or with --skip hash when
+they were written from the same content and options, as recorded in a .conversion-state.json next
+to them. Prints per-file and total MB/s and cells/s.
+
+Usage: python cli.py REPORTS... [-o OUT] [-j 4] [--engine write_only] [--sheets table] [--skip hash] [--force]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import converter
+from parsers import resolve_parser, DEFAULT_PARSER, PARSER_BACKENDS
+from executor import run_conversion, DEFAULT_MAX_TASKS_PER_CHILD
+from resultcache import cache_key
+
+HTML_EXTENSIONS = ('.html', '.htm')
+STATE_FILE = '.conversion-state.json'
+
+# One file to convert; key is its content hash for --skip hash, else None.
+Conversion = namedtuple('Conversion', ['source', 'output', 'size', 'streaming', 'key'])
+
+
+def find_inputs(patterns):
+    """(input path, directory its output path is relative to) for each input; directories recurse."""
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                for name in sorted(names):
+                    if name.lower().endswith(HTML_EXTENSIONS):
+                        found.setdefault(os.path.join(root, name), pattern)
+        else:
+            paths = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+            for path in sorted(paths):
+                if os.path.isfile(path):
+                    found.setdefault(path, os.path.dirname(path))
+                elif not os.path.exists(path):
+                    logging.warning(f"No such file: {path}")
+    return list(found.items())
+
+
+def output_path(source, base, output_dir, extension):
+    relative = os.path.relpath(source, base) if output_dir else os.path.basename(source)
+    return os.path.join(output_dir or os.path.dirname(source), os.path.splitext(relative)[0] + extension)
+
+
+class ConversionState:
+    """The content hashes outputs were last written from, one state file per output directory."""
+
+    def __init__(self):
+        self._states = {}
+
+    def _state(self, directory):
+        state = self._states.get(directory)
+        if state is None:
+            try:
+                with open(os.path.join(directory, STATE_FILE), encoding='utf-8') as state_file:
+                    state = json.load(state_file)
+            except (OSError, ValueError):
+                state = {}
+            self._states[directory] = state
+        return state
+
+    def get(self, output):
+        return self._state(os.path.dirname(output)).get(os.path.basename(output))
+
+    def set(self, output, key):
+        self._state(os.path.dirname(output))[os.path.basename(output)] = key
+
+    def save(self):
+        for directory, state in self._states.items():
+            if not state or not os.path.isdir(directory):
+                continue
+            path = os.path.join(directory, STATE_FILE)
+            with open(path + '.part', 'w', encoding='utf-8') as state_file:
+                json.dump(state, state_file, indent=0, sort_keys=True)
+            os.replace(path + '.part', path)
+
+
+def content_key(source, parser, streaming, engine, sheets=None):
+    options = {'parser': None if streaming else parser, 'streaming': streaming, 'engine': engine}
+    if sheets not in (None, 'single'):
+        options['sheets'] = sheets
+    with open(source, 'rb') as html_file:
+        return cache_key(html_file, **options)
+
+
+def convert_file(source, output, parser, streaming, engine, sheets=None):
+    """Convert one file (in a worker) into output, which only appears once complete; return the stats."""
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    partial_output = output + '.part'
+    try:
+        with open(source, 'rb') as html_file, open(partial_output, 'wb') as output_file:
+            stats = run_conversion(html_file, output_file, parser, streaming, engine, sheets=sheets)
+    except BaseException:
+        if os.path.exists(partial_output):
+            os.remove(partial_output)
+        raise
+    os.replace(partial_output, output)
+    return stats
+
+
+def timed_conversion(source, output, parser, streaming, engine, sheets=None):
+    start = time.perf_counter()
+    stats = convert_file(source, output, parser, streaming, engine, sheets)
+    return stats, time.perf_counter() - start
+
+
+def run_all(work, jobs, parser, engine, sheets=None):
+    """Yield (conversion, (stats, seconds) or the exception it raised) as the conversions finish."""
+    if jobs <= 1:
+        for item in work:
+            try:
+                yield item, timed_conversion(item.source, item.output, parser, item.streaming, engine, sheets)
+            except Exception as e:
+                yield item, e
+        return
+    with ProcessPoolExecutor(jobs, max_tasks_per_child=DEFAULT_MAX_TASKS_PER_CHILD) as pool:
+        futures = {
+            pool.submit(timed_conversion, item.source, item.output, parser, item.streaming, engine, sheets): item
+            for item in work
+        }
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], e
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def report(megabytes, cells, seconds, label):
+    seconds = max(seconds, 1e-9)
+    print(f"{megabytes:8.2f} MB {seconds:7.2f} s {megabytes / seconds:7.2f} MB/s {cells / seconds:10,.0f} cells/s  {label}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('inputs', nargs='+', help='HTML files, directories or glob patterns')
+    arg_parser.add_argument('-o', '--output-dir', help='directory for the outputs (default: next to each input)')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='worker processes (1: convert in this process)')
+    arg_parser.add_argument('--engine', choices=converter.OUTPUT_ENGINES, help='output engine (default: openpyxl, write_only when streaming)')
+    arg_parser.add_argument('--parser', choices=('auto',) + PARSER_BACKENDS,
+                            help=f'HTML parser backend (default: {DEFAULT_PARSER}; auto: the fastest installed)')
+    arg_parser.add_argument('--sheets', choices=converter.SHEET_MODES,
+                            help='single: all tables on one sheet (default); table: a sheet per table; '
+                                 'layout: a sheet per group of tables with the same <col> widths')
+    streaming = arg_parser.add_mutually_exclusive_group()
+    streaming.add_argument('--streaming', dest='streaming', action='store_true', default=None, help='always convert row by row')
+    streaming.add_argument('--no-streaming', dest='streaming', action='store_false', help='never convert row by row')
+    arg_parser.add_argument('--skip', choices=('mtime', 'hash', 'never'), default='mtime', help='when to skip an existing output')
+    arg_parser.add_argument('--force', action='store_true', help='convert everything (same as --skip never)')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+    parser = resolve_parser(args.parser)
+    engine = args.engine
+    extension = converter.output_extension(engine)
+    skip = 'never' if args.force else args.skip
+    state = ConversionState()
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        print("No HTML files found", file=sys.stderr)
+        return 1
+
+    work = []
+    skipped = 0
+    for source, base in inputs:
+        output = output_path(source, base, args.output_dir, extension)
+        size = os.path.getsize(source)
+        streaming = args.streaming if args.streaming is not None else size >= converter.STREAMING_MIN_BYTES
+        key = content_key(source, parser, streaming, engine, args.sheets) if skip == 'hash' else None
+        if os.path.exists(output) and (
+                (skip == 'mtime' and os.path.getmtime(output) >= os.path.getmtime(source)) or
+                (skip == 'hash' and state.get(output) == key)):
+            skipped += 1
+            continue
+        work.append(Conversion(source, output, size, streaming, key))
+
+    if not work:
+        print(f"Nothing to convert ({skipped} up to date)")
+        return 0
+
+    failed = 0
+    total_bytes = total_cells = 0
+    started = time.perf_counter()
+    try:
+        for item, result in run_all(work, args.jobs, parser, engine, args.sheets):
+            if isinstance(result, Exception):
+                failed += 1
+                print(f"FAILED {item.source}: {result}", file=sys.stderr)
+                continue
+            stats, seconds = result
+            cells = stats.get('cells', 0)
+            total_bytes += item.size
+            total_cells += cells
+            if item.key is not None:
+                state.set(item.output, item.key)
+            report(item.size / 1e6, cells, seconds, f'{item.source} -> {item.output}')
+    finally:
+        state.save()
+
+    converted = len(work) - failed
+    print(f"{converted} converted, {skipped} up to date, {failed} failed")
+    report(total_bytes / 1e6, total_cells, time.perf_counter() - started, 'total')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
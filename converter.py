@@ -0,0 +1,748 @@
+import io
+import os
+import csv
+import shutil
+import logging
+import tempfile
+from copy import copy
+from itertools import accumulate
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.merge import MergedCellRange
+from openpyxl.utils import get_column_letter
+
+from styles import StyleRegistry, style_stats
+from parsers import parse_html, scan_table_layouts, split_tables
+from model import Row, dom_document, joined_document, master_layout, sheet_layouts, streamed_document, top_level_tables
+from parallel import (DEFAULT_PARALLEL_MIN_BYTES, RESULTS_PER_WORKER, SharedSource, build_document, chunk_ranges,
+                      forget_parse_pool, ordered_results, parse_pool, parse_workers)
+from textwidth import RowSizer
+from metrics import StageTimer
+
+logger = logging.getLogger(__name__)
+
+
+PIXELS_TO_EXCEL_UNITS = 8.43
+DEFAULT_COLUMN_WIDTH = 13.0  # openpyxl's width for columns without a dimension
+EXCEL_DEFAULT_COLUMN_WIDTH = 8.43  # Excel's width for columns a sheet gives no width (Calibri 11)
+# The write-only engine holds this many rows so that they can be sized in one vectorized call.
+ROW_BATCH_SIZE = 512
+CSV_SPOOL_BYTES = 8 * 1024 * 1024
+# Rows written between two calls of a conversion's progress callback.
+PROGRESS_INTERVAL = 1000
+COPY_CHUNK_SIZE = 1024 * 1024
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_COLUMNS = 16_384
+DEFAULT_SHEET_TITLE = 'Sheet'
+
+# 'openpyxl' keeps the whole sheet addressable until save; 'write_only' flushes each row as it is written;
+# 'csv' writes plain comma-separated text without styles or merges.
+OUTPUT_ENGINES = ('openpyxl', 'write_only', 'csv')
+DEFAULT_ENGINE = os.environ.get('EXCEL_OUTPUT_ENGINE', 'openpyxl')
+
+# 'single' stacks every table on one sheet; 'table' gives each table a sheet of its own and 'layout'
+# one to each group of tables whose <col> widths match. The csv engine has no sheets and ignores it.
+SHEET_MODES = ('single', 'table', 'layout')
+DEFAULT_SHEET_MODE = os.environ.get('EXCEL_SHEET_MODE', 'single')
+
+# Inputs at least this large skip the DOM and are converted row by row, where the caller picks the mode
+# by size (the web apps, the CLI and bench_pipeline --mode auto); convert_to_excel itself never does.
+STREAMING_MIN_BYTES = int(os.environ.get('STREAMING_MIN_BYTES', 20 * 1024 * 1024))
+
+
+def resolve_engine(engine=None):
+    """Validate an output engine name; None is passed through so each mode can pick its own default."""
+    if engine is not None and engine not in OUTPUT_ENGINES:
+        raise ValueError(f"Unknown output engine '{engine}'. Choose one of: {', '.join(OUTPUT_ENGINES)}")
+    return engine
+
+
+def resolve_sheet_mode(sheets=None):
+    """Validate a sheet mode name; None is passed through so that the configured default applies."""
+    if sheets is not None and sheets not in SHEET_MODES:
+        raise ValueError(f"Unknown sheet mode '{sheets}'. Choose one of: {', '.join(SHEET_MODES)}")
+    return sheets
+
+
+def output_extension(engine=None):
+    """File extension of what an engine (None: the configured default) writes."""
+    return '.csv' if (engine or DEFAULT_ENGINE) == 'csv' else '.xlsx'
+
+
+def sheet_writer(master_layout_pixels, style_table, engine=None, timer=None):
+    engine = resolve_engine(engine) or DEFAULT_ENGINE
+    if engine == 'write_only':
+        return WriteOnlySheetWriter(master_layout_pixels, style_table, timer)
+    if engine == 'csv':
+        return CsvWriter(master_layout_pixels, style_table, timer)
+    return SheetWriter(master_layout_pixels, style_table, timer)
+
+
+def write_document(document, output_file, engine=None, progress=None, timer=None):
+    """Emit a model.Document with an output engine and return the conversion stats.
+
+    progress, if given, is called with the number of rows written so far every PROGRESS_INTERVAL rows
+    and once more after the last one. timer is the metrics.StageTimer the write, autofit and save
+    stages are counted on; reading the rows of a streamed document counts as parse. The workbook
+    engines write a single sheet, continued on further ones past Excel's limits (see write_sheets).
+    """
+    if (resolve_engine(engine) or DEFAULT_ENGINE) != 'csv':
+        return write_sheets([(DEFAULT_SHEET_TITLE, document)], output_file, engine, progress, timer)
+    timer = timer or StageTimer()
+    writer = sheet_writer(document.master_layout_pixels, document.styles, engine, timer)
+    tables_written, rows_written, cells_written = _write_tables(writer, document, timer, progress)
+    with timer.stage('save'):
+        writer.save(output_file)
+    if progress is not None:
+        progress(rows_written)
+    stats = writer.stats()
+    stats.update(tables=tables_written, rows=rows_written, cells=cells_written)
+    return stats
+
+
+def write_sheets(sheets, output_file, engine=None, progress=None, timer=None):
+    """Emit (title, model.Document) pairs onto the sheets of one workbook and return the conversion stats.
+
+    Every document gets a sheet of its own with its own column widths, and further sheets where it
+    runs past Excel's limits (see SplitSheetWriter); looks the documents share become one named
+    style. sheets may be a lazy iterable: each document is written as it arrives. engine is one of
+    the workbook engines; progress and timer are as for write_document, counting over all sheets.
+    """
+    timer = timer or StageTimer()
+    engine = resolve_engine(engine) or DEFAULT_ENGINE
+    if engine == 'csv':
+        raise ValueError("The csv engine writes a single sheet")
+    writer_class = WriteOnlySheetWriter if engine == 'write_only' else SheetWriter
+    workbook = Workbook(write_only=writer_class.write_only)
+    if not writer_class.write_only:
+        workbook.remove(workbook.active)
+    named_styles = {}
+
+    def new_sheet(title, master_layout_pixels, style_table):
+        return writer_class(master_layout_pixels, style_table, timer, workbook, title, named_styles)
+
+    tables_written = rows_written = cells_written = merges = sheets_written = 0
+    style_tables = []
+    for title, document in sheets:
+        writer = SplitSheetWriter(new_sheet, title, document.master_layout_pixels, document.styles)
+        tables, rows, cells = _write_tables(writer, document, timer, progress, rows_written)
+        with timer.stage('save'):
+            writer.finish()
+        tables_written += tables
+        rows_written += rows
+        cells_written += cells
+        merges += writer.merges()
+        sheets_written += len(writer.writers)
+        style_tables.append(document.styles)
+    with timer.stage('save'):
+        workbook.save(output_file)
+    if progress is not None:
+        progress(rows_written)
+    return {
+        'styles': style_stats(style_tables), 'merges': merges, 'sheets': sheets_written,
+        'tables': tables_written, 'rows': rows_written, 'cells': cells_written,
+    }
+
+
+def _write_tables(writer, document, timer, progress=None, rows_before=0):
+    """Write the tables of document with writer; return the (tables, rows, cells) written.
+
+    progress is called with rows_before plus the rows written so far every PROGRESS_INTERVAL rows.
+    """
+    tables = document.tables
+    streamed = not isinstance(tables, list)
+    rows_written = cells_written = tables_written = 0
+    with timer.stage('write'):
+        for table in timer.timed('parse', tables) if streamed else tables:
+            for row in timer.timed('parse', table.rows) if streamed else table.rows:
+                writer.write_row(row)
+                rows_written += 1
+                cells_written += len(row)
+                if progress is not None and not (rows_before + rows_written) % PROGRESS_INTERVAL:
+                    progress(rows_before + rows_written)
+            writer.end_table()
+            tables_written += 1
+    return tables_written, rows_written, cells_written
+
+
+class SplitSheetWriter:
+    """Writes the rows of one document onto as many sheets as Excel's limits take.
+
+    A sheet takes max_rows rows (blank rows between tables included); the rows after that continue
+    on a new sheet, where merges still open on the last one end. Cells starting past max_columns go
+    to a companion sheet per max_columns columns, which gets the matching slice of the master layout
+    and stays row for row level with the first one. Sheets are added as rows reach them and are
+    titled title, 'title (2)', 'title (3)' and so on; new_sheet(title, master_layout_pixels,
+    style_table) creates the SheetWriter of each.
+    """
+
+    def __init__(self, new_sheet, title, master_layout_pixels, style_table,
+                 max_rows=EXCEL_MAX_ROWS, max_columns=EXCEL_MAX_COLUMNS):
+        self.new_sheet = new_sheet
+        self.title = title
+        self.master_layout_pixels = master_layout_pixels
+        self.style_table = style_table
+        self.max_rows = max_rows
+        self.max_columns = max_columns
+        self.writers = []
+        self._bands = {}  # column band -> writer of the sheet it is on now
+        self._rows = 0  # rows written to the current sheets
+
+    def _writer(self, band):
+        writer = self._bands.get(band)
+        if writer is None:
+            title = f'{self.title} ({len(self.writers) + 1})' if self.writers else self.title
+            first = band * self.max_columns
+            writer = self._bands[band] = self.new_sheet(
+                title, self.master_layout_pixels[first:first + self.max_columns], self.style_table)
+            self.writers.append(writer)
+            # A band first reached further down starts level with the others.
+            for _ in range(self._rows):
+                writer.write_row(Row())
+        return writer
+
+    def write_row(self, row):
+        if self._rows >= self.max_rows:
+            self.finish()
+            self._bands = {}
+            self._rows = 0
+        last = row.last_column()
+        if last <= self.max_columns and len(self._bands) <= 1:
+            self._writer(0).write_row(row)
+        else:
+            max_columns = self.max_columns
+            bands = set(self._bands).union(range((last - 1) // max_columns + 1))
+            for band in sorted(bands):
+                piece = row.band(band * max_columns + 1, (band + 1) * max_columns)
+                if piece or piece.covered or band in self._bands:
+                    self._writer(band).write_row(piece)
+        self._rows += 1
+
+    def end_table(self):
+        for writer in self._bands.values():
+            writer.end_table()
+        self._rows += 1
+
+    def finish(self):
+        """Finish the current sheets; a document without rows still gets its (empty) first one."""
+        if not self.writers:
+            self._writer(0)
+        for writer in self._bands.values():
+            writer.finish()
+
+    def merges(self):
+        return sum(writer.merges for writer in self.writers)
+
+
+class SheetWriter:
+    """Writes the laid-out rows of a model.Document onto a single worksheet.
+
+    Cells stay addressable until save(). While rows are written, every text cell is recorded with the
+    width of its merge span and its font; save() estimates the wrapped lines of all of them with one
+    vectorized textwidth call and sizes the rows from that.
+
+    A cell with a rowspan opens a merge that grows with each row its block is covered in (Row.covered)
+    and is added when the table ends, so a span running past the last row ends with the table.
+
+    Given a workbook, the writer adds a sheet titled title to it, shares the workbook's named_styles
+    (see StyleRegistry) and leaves saving to the caller, who calls finish() instead of save().
+    """
+
+    write_only = False
+    # Width of the columns past the master layout, which finish() pins and rows are sized against.
+    overflow_column_width = DEFAULT_COLUMN_WIDTH
+
+    def __init__(self, master_layout_pixels, style_table, timer=None, workbook=None, title=None, named_styles=None):
+        self.timer = timer or StageTimer()
+        if workbook is None:
+            self.workbook = Workbook(write_only=self.write_only)
+            self.worksheet = self.workbook.create_sheet() if self.write_only else self.workbook.active
+        else:
+            self.workbook = workbook
+            self.worksheet = workbook.create_sheet(title)
+        self.master_layout_pixels = master_layout_pixels
+        self.current_row = 1
+        self.last_row = 0
+        self.merges = 0
+        self._open_merges = {}  # start column -> [first row, last column, last row] of a vertical merge
+
+        self.style_table = style_table
+        self.styles = StyleRegistry(self.workbook, style_table, named_styles=named_styles)
+        self.sizer = RowSizer()
+        self.overflow_columns = set()
+
+        self.column_widths = [px / PIXELS_TO_EXCEL_UNITS for px in master_layout_pixels]
+        self.width_offsets = list(accumulate(self.column_widths, initial=0.0))
+        for i, width in enumerate(self.column_widths):
+            self.worksheet.column_dimensions[get_column_letter(i + 1)].width = width
+
+    def span_width(self, column, colspan):
+        """Width in Excel units available to a cell starting at column and merged across colspan columns."""
+        width_offsets = self.width_offsets
+        master_columns = len(width_offsets) - 1
+        end = column + colspan - 1
+        effective_width_units = 0.0
+        if column <= master_columns:
+            effective_width_units = width_offsets[min(end, master_columns)] - width_offsets[column - 1]
+        past_master = end - max(column - 1, master_columns)
+        if past_master > 0:
+            effective_width_units += past_master * self.overflow_column_width
+        return effective_width_units
+
+    def measure(self, row, column, colspan, text, style_id):
+        """Queue a cell for row sizing; empty cells never wrap."""
+        if text:
+            style_key = self.style_table[style_id]
+            self.sizer.add(row, text, self.span_width(column, colspan),
+                           style_key.font_family, style_key.font_size, style_key.bold)
+            if column + colspan - 1 > len(self.column_widths):
+                self.overflow_columns.update(range(max(column, len(self.column_widths) + 1), column + colspan))
+
+    def write_row(self, row):
+        worksheet = self.worksheet
+        current_row_excel = self.current_row
+        rowspans = row.rowspans
+
+        for current_col_excel, excel_colspan, text, style_id in row:
+            target_cell = worksheet.cell(row=current_row_excel, column=current_col_excel)
+            target_cell.value = text
+            target_cell._style = copy(self.styles.style_array(style_id))
+            self.measure(current_row_excel, current_col_excel, excel_colspan, text, style_id)
+            self.last_row = current_row_excel
+
+            rowspan = rowspans.get(current_col_excel, 1) if rowspans else 1
+            if rowspan > 1:
+                self.open_merge(current_row_excel, current_col_excel, excel_colspan)
+            elif excel_colspan > 1:
+                self.add_merge(current_col_excel, current_row_excel, current_col_excel + excel_colspan - 1, current_row_excel)
+            if excel_colspan > 1:
+                self.cover(current_row_excel, current_col_excel + 1, excel_colspan - 1)
+
+        if row.covered:
+            for column, excel_colspan in row.covered:
+                self.extend_merge(current_row_excel, column)
+                self.cover(current_row_excel, column, excel_colspan)
+            self.last_row = current_row_excel
+
+        self.current_row += 1
+
+    def cover(self, row, column, count):
+        """Give count cells of row from column on, which a merge covers, the border style.
+
+        The style is resolved once and its array copied into each cell, instead of assigning it by
+        name, which makes openpyxl search the workbook's named styles for every cell.
+        """
+        style = self.styles.border_style_array()
+        cell = self.worksheet.cell
+        for covered_column in range(column, column + count):
+            cell(row=row, column=covered_column)._style = copy(style)
+
+    def add_merge(self, min_col, min_row, max_col, max_row):
+        # Rows are written top to bottom and left to right, so merges never overlap; adding to the set
+        # directly skips MultiCellRange.add's scan over every existing merge, and the covered cells
+        # get the border style from cover() instead of merge_cells' per-cell border formatting.
+        cell_range = CellRange(min_col=min_col, min_row=min_row, max_col=max_col, max_row=max_row)
+        self.worksheet.merged_cells.ranges.add(MergedCellRange(self.worksheet, cell_range.coord))
+        self.merges += 1
+
+    def open_merge(self, row, column, excel_colspan):
+        """Start the merge of a cell with a rowspan; it grows with every row its block is covered in."""
+        self.close_merges(column)
+        self._open_merges[column] = [row, column + excel_colspan - 1, row]
+
+    def extend_merge(self, row, column):
+        merge = self._open_merges.get(column)
+        if merge is not None:
+            merge[2] = row
+
+    def close_merges(self, column=None):
+        """Add the open merge starting at column, or all of them, to the sheet in one go."""
+        for min_col in [column] if column is not None else list(self._open_merges):
+            merge = self._open_merges.pop(min_col, None)
+            if merge is None:
+                continue
+            min_row, max_col, max_row = merge
+            if max_row > min_row or max_col > min_col:
+                self.add_merge(min_col, min_row, max_col, max_row)
+
+    def stats(self):
+        return {'styles': self.style_table.stats(), 'merges': self.merges}
+
+    def end_table(self):
+        self.close_merges()
+        self.current_row += 1
+
+    def finish(self):
+        """Add the open merges, size the rows and pin the widths of columns past the master layout."""
+        self.close_merges()
+        row_dimensions = self.worksheet.row_dimensions
+        if self.last_row:
+            with self.timer.stage('autofit'):
+                heights = self.sizer.row_heights(1, self.last_row)
+            for row_index, height in enumerate(heights.tolist(), start=1):
+                row_dimensions[row_index].height = height
+        # Text that runs past the master layout was sized against the default width; pin it.
+        for column in sorted(self.overflow_columns):
+            self.worksheet.column_dimensions[get_column_letter(column)].width = self.overflow_column_width
+
+    def save(self, output_file):
+        self.finish()
+        self.workbook.save(output_file)
+
+
+class WriteOnlySheetWriter(SheetWriter):
+    """Constant-memory writer on an openpyxl write-only sheet.
+
+    Rows are merged as they are written and flushed to the output stream in batches of ROW_BATCH_SIZE,
+    each batch sized with one vectorized textwidth call, so memory stays bounded by the batch. Column
+    widths come from the master layout. A write-only sheet writes its widths before its first row, so
+    columns past the layout cannot be pinned as they turn up; they keep Excel's default width, which
+    their rows are sized against.
+    """
+
+    write_only = True
+    overflow_column_width = EXCEL_DEFAULT_COLUMN_WIDTH
+
+    def __init__(self, master_layout_pixels, style_table, timer=None, workbook=None, title=None, named_styles=None):
+        super().__init__(master_layout_pixels, style_table, timer, workbook, title, named_styles)
+        self._pending_blank_rows = 0
+        self._batch = []
+
+    def write_row(self, model_row):
+        worksheet = self.worksheet
+        row = []
+        rowspans = model_row.rowspans
+
+        for current_col_excel, excel_colspan, text, style_id in model_row.slots():
+            # Cells are appended by position; columns left of a covered block past the last cell stay empty.
+            row.extend([None] * (current_col_excel - 1 - len(row)))
+            if style_id is None:
+                self.extend_merge(self.current_row, current_col_excel)
+                row.extend(self.covered_cells(excel_colspan))
+                continue
+
+            target_cell = WriteOnlyCell(worksheet, value=text)
+            target_cell._style = copy(self.styles.style_array(style_id))
+            row.append(target_cell)
+            self.measure(self.current_row, current_col_excel, excel_colspan, text, style_id)
+
+            rowspan = rowspans.get(current_col_excel, 1) if rowspans else 1
+            if rowspan > 1:
+                self.open_merge(self.current_row, current_col_excel, excel_colspan)
+            elif excel_colspan > 1:
+                self.add_merge(current_col_excel, self.current_row, current_col_excel + excel_colspan - 1, self.current_row)
+            if excel_colspan > 1:
+                row.extend(self.covered_cells(excel_colspan - 1))
+
+        if not row:
+            self.end_table()
+            return
+        # Blank rows are only emitted once a later row has content, matching the sheet extent of SheetWriter.
+        self._batch.extend([] for _ in range(self._pending_blank_rows))
+        self._pending_blank_rows = 0
+        self._batch.append(row)
+        self.current_row += 1
+        if len(self._batch) >= ROW_BATCH_SIZE:
+            self._flush()
+
+    def covered_cells(self, count):
+        """count border-only cells for a block a merge covers, sharing one resolved style (see cover())."""
+        style = self.styles.border_style_array()
+        cells = []
+        for _ in range(count):
+            covered_cell = WriteOnlyCell(self.worksheet)
+            covered_cell._style = copy(style)
+            cells.append(covered_cell)
+        return cells
+
+    def add_merge(self, min_col, min_row, max_col, max_row):
+        self.worksheet.merged_cells.ranges.add(CellRange(min_col=min_col, min_row=min_row, max_col=max_col, max_row=max_row))
+        self.merges += 1
+
+    def _flush(self):
+        if not self._batch:
+            return
+        worksheet = self.worksheet
+        row_dimensions = worksheet.row_dimensions
+        first_row = self.current_row - self._pending_blank_rows - len(self._batch)
+        with self.timer.stage('autofit'):
+            heights = self.sizer.row_heights(first_row, first_row + len(self._batch) - 1)
+        for row_index, (row, height) in enumerate(zip(self._batch, heights.tolist()), start=first_row):
+            row_dimensions[row_index].height = height
+            # openpyxl tries every cell of an appended row as a value before taking it as a cell, about 2 us
+            # each; that, not the batching, is what keeps write_only a little slower than the default engine.
+            worksheet.append(row)
+            # The row has been flushed with its height, so its dimension record is no longer needed.
+            del row_dimensions[row_index]
+        self._batch.clear()
+        self.sizer.clear()
+
+    def end_table(self):
+        self.close_merges()
+        self._pending_blank_rows += 1
+        self.current_row += 1
+
+    def finish(self):
+        self.close_merges()
+        self._flush()
+
+
+class CsvWriter:
+    """Plain-text engine: one CSV record per row, on the same column grid as the sheet writers.
+
+    Columns covered by a merge, across or down, are left empty and styles are dropped. Records are written to a spooled
+    temporary file as rows arrive, so large outputs spill to disk rather than memory, and save() copies
+    them to output_file as UTF-8.
+    """
+
+    def __init__(self, master_layout_pixels, style_table, timer=None):
+        self.style_table = style_table
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_BYTES, mode='w+', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.buffer)
+        self._pending_blank_rows = 0
+
+    def write_row(self, row):
+        if not row and not row.covered:
+            self.end_table()
+            return
+        # Like the write-only engine, separator rows only appear once a later row has content.
+        self.writer.writerows([] for _ in range(self._pending_blank_rows))
+        self._pending_blank_rows = 0
+        record = []
+        for column, excel_colspan, text, style_id in row.slots():
+            record.extend([''] * (column - 1 - len(record)))
+            record.append(text if style_id is not None else '')
+            record.extend([''] * (excel_colspan - 1))
+        self.writer.writerow(record)
+
+    def end_table(self):
+        self._pending_blank_rows += 1
+
+    def stats(self):
+        return {'styles': self.style_table.stats(), 'merges': 0}
+
+    def save(self, output_file):
+        self.buffer.seek(0)
+        if isinstance(output_file, (str, os.PathLike)):
+            with open(output_file, 'w', encoding='utf-8', newline='') as f:
+                shutil.copyfileobj(self.buffer, f, COPY_CHUNK_SIZE)
+        else:
+            for chunk in iter(lambda: self.buffer.read(COPY_CHUNK_SIZE), ''):
+                output_file.write(chunk.encode('utf-8'))
+        self.buffer.close()
+
+
+def convert_to_excel(html_content, output_file, parser=None, streaming=False, engine=None, progress=None, sheets=None):
+    """Convert an HTML document to an .xlsx (or, with the csv engine, .csv) written to output_file.
+
+    output_file is a path or binary stream. parser selects the HTML parser backend (see
+    parsers.PARSER_BACKENDS); None uses the configured default. The document is first read into the
+    compact model (model.Document) and then emitted by the engine (see OUTPUT_ENGINES).
+    With streaming=True, html_content may also be a seekable text or binary file object; it is read in
+    chunks and each row is laid out and written as it is parsed instead of after a full DOM has been
+    built. Streaming defaults to the write-only engine so that neither side holds the whole document.
+    progress is an optional callback taking the number of rows written so far (see write_document).
+    sheets picks how tables are spread over sheets (see SHEET_MODES); None uses the configured default.
+    The sheets of the 'table' and 'layout' modes, and the tables of a single-sheet document of
+    PARALLEL_MIN_BYTES or more, are parsed and laid out in worker processes (see _convert_parallel).
+
+    Returns conversion stats, e.g. {'styles': {'lookups': ..., 'hit_rate': ...}, 'tables': ..., 'rows': ...,
+    'cells': ..., 'merges': ..., 'sheets': ..., 'input_bytes': ..., 'output_bytes': ..., 'timings': {'parse': ...}},
+    where timings holds the seconds spent in each of metrics.STAGES. With the layout cache on (see
+    layoutcache), 'layouts' counts the tables laid out from it ('hits') and without ('misses'). The
+    pandas fallbacks only report the byte counts and timings.
+    """
+    timer = StageTimer()
+    output_start = _output_position(output_file)
+    stats = {'input_bytes': _input_size(html_content)}
+    sheets = resolve_sheet_mode(sheets) or DEFAULT_SHEET_MODE
+    if streaming:
+        engine = engine or 'write_only'
+    multi_sheet = sheets != 'single' and (engine or DEFAULT_ENGINE) != 'csv'
+    converted = None
+    if multi_sheet or (parse_workers() > 1 and (stats['input_bytes'] or 0) >= DEFAULT_PARALLEL_MIN_BYTES):
+        converted = _convert_parallel(html_content, output_file, sheets if multi_sheet else 'single', parser,
+                                      streaming, engine, progress, timer)
+    if converted is None and streaming:
+        converted = _convert_streaming(html_content, output_file, engine, progress, timer)
+    elif converted is None:
+        converted = _convert_dom(_source_text(html_content), output_file, parser, engine, progress, timer)
+    stats.update(converted)
+    timer.switch(None)
+    stats['output_bytes'] = _output_size(output_file, output_start)
+    stats['timings'] = timer.timings()
+    return stats
+
+
+def _convert_dom(html_content, output_file, parser, engine, progress, timer):
+    with timer.stage('parse'):
+        soup = parse_html(html_content, parser)
+        tables = top_level_tables(soup)
+
+    if not tables:
+        with timer.stage('write'):
+            text = soup.get_text(separator='\n', strip=True)
+            df = pd.DataFrame([line for line in text.split('\n') if line], columns=['Content'])
+            _write_frame(df, output_file, engine)
+        return {}
+
+    with timer.stage('layout'):
+        document = dom_document(tables)
+
+    if not document.master_layout_pixels:
+        logger.error("Could not determine a master layout from <colgroup> tags.")
+        with timer.stage('write'):
+            _write_frame(pd.read_html(io.StringIO(html_content))[0], output_file, engine)
+        return {}
+
+    # The model holds everything the engines need, so the DOM can go before the workbook is built.
+    del soup, tables
+    stats = write_document(document, output_file, engine, progress, timer)
+    if document.layouts is not None:
+        stats['layouts'] = document.layouts
+    return stats
+
+
+def _input_size(source):
+    """Bytes of HTML given as text (UTF-8) or bytes, or left in a seekable stream."""
+    if isinstance(source, str):
+        # isascii() is a flag check, so ASCII documents are never encoded just to be measured.
+        return len(source) if source.isascii() else len(source.encode('utf-8'))
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    try:
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END) - position
+        source.seek(position)
+    except (AttributeError, OSError):
+        return None
+    return size
+
+
+def _output_position(output_file):
+    if isinstance(output_file, (str, os.PathLike)):
+        return 0
+    try:
+        return output_file.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+def _output_size(output_file, start):
+    """Bytes written to output_file (a path or a stream that was at start), or None if unknown."""
+    if start is None:
+        return None
+    if isinstance(output_file, (str, os.PathLike)):
+        return os.path.getsize(output_file)
+    try:
+        return output_file.tell() - start
+    except (AttributeError, OSError):
+        return None
+
+
+def _write_frame(df, output_file, engine):
+    if (engine or DEFAULT_ENGINE) == 'csv':
+        df.to_csv(output_file, index=False)
+    else:
+        df.to_excel(output_file, index=False)
+
+
+def _convert_streaming(source, output_file, engine, progress, timer):
+    start = source.tell() if hasattr(source, 'tell') else None
+
+    with timer.stage('layout'):
+        table_col_styles = scan_table_layouts(source)
+        master_layout_pixels = master_layout(table_col_styles)
+    if start is not None:
+        source.seek(start)
+
+    if not master_layout_pixels:
+        # Nothing to stream onto a column grid; the DOM path owns the text-only and pandas fallbacks.
+        logger.warning("No table layout found for streaming conversion, using the DOM converter instead.")
+        html_content = source if start is None else source.read()
+        if isinstance(html_content, (bytes, bytearray)):
+            html_content = html_content.decode('utf-8')
+        return _convert_dom(html_content, output_file, None, engine, progress, timer)
+
+    return write_document(streamed_document(source, table_col_styles), output_file, engine, progress, timer)
+
+
+def _convert_parallel(source, output_file, sheets, parser, streaming, engine, progress, timer):
+    """Build the model of a document in worker processes, cut at its top-level tables, and write it here.
+
+    The document is shared with the workers (parallel.SharedSource): mapped from its file, or copied
+    once into shared memory, so a task carries only byte ranges. Its top-level tables are found in the
+    raw bytes (parsers.split_tables). For a single sheet, runs of consecutive tables
+    (parallel.chunk_ranges) are laid out on the document's master layout and their Documents joined
+    back in document order (model.joined_document); otherwise tables are grouped into sheets
+    (model.sheet_layouts), each with a Document of its own. Documents are written as they come back,
+    while the workers go on with the next ones. openpyxl's styles and shared strings belong to the
+    whole workbook, so writing stays in this process. The workers are the process's parallel.parse_pool(),
+    shared by all its conversions.
+
+    Returns None, without having consumed source, when the document cannot be cut up: no table has a
+    layout, or a single sheet would have only one table.
+    """
+    with timer.stage('parse'):
+        shared = SharedSource.share(source)
+    try:
+        with timer.stage('parse'), shared.mapped() as buffer:
+            tables = split_tables(buffer)
+        workers = parse_workers()
+        with timer.stage('layout'):
+            if sheets == 'single':
+                master_layout_pixels = master_layout([table.col_styles for table in tables])
+                if len(tables) < 2 or not master_layout_pixels:
+                    return None
+                groups = [(master_layout_pixels, [chunk]) for chunk in chunk_ranges(tables, workers)]
+            else:
+                groups = [
+                    (pixels, [(tables[index].start, tables[index].end) for index in indexes])
+                    for pixels, indexes in sheet_layouts([table.col_styles for table in tables], sheets == 'layout')
+                ]
+                if not groups:
+                    return None
+        del tables
+
+        workers = min(workers, len(groups))
+        pool = parse_pool() if workers > 1 else None
+        try:
+            tasks = ((shared, ranges, pixels, parser, streaming) for pixels, ranges in groups)
+            # Waiting on a worker counts as parse, like reading the rows of a streamed document.
+            documents = timer.timed('parse', ordered_results(pool, build_document, tasks, workers * RESULTS_PER_WORKER))
+            layouts = {}
+            documents = _counting_layouts(documents, layouts)
+            if sheets == 'single':
+                stats = write_document(joined_document(master_layout_pixels, documents), output_file, engine,
+                                       progress, timer)
+            else:
+                title = 'Layout' if sheets == 'layout' else 'Table'
+                stats = write_sheets(((f'{title} {number}', document) for number, document in enumerate(documents, 1)),
+                                     output_file, engine, progress, timer)
+            if layouts:
+                stats['layouts'] = layouts
+            return stats
+        except BrokenProcessPool:
+            forget_parse_pool(pool)
+            raise
+    finally:
+        shared.close()
+
+
+def _counting_layouts(documents, layouts):
+    """Pass documents through, adding up their layout cache counts (model.Document.layouts) in layouts."""
+    for document in documents:
+        for outcome, count in (document.layouts or {}).items():
+            layouts[outcome] = layouts.get(outcome, 0) + count
+        yield document
+
+
+def _source_text(source):
+    """HTML given as text, bytes or a binary stream, as the text the DOM parsers take."""
+    if not isinstance(source, (str, bytes, bytearray)):
+        source = source.read()
+    return source if isinstance(source, str) else source.decode('utf-8')
\ No newline at end of file
@@ -0,0 +1,253 @@
+import io
+import os
+import mmap
+import shutil
+import struct
+import logging
+import tempfile
+import threading
+from functools import partial
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import converter
+from profiling import run_profiled
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get('CONVERSION_WORKERS', os.cpu_count() or 1))
+# openpyxl and BeautifulSoup leave the heap fragmented, so workers are replaced after this many conversions.
+DEFAULT_MAX_TASKS_PER_CHILD = int(os.environ.get('CONVERSION_MAX_TASKS_PER_CHILD', 20))
+# Conversions allowed to wait for a free worker; beyond that new ones are turned away.
+DEFAULT_QUEUE_DEPTH = int(os.environ.get('CONVERSION_QUEUE_DEPTH', DEFAULT_WORKERS))
+DEFAULT_RETRY_AFTER = int(os.environ.get('CONVERSION_RETRY_AFTER', 5))
+DEFAULT_INLINE_MAX_BYTES = 8 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# HTML or a result handed between processes as a temp file path instead of through the pipe.
+FileSource = namedtuple('FileSource', ['path'])
+
+
+class PoolBusy(RuntimeError):
+    """Every worker is busy and the queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'All conversion workers are busy; retry in {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+class ProgressCounter:
+    """A row count that a worker process updates and the process that created it reads.
+
+    The count lives in an 8-byte memory-mapped temp file, so updating it is a store into shared
+    memory and reading it never waits on the worker. An instance pickles as its file path, so the
+    copy a worker receives maps the same file; only the creating instance removes it on close().
+    Instances are callable, so they serve directly as a converter progress callback.
+    """
+
+    _FORMAT = '<Q'
+
+    def __init__(self, path=None):
+        self._owner = path is None
+        if path is None:
+            with tempfile.NamedTemporaryFile(prefix='progress-', delete=False) as counter_file:
+                counter_file.write(bytes(struct.calcsize(self._FORMAT)))
+            path = counter_file.name
+        self.path = path
+        with open(path, 'r+b') as counter_file:
+            self._map = mmap.mmap(counter_file.fileno(), struct.calcsize(self._FORMAT))
+
+    def __reduce__(self):
+        return ProgressCounter, (self.path,)
+
+    def __call__(self, value):
+        struct.pack_into(self._FORMAT, self._map, 0, value)
+
+    @property
+    def value(self):
+        return struct.unpack_from(self._FORMAT, self._map)[0]
+
+    def close(self):
+        self._map.close()
+        if self._owner:
+            os.remove(self.path)
+
+
+def run_conversion(source, output_file, parser, streaming, engine, progress=None, sheets=None):
+    """Convert HTML given as text, bytes or a seekable binary stream with fully resolved options.
+
+    The source is handed on as it is: streaming conversions read it in chunks, large ones map the
+    file it is in (see converter._convert_parallel) and the DOM path reads it whole.
+    sheets is the converter's sheet mode (None: its default).
+    """
+    return converter.convert_to_excel(source, output_file, parser=None if streaming else parser, streaming=streaming,
+                                      engine=engine, progress=progress, sheets=sheets)
+
+
+def profiled_conversion(profile_dir, source, output_file, parser, streaming, engine, progress=None, sheets=None):
+    """run_conversion under the profiler (see profiling.run_profiled), with its report in stats['profile']."""
+    stats, report = run_profiled(profile_dir, run_conversion, source, output_file, parser, streaming, engine, progress,
+                                 sheets)
+    stats['profile'] = report
+    return stats
+
+
+def convert_job(source, parser, streaming, engine, progress=None, profile_dir=None, sheets=None):
+    """Worker side of ConversionPool.convert: return (result, stats).
+
+    HTML that came in a temp file is converted into another one, whose FileSource is the result;
+    smaller documents arrive as bytes and return their output as bytes. With profile_dir, the
+    conversion is profiled and its profile saved there.
+    """
+    convert = partial(profiled_conversion, profile_dir) if profile_dir else run_conversion
+    try:
+        if not isinstance(source, FileSource):
+            output = io.BytesIO()
+            stats = convert(source, output, parser, streaming, engine, progress, sheets)
+            return output.getvalue(), stats
+        with open(source.path, 'rb') as html_file, \
+                tempfile.NamedTemporaryFile(prefix='conversion-', delete=False) as output:
+            try:
+                stats = convert(html_file, output, parser, streaming, engine, progress, sheets)
+            except BaseException:
+                output.close()
+                os.remove(output.name)
+                raise
+        return FileSource(output.name), stats
+    finally:
+        if progress is not None:
+            progress.close()
+
+
+def write_result(result, output_file):
+    """Write a worker's result (bytes or a FileSource, which is removed) to output_file."""
+    if not isinstance(result, FileSource):
+        output_file.write(result)
+        return
+    try:
+        with open(result.path, 'rb') as output:
+            shutil.copyfileobj(output, output_file, COPY_CHUNK_SIZE)
+    finally:
+        os.remove(result.path)
+
+
+class ConversionPool:
+    """Runs conversions in a bounded pool of worker processes, off the request threads and their GIL.
+
+    At most workers conversions run at once and queue_depth more wait; any beyond that raise PoolBusy
+    straight away instead of queueing without bound. Each worker is replaced after
+    max_tasks_per_child conversions. Documents and results up to inline_max_bytes travel through the
+    pool's pipe; larger ones through temp files, so a streamed document is never read into memory.
+    A pool broken by a dying worker (e.g. killed for running out of memory) is replaced on next use.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_tasks_per_child=DEFAULT_MAX_TASKS_PER_CHILD,
+                 queue_depth=DEFAULT_QUEUE_DEPTH, retry_after=DEFAULT_RETRY_AFTER,
+                 inline_max_bytes=DEFAULT_INLINE_MAX_BYTES):
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+        self.inline_max_bytes = inline_max_bytes
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, max_tasks_per_child=self.max_tasks_per_child or None)
+            return self._executor
+
+    def _forget(self, executor):
+        """Stop handing work to a broken executor; the next submit starts a fresh one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def _stage(self, source):
+        """What to send a worker for source: text or bytes, or a FileSource for a large stream."""
+        if isinstance(source, (str, bytes, bytearray)):
+            return source
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END) - position
+        source.seek(position)
+        if size <= self.inline_max_bytes:
+            return source.read()
+        with tempfile.NamedTemporaryFile(prefix='conversion-', delete=False) as staged:
+            shutil.copyfileobj(source, staged, COPY_CHUNK_SIZE)
+        return FileSource(staged.name)
+
+    def submit(self, source, parser, streaming, engine, progress=None, wait=False, profile_dir=None, sheets=None):
+        """Start converting source in a worker and return a Future of (result, stats).
+
+        result is the output as bytes, or a FileSource of a temp file the caller owns when source was
+        staged to one. progress must be a ProgressCounter (or None) to cross into the worker. With
+        wait=True the call waits for a free slot instead of raising PoolBusy, for callers that are
+        queues themselves. With profile_dir the worker profiles the conversion (see
+        profiled_conversion). sheets is the converter's sheet mode; the worker builds the sheets of a
+        multi-sheet conversion itself (see parallel.parse_workers). The slot is freed when the future finishes.
+        """
+        if not self._slots.acquire(blocking=wait):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy(self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+        staged = None
+        try:
+            staged = self._stage(source)
+            executor = self._pool()
+            future = executor.submit(convert_job, staged, parser, streaming, engine, progress, profile_dir, sheets)
+        except BaseException:
+            self._finished(staged, failed=True)
+            raise
+        future.add_done_callback(partial(self._done, executor, staged))
+        return future
+
+    def _done(self, executor, staged, future):
+        exception = None if future.cancelled() else future.exception()
+        if isinstance(exception, BrokenProcessPool):
+            self._forget(executor)
+        self._finished(staged, failed=future.cancelled() or exception is not None)
+
+    def _finished(self, staged, failed):
+        if isinstance(staged, FileSource):
+            os.remove(staged.path)
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+        self._slots.release()
+
+    def convert(self, source, output_file, parser, streaming, engine, progress=None, wait=False, profile_dir=None,
+                sheets=None):
+        """Convert source into output_file (a binary stream) in a worker and return the stats."""
+        result, stats = self.submit(source, parser, streaming, engine, progress, wait, profile_dir, sheets).result()
+        write_result(result, output_file)
+        return stats
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_tasks_per_child': self.max_tasks_per_child,
+                'queue_depth': self.queue_depth,
+                'in_flight': self._in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
\ No newline at end of file
@@ -0,0 +1,290 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+from executor import ProgressCounter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_DIR = os.environ.get('JOB_DIR', os.path.join(tempfile.gettempdir(), 'html-excel-jobs'))
+DEFAULT_JOB_RUNNERS = int(os.environ.get('JOB_RUNNERS', 1))
+DEFAULT_JOB_TTL = int(os.environ.get('JOB_TTL', 60 * 60))  # seconds a finished job and its result are kept
+DEFAULT_MAX_QUEUED_JOBS = int(os.environ.get('JOB_MAX_QUEUED', 100))
+EXPIRY_INTERVAL = 30  # seconds between sweeps for expired jobs
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp is not None else None
+
+
+class QueueFull(RuntimeError):
+    """More jobs are waiting than the queue accepts."""
+
+
+class Job:
+    """One queued conversion: its options, where its input and result live, and how it went."""
+
+    __slots__ = ('id', 'status', 'options', 'filename', 'input_path', 'result_path', 'stats', 'error',
+                 'rows_processed', 'created', 'started', 'finished')
+
+    def __init__(self, job_id, options, filename, input_path, result_path):
+        self.id = job_id
+        self.status = QUEUED
+        self.options = options
+        self.filename = filename
+        self.input_path = input_path
+        self.result_path = result_path
+        self.stats = None
+        self.error = None
+        self.rows_processed = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'rows_processed': self.rows_processed,
+            'filename': self.filename,
+            'timings': {
+                'created': _isoformat(self.created),
+                'started': _isoformat(self.started),
+                'finished': _isoformat(self.finished),
+                'queued_seconds': round((self.started or now) - self.created, 3),
+                'run_seconds': round((self.finished or now) - self.started, 3) if self.started else None,
+            },
+            'stats': self.stats,
+            'error': self.error,
+        }
+
+
+class JobBroker(ABC):
+    """Where JobQueue keeps jobs and their order.
+
+    InProcessBroker keeps both in memory. A broker over a shared store (Redis, a database table)
+    implements the same methods to let jobs outlive the process or be run by other ones, given that
+    those see the same job directory.
+    """
+
+    @abstractmethod
+    def submit(self, job):
+        """Store a new job and queue it."""
+
+    @abstractmethod
+    def claim(self, timeout):
+        """The next queued job for a runner, or None if none arrives within timeout seconds."""
+
+    @abstractmethod
+    def get(self, job_id):
+        """The stored job with job_id, or None."""
+
+    @abstractmethod
+    def save(self, job):
+        """Store a job's updated state."""
+
+    @abstractmethod
+    def delete(self, job_id):
+        """Remove a stored job."""
+
+    @abstractmethod
+    def jobs(self):
+        """All stored jobs, in any order."""
+
+    @abstractmethod
+    def queued(self):
+        """How many jobs are waiting to be claimed."""
+
+
+class InProcessBroker(JobBroker):
+    def __init__(self):
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+        self._queue.put(job.id)
+
+    def claim(self, timeout):
+        try:
+            job_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def queued(self):
+        return self._queue.qsize()
+
+
+class JobQueue:
+    """Runs jobs from a JobBroker on background runner threads and expires them once they are old.
+
+    handler(job, progress) does the work: it converts job.input_path into job.result_path, calls
+    progress with the rows written so far and returns the conversion stats. progress is a
+    ProgressCounter, so handlers can hand it on to a worker process. A job's input is removed once it
+    has run; the job and its result are removed ttl seconds after it finished.
+    """
+
+    def __init__(self, broker, handler, directory=DEFAULT_JOB_DIR, runners=DEFAULT_JOB_RUNNERS,
+                 ttl=DEFAULT_JOB_TTL, max_queued=DEFAULT_MAX_QUEUED_JOBS):
+        self.broker = broker
+        self.handler = handler
+        self.directory = directory
+        self.runners = runners
+        self.ttl = ttl
+        self.max_queued = max_queued
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self._progress = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def create(self, options, filename):
+        """A new job whose input the caller writes to job.input_path before submit()."""
+        if self.broker.queued() >= self.max_queued:
+            raise QueueFull(f'{self.max_queued} conversion jobs are already waiting')
+        job_id = uuid.uuid4().hex
+        base = os.path.join(self.directory, job_id)
+        return Job(job_id, options, filename, base + '.html', base + '.out')
+
+    def submit(self, job):
+        self._start()
+        self.broker.submit(job)
+        with self._lock:
+            self.submitted += 1
+
+    def discard(self, job):
+        """Drop the files of a job that was never submitted."""
+        self._remove_files(job)
+
+    def get(self, job_id):
+        """The job with job_id, with live progress while it runs, or None if unknown or expired."""
+        job = self.broker.get(job_id)
+        if job is None:
+            return None
+        if self._expired(job, time.time()):
+            self._expire(job)
+            return None
+        with self._lock:
+            counter = self._progress.get(job_id)
+            if counter is not None:
+                job.rows_processed = counter.value
+        return job
+
+    def expires_at(self, job):
+        return _isoformat(job.finished + self.ttl) if job.finished is not None and self.ttl > 0 else None
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.runners):
+                thread = threading.Thread(target=self._run_forever, name=f'job-runner-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run_forever(self):
+        while True:
+            job = self.broker.claim(EXPIRY_INTERVAL)
+            if job is not None:
+                self._run(job)
+            self.expire()
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.started = time.time()
+        counter = ProgressCounter()
+        with self._lock:
+            self._progress[job.id] = counter
+        self.broker.save(job)
+        try:
+            job.stats = self.handler(job, counter)
+            job.status = DONE
+        except Exception as e:
+            logger.error(f"Conversion job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+            self._remove(job.result_path)
+        with self._lock:
+            job.rows_processed = counter.value
+            counter.close()
+            del self._progress[job.id]
+            if job.status == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+        job.finished = time.time()
+        self._remove(job.input_path)
+        self.broker.save(job)
+
+    def _expired(self, job, now):
+        return self.ttl > 0 and job.finished is not None and now - job.finished > self.ttl
+
+    def expire(self):
+        """Remove every job, with its files, that finished more than ttl seconds ago."""
+        now = time.time()
+        for job in self.broker.jobs():
+            if self._expired(job, now):
+                self._expire(job)
+
+    def _expire(self, job):
+        self.broker.delete(job.id)
+        self._remove_files(job)
+        with self._lock:
+            self.expired += 1
+
+    def _remove_files(self, job):
+        self._remove(job.input_path)
+        self._remove(job.result_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        statuses = [job.status for job in self.broker.jobs()]
+        with self._lock:
+            return {
+                'queued': statuses.count(QUEUED),
+                'running': statuses.count(RUNNING),
+                'done': statuses.count(DONE),
+                'failed': statuses.count(FAILED),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failures': self.failed,
+                'expired': self.expired,
+            }
\ No newline at end of file
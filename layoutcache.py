@@ -0,0 +1,247 @@
+import os
+import json
+import logging
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+from styles import StyleKey
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever rows are laid out or styles resolved differently, so stored layouts stop matching.
+LAYOUT_CACHE_VERSION = 3
+# Table layouts kept in each process; 0 turns the cache off. A hit reads only the texts and raw markup of
+# the cells and skips resolving and laying them out.
+DEFAULT_LAYOUT_CACHE_SIZE = int(os.environ.get('LAYOUT_CACHE_SIZE', 1024))
+# Where table layouts are also stored, for every process converting on this machine; unset: in process only.
+DEFAULT_LAYOUT_CACHE_DIR = os.environ.get('LAYOUT_CACHE_DIR') or None
+DEFAULT_LAYOUT_CACHE_MAX_FILES = int(os.environ.get('LAYOUT_CACHE_MAX_FILES', 10_000))
+PRUNE_INTERVAL = 100  # layouts stored between sweeps of the directory for the oldest ones
+
+_SUFFIX = '.json'
+
+
+class TableSkeleton:
+    """A table's rows as model.dom_cell_markup reads them: their texts and, apart, their skeleton.
+
+    The skeleton is, row by row, the markup of the cells as it is in the document: tag names, style
+    attributes, bgcolor, spans and markup flags. Rows shaped the same are kept once, in shapes, and
+    order gives each row's; tables with the same skeleton and layouts are laid out alike.
+    """
+
+    __slots__ = ('texts', 'shapes', 'order')
+
+    def __init__(self, rows):
+        self.texts = []
+        self.shapes = {}
+        self.order = array('I')
+        for texts, markup in rows:
+            self.texts.append(texts)
+            self.order.append(self.shapes.setdefault(markup, len(self.shapes)))
+
+    def fingerprint(self, local_layout_pixels, master_layout_pixels):
+        """Hex digest of the skeleton on a table layout and master layout; cells are hashed once each."""
+        cell_shapes = {}
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(array('I', [len(self.shapes), len(self.order)]))
+        for shape in self.shapes:
+            digest.update(array('I', [len(shape)] + [cell_shapes.setdefault(cell, len(cell_shapes)) for cell in shape]))
+        digest.update(self.order)
+        digest.update(repr((LAYOUT_CACHE_VERSION, local_layout_pixels, master_layout_pixels,
+                            list(cell_shapes))).encode('utf-8'))
+        return digest.hexdigest()
+
+    def rows(self):
+        """The (texts, markup) of each row again."""
+        shapes = list(self.shapes)
+        for texts, shape in zip(self.texts, self.order):
+            yield texts, shapes[shape]
+
+
+class TableLayout:
+    """The laid-out rows of one table without their text, as model.build_row leaves them.
+
+    keys are the StyleKeys its cells use, in first-seen order. A row shape is a row's start columns,
+    Excel colspans, looks (indexes into keys), rowspans and covered blocks, which are also what the
+    sheet writers make the table's merges of; row_shapes indexes the shape of every row, so rows laid
+    out alike are kept once.
+    """
+
+    __slots__ = ('keys', 'shapes', 'row_shapes')
+
+    def __init__(self, keys, shapes, row_shapes):
+        self.keys = keys
+        self.shapes = shapes
+        self.row_shapes = row_shapes
+
+    @classmethod
+    def from_rows(cls, rows, style_table):
+        """The layout of model.Rows whose style ids are those of style_table."""
+        key_indexes = {}
+        shape_indexes = {}
+        row_shapes = array('I')
+        for row in rows:
+            shape = (
+                tuple(row.columns),
+                tuple(row.spans),
+                tuple(key_indexes.setdefault(style_id, len(key_indexes)) for style_id in row.style_ids),
+                tuple(sorted(row.rowspans.items())) if row.rowspans else None,
+                tuple(row.covered) if row.covered else None,
+            )
+            row_shapes.append(shape_indexes.setdefault(shape, len(shape_indexes)))
+        return cls([style_table[style_id] for style_id in key_indexes], list(shape_indexes), row_shapes)
+
+    def to_json(self):
+        return {
+            'version': LAYOUT_CACHE_VERSION,
+            'keys': [list(key) for key in self.keys],
+            'shapes': self.shapes,
+            'row_shapes': self.row_shapes.tolist(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data['version'] != LAYOUT_CACHE_VERSION:
+            raise ValueError(f"layout version {data['version']}")
+        shapes = [
+            (tuple(columns), tuple(spans), tuple(key_ids),
+             tuple(map(tuple, rowspans)) if rowspans else None, tuple(map(tuple, covered)) if covered else None)
+            for columns, spans, key_ids, rowspans, covered in data['shapes']
+        ]
+        return cls([StyleKey(*key) for key in data['keys']], shapes, array('I', data['row_shapes']))
+
+
+class LayoutCache:
+    """TableLayouts by TableSkeleton fingerprint: the max_entries most recently used in process and, given a
+    directory, every one also on disk as JSON, where later conversions in other processes find it.
+
+    Stored layouts beyond max_files are pruned oldest first. A layout that cannot be read or stored
+    is treated as missing: the cache never fails a conversion.
+    """
+
+    def __init__(self, max_entries=DEFAULT_LAYOUT_CACHE_SIZE, directory=DEFAULT_LAYOUT_CACHE_DIR,
+                 max_files=DEFAULT_LAYOUT_CACHE_MAX_FILES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_files = max_files
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stored = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or bool(self.directory)
+
+    def _path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint + _SUFFIX)
+
+    def get(self, fingerprint):
+        with self._lock:
+            layout = self._entries.get(fingerprint)
+            if layout is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return layout
+        layout = self._load(fingerprint) if self.directory else None
+        with self._lock:
+            if layout is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(fingerprint, layout)
+        return layout
+
+    def put(self, fingerprint, layout):
+        with self._lock:
+            self._remember(fingerprint, layout)
+        if self.directory:
+            self._store(fingerprint, layout)
+
+    def _remember(self, fingerprint, layout):
+        if self.max_entries <= 0:
+            return
+        self._entries[fingerprint] = layout
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, fingerprint):
+        try:
+            with open(self._path(fingerprint), encoding='utf-8') as layout_file:
+                return TableLayout.from_json(json.load(layout_file))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable table layout {fingerprint}: {e}")
+            return None
+
+    def _store(self, fingerprint, layout):
+        path = self._path(fingerprint)
+        part = f'{path}.{os.getpid()}.part'
+        try:
+            with open(part, 'w', encoding='utf-8') as layout_file:
+                json.dump(layout.to_json(), layout_file, separators=(',', ':'))
+            os.replace(part, path)
+        except OSError as e:
+            logger.warning(f"Could not store table layout {fingerprint}: {e}")
+            return
+        with self._lock:
+            self.stored += 1
+            prune = not self.stored % PRUNE_INTERVAL
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Remove all but the max_files newest stored layouts."""
+        layouts = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_SUFFIX):
+                try:
+                    layouts.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        layouts.sort(reverse=True)
+        for _, path in layouts[self.max_files:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_layout_cache = None
+
+
+def layout_cache():
+    """The LayoutCache of this process, made on first use from the LAYOUT_CACHE_* settings."""
+    global _layout_cache
+    if _layout_cache is None:
+        _layout_cache = LayoutCache()
+    return _layout_cache
+
+
+def _after_fork_in_child():
+    # A worker forked while another thread held the lock would otherwise never get it.
+    if _layout_cache is not None:
+        _layout_cache._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,181 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# The stages convert_to_excel times, in pipeline order. On the streaming path rows are read and laid
+# out as they are written, so there 'parse' also covers laying out each row and 'layout' is the scan
+# for <col> widths.
+STAGES = ('parse', 'layout', 'write', 'autofit', 'save')
+# Per-conversion counts that go into the stats and are observed as histograms.
+COUNTERS = ('tables', 'rows', 'cells', 'merges', 'styles', 'input_bytes', 'output_bytes')
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+BYTES_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3)
+
+METRIC_PREFIX = 'html_excel_'
+
+
+class StageTimer:
+    """Wall-clock seconds spent in each stage of one conversion, as exclusive times.
+
+    One stage is current at a time: entering a stage pauses the one around it, so nested stages (an
+    autofit pass inside save) are not counted twice and the stages add up to the total. switch() is a
+    clock read and a dict update, cheap enough to call per row.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.current = None
+        self._since = time.perf_counter()
+
+    def switch(self, stage):
+        """Make stage (or None for none) the current stage and return the previous one."""
+        now = time.perf_counter()
+        previous = self.current
+        if previous is not None:
+            self.seconds[previous] = self.seconds.get(previous, 0.0) + now - self._since
+        self._since = now
+        self.current = stage
+        return previous
+
+    @contextmanager
+    def stage(self, stage):
+        previous = self.switch(stage)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def timed(self, stage, iterable):
+        """Iterate over iterable, counting the time spent producing each item towards stage."""
+        iterator = iter(iterable)
+        while True:
+            previous = self.switch(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.switch(previous)
+            yield item
+
+    def timings(self):
+        """{stage: seconds} rounded to microseconds, in STAGES order."""
+        order = {stage: index for index, stage in enumerate(STAGES)}
+        return {
+            stage: round(seconds, 6)
+            for stage, seconds in sorted(self.seconds.items(), key=lambda item: order.get(item[0], len(order)))
+        }
+
+
+def conversion_counts(stats):
+    """The COUNTERS found in a conversion's stats; styles is its number of distinct cell styles."""
+    counts = {counter: stats.get(counter) for counter in COUNTERS}
+    counts['styles'] = (stats.get('styles') or {}).get('distinct')
+    return {counter: value for counter, value in counts.items() if value is not None}
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """A Prometheus histogram with fixed buckets, optionally split by label values."""
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._series = {}
+
+    def observe(self, value, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labelvalues, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _labels(self.labelnames + ('le',), labelvalues + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_number(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class ConversionMetrics:
+    """Histograms of the stage timings and counts of every conversion a process has run, for /metrics.
+
+    observe() takes the stats convert_to_excel returns. Each process keeps its own metrics: behind a
+    server with several worker processes, every scrape sees the one that answered it.
+    """
+
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.prefix = prefix
+        self.stage_seconds = Histogram(
+            prefix + 'stage_duration_seconds', 'Seconds spent in each conversion stage.', SECONDS_BUCKETS, ('stage',))
+        self.conversion_seconds = Histogram(
+            prefix + 'conversion_duration_seconds', 'Seconds spent converting a document.', SECONDS_BUCKETS)
+        self.counts = {
+            counter: Histogram(
+                prefix + 'conversion_' + counter,
+                f"{counter.replace('_', ' ').capitalize()} per converted document.",
+                BYTES_BUCKETS if counter.endswith('_bytes') else COUNT_BUCKETS,
+            )
+            for counter in COUNTERS
+        }
+        self.conversions = {'ok': 0, 'error': 0}
+        self._lock = threading.Lock()
+
+    def observe(self, stats):
+        timings = stats.get('timings') or {}
+        with self._lock:
+            self.conversions['ok'] += 1
+            for stage, seconds in timings.items():
+                self.stage_seconds.observe(seconds, stage)
+            if timings:
+                self.conversion_seconds.observe(sum(timings.values()))
+            for counter, value in conversion_counts(stats).items():
+                self.counts[counter].observe(value)
+
+    def failed(self):
+        with self._lock:
+            self.conversions['error'] += 1
+
+    def render(self, gauges=None):
+        """The metrics in the Prometheus text format; gauges is {name: stats dict} of numbers to add."""
+        name = self.prefix + 'conversions_total'
+        lines = [f'# HELP {name} Conversions run, by outcome.', f'# TYPE {name} counter']
+        with self._lock:
+            lines.extend(f'{name}{_labels(("outcome",), (outcome,))} {count}' for outcome, count in self.conversions.items())
+            lines.extend(self.stage_seconds.render())
+            lines.extend(self.conversion_seconds.render())
+            for histogram in self.counts.values():
+                lines.extend(histogram.render())
+        for group, values in (gauges or {}).items():
+            for key, value in (values or {}).items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f'{self.prefix}{group}_{key}'
+                lines.extend((f'# TYPE {name} gauge', f'{name} {_number(value)}'))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,488 @@
+import re
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+
+from styles import StyleTable
+from layoutcache import TableLayout, TableSkeleton, layout_cache
+from parsers import (CellData, cell_style, colspan_value, iter_table_events, parse_html, rowspan_value,
+                     scan_table_layouts)
+
+# A cell covers master columns until they add up to this share of its own declared width.
+SPAN_COVERAGE = 0.9
+COLUMN_PLAN_CACHE_SIZE = 256
+ROW_GROUPS = ('thead', 'tbody', 'tfoot')
+
+_END_OF_TABLE = ('end_table', None)
+
+
+def layout_pixels(col_styles):
+    """Pixel widths declared by a table's <col style="width: ..."> tags."""
+    widths = []
+    for style in col_styles:
+        match = re.search(r'width:\s*(\d+)', style)
+        if match:
+            widths.append(int(match.group(1)))
+    return widths
+
+
+def master_layout(table_col_styles):
+    """The layout of the table with the most <col> tags, which every table is mapped onto."""
+    master_layout_pixels = []
+    max_cols = 0
+    for col_styles in table_col_styles:
+        if len(col_styles) > max_cols:
+            max_cols = len(col_styles)
+            master_layout_pixels = layout_pixels(col_styles)
+    return master_layout_pixels
+
+
+class ColumnPlan:
+    """How the cells of one table layout map onto the master column grid.
+
+    Cumulative pixel offsets of the table's own <col> widths and of the master layout are computed once,
+    so a cell's declared width is a difference of two offsets and its Excel colspan a bisect over the
+    master offsets. Spans are remembered per (cell index, colspan, start column), which makes every
+    row shaped like an earlier one (the usual case) a dict lookup per cell.
+    """
+
+    __slots__ = ('local_offsets', 'master_offsets', '_spans')
+
+    def __init__(self, local_layout_pixels, master_layout_pixels):
+        self.local_offsets = list(accumulate(local_layout_pixels, initial=0))
+        self.master_offsets = list(accumulate(master_layout_pixels, initial=0))
+        self._spans = {}
+
+    def target_width(self, cell_idx, html_colspan):
+        """Pixels the table's own layout declares for a cell: its columns that the layout covers."""
+        local_offsets = self.local_offsets
+        last = len(local_offsets) - 1
+        if cell_idx >= last:
+            return 0
+        return local_offsets[min(cell_idx + html_colspan, last)] - local_offsets[cell_idx]
+
+    def excel_colspan(self, cell_idx, html_colspan, column):
+        key = (cell_idx, html_colspan, column)
+        excel_colspan = self._spans.get(key)
+        if excel_colspan is None:
+            excel_colspan = self._spans[key] = self._excel_colspan(cell_idx, html_colspan, column)
+        return excel_colspan
+
+    def _excel_colspan(self, cell_idx, html_colspan, column):
+        """Fewest master columns from column on that cover SPAN_COVERAGE of the cell's declared width."""
+        target_pixel_width = self.target_width(cell_idx, html_colspan)
+        master_offsets = self.master_offsets
+        start = column - 1
+        last = len(master_offsets) - 1
+        if target_pixel_width <= 0 or start >= last:
+            return 1
+        start_offset = master_offsets[start]
+        end = bisect_left(master_offsets, target_pixel_width * SPAN_COVERAGE, start + 1, last + 1,
+                          key=lambda offset: offset - start_offset)
+        return min(end, last) - start
+
+
+@lru_cache(maxsize=COLUMN_PLAN_CACHE_SIZE)
+def column_plan(local_layout_pixels, master_layout_pixels):
+    """Shared ColumnPlan for a (local, master) layout pair, given as tuples; identical tables reuse one."""
+    return ColumnPlan(local_layout_pixels, master_layout_pixels)
+
+
+class Row:
+    """One laid-out row: per cell its start column, Excel colspan and style id, in parallel arrays.
+
+    rowspans maps the start column of each cell that spans more than one row to its rowspan, and
+    covered lists the (column, excel_colspan) blocks that cells of rows above reach into; both are
+    None when there are none, which is the usual case.
+    """
+
+    __slots__ = ('columns', 'spans', 'style_ids', 'texts', 'rowspans', 'covered')
+
+    def __init__(self):
+        self.columns = array('I')
+        self.spans = array('I')
+        self.style_ids = array('I')
+        self.texts = []
+        self.rowspans = None
+        self.covered = None
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        """Yield (column, excel_colspan, text, style_id) for each cell."""
+        return zip(self.columns, self.spans, self.texts, self.style_ids)
+
+    def append(self, column, excel_colspan, text, style_id, rowspan=1):
+        self.columns.append(column)
+        self.spans.append(excel_colspan)
+        self.texts.append(text)
+        self.style_ids.append(style_id)
+        if rowspan > 1:
+            if self.rowspans is None:
+                self.rowspans = {}
+            self.rowspans[column] = rowspan
+
+    def slots(self):
+        """Like iterating the row, but with a (column, excel_colspan, None, None) for each covered block,
+        all in column order."""
+        covered = self.covered
+        if not covered:
+            yield from self
+            return
+        index = 0
+        for cell in self:
+            while index < len(covered) and covered[index][0] < cell[0]:
+                yield covered[index] + (None, None)
+                index += 1
+            yield cell
+        for block in covered[index:]:
+            yield block + (None, None)
+
+    def last_column(self):
+        """The rightmost column the row's cells or covered blocks reach; 0 for an empty row."""
+        last = self.columns[-1] + self.spans[-1] - 1 if self.texts else 0
+        if self.covered:
+            column, excel_colspan = self.covered[-1]
+            last = max(last, column + excel_colspan - 1)
+        return last
+
+    def band(self, first, last):
+        """The cells and covered blocks starting in columns first to last, moved to start at column 1.
+
+        Spans are cut off at last; a cell starting left of first belongs to the band it starts in.
+        """
+        band = Row()
+        shift = first - 1
+        rowspans = self.rowspans
+        for column, excel_colspan, text, style_id in self:
+            if first <= column <= last:
+                rowspan = rowspans.get(column, 1) if rowspans else 1
+                band.append(column - shift, min(excel_colspan, last - column + 1), text, style_id, rowspan)
+        if self.covered:
+            band.covered = [
+                (column - shift, min(excel_colspan, last - column + 1))
+                for column, excel_colspan in self.covered if first <= column <= last
+            ] or None
+        return band
+
+
+class RowSpans:
+    """Which columns the cells with a rowspan cover in the rows still to come, for one table.
+
+    Spans are kept sorted by column, so a row is laid out in one pass over its cells and the spans
+    reaching into it: placing a cell is O(1) amortized and no earlier row is looked at again. Spans
+    that run past the table's last row simply end with it.
+    """
+
+    __slots__ = ('_active', '_added')
+
+    def __init__(self):
+        self._active = []  # [column, excel_colspan, rows still covered]
+        self._added = []
+
+    def add(self, column, excel_colspan, rows):
+        """A cell at column spans rows more rows; cells are added left to right within a row."""
+        self._added.append([column, excel_colspan, rows])
+
+    def take(self):
+        """The (column, excel_colspan) blocks covered in the next row, in column order, moving down a row."""
+        if self._added:
+            # Two sorted runs, which sorted() merges in linear time.
+            self._active = sorted(self._active + self._added)
+            self._added = []
+        if not self._active:
+            return ()
+        covered = [(column, excel_colspan) for column, excel_colspan, _ in self._active]
+        remaining = []
+        for span in self._active:
+            span[2] -= 1
+            if span[2]:
+                remaining.append(span)
+        self._active = remaining
+        return covered
+
+
+class Table:
+    __slots__ = ('plan', 'rows')
+
+    def __init__(self, plan, rows):
+        self.plan = plan
+        self.rows = rows
+
+
+class Document:
+    """What the output engines consume: the master column grid, interned styles and the laid-out tables.
+
+    tables is a list for parsed documents and a one-shot iterator for streamed ones, whose rows are
+    built as they are read. layouts counts the tables laid out from the layout cache ('hits') and
+    without ('misses') when it is on (see cached_rows), and is None otherwise.
+    """
+
+    __slots__ = ('master_layout_pixels', 'styles', 'tables', 'layouts')
+
+    def __init__(self, master_layout_pixels, tables=None, styles=None):
+        self.master_layout_pixels = master_layout_pixels
+        self.styles = styles if styles is not None else StyleTable()
+        self.tables = tables if tables is not None else []
+        self.layouts = None
+
+
+def build_row(cells, plan, styles, row_spans=None):
+    """Lay a row of CellData out on the master grid and intern its styles.
+
+    row_spans is the table's RowSpans. Columns that cells above still cover are skipped, each block
+    counting as one cell of the row's own layout, and a cell is cut short rather than run into one.
+    """
+    row = Row()
+    covered = row_spans.take() if row_spans is not None else ()
+    row.covered = covered or None
+    column = 1
+    cell_idx = 0
+    block = 0
+    for cell in cells:
+        while block < len(covered) and covered[block][0] <= column:
+            column = max(column, covered[block][0] + covered[block][1])
+            cell_idx += 1
+            block += 1
+        excel_colspan = plan.excel_colspan(cell_idx, cell.colspan, column)
+        if block < len(covered):
+            excel_colspan = min(excel_colspan, covered[block][0] - column)
+        style_id = styles.cell_style_id(cell.style, cell.bgcolor, cell.bold, cell.italic)
+        row.append(column, excel_colspan, cell.text, style_id, cell.rowspan)
+        if cell.rowspan > 1 and row_spans is not None:
+            row_spans.add(column, excel_colspan, cell.rowspan - 1)
+        column += excel_colspan
+        cell_idx += 1
+    return row
+
+
+def top_level_tables(root):
+    """The <table> elements of a parsed document that are not inside another table, in document order.
+
+    Only the elements outside tables are walked. A table nested in a cell stays part of that cell,
+    whose text includes the nested table's, as in streaming mode.
+    """
+    tables = []
+    stack = [root]
+    while stack:
+        element = stack.pop()
+        if element is not root and element.name == 'table':
+            tables.append(element)
+        else:
+            stack.extend(reversed(element.find_all(True, recursive=False)))
+    return tables
+
+
+def table_cols(table):
+    """A table's own <col> elements, whether directly in it or in its <colgroup>s."""
+    cols = []
+    for child in table.find_all(['col', 'colgroup'], recursive=False):
+        if child.name == 'col':
+            cols.append(child)
+        else:
+            cols.extend(child.find_all('col', recursive=False))
+    return cols
+
+
+def table_rows(table):
+    """A table's own <tr> elements, whether directly in it or in its <thead>, <tbody> and <tfoot>."""
+    rows = []
+    for child in table.find_all(('tr',) + ROW_GROUPS, recursive=False):
+        if child.name == 'tr':
+            rows.append(child)
+        else:
+            rows.extend(child.find_all('tr', recursive=False))
+    return rows
+
+
+def dom_cell_markup(row):
+    """Read the cells of a parsed <tr> (its own, not those of tables nested in them) as texts and markup.
+
+    The markup is everything else dom_cells needs, untouched: per cell a tuple of its tag name, style,
+    the row's style, its bgcolor, colspan and rowspan attributes and whether it contains <b> and <i>.
+    """
+    row_style = row.get('style', '')
+    texts = []
+    markup = []
+    for cell in row.find_all(['td', 'th'], recursive=False):
+        # One walk over the cell's nodes finds both tags; a find() per tag costs several times as much.
+        tags = {node.name for node in cell.descendants if node.name is not None}
+        texts.append(cell.get_text(strip=True))
+        markup.append((cell.name, cell.get('style', ''), row_style, cell.get('bgcolor'), cell.get('colspan'),
+                       cell.get('rowspan'), 'b' in tags, 'i' in tags))
+    return texts, tuple(markup)
+
+
+def cell_data(texts, markup):
+    """The CellData records of a row read by dom_cell_markup."""
+    return [
+        CellData(
+            text=text,
+            style=cell_style(style, row_style),
+            bgcolor=bgcolor,
+            bold=bold or name == 'th',
+            italic=italic,
+            colspan=colspan_value(colspan),
+            rowspan=rowspan_value(rowspan),
+        )
+        for text, (name, style, row_style, bgcolor, colspan, rowspan, bold, italic) in zip(texts, markup)
+    ]
+
+
+def dom_cells(row):
+    """Read the cells of a parsed <tr> (its own, not those of tables nested in them) into CellData records."""
+    return cell_data(*dom_cell_markup(row))
+
+
+def dom_document(tables, master_layout_pixels=None):
+    """Build the Document for parsed top-level <table> elements; without a master layout it has no tables.
+
+    The master layout is that of master_layout() unless given.
+    """
+    table_col_styles = [[col.get('style', '') for col in table_cols(table)] for table in tables]
+    if master_layout_pixels is None:
+        master_layout_pixels = master_layout(table_col_styles)
+    document = Document(list(master_layout_pixels))
+    if not document.master_layout_pixels:
+        return document
+
+    master_layout_pixels = tuple(document.master_layout_pixels)
+    cache = layout_cache()
+    if cache.enabled:
+        document.layouts = {'hits': 0, 'misses': 0}
+    for table, col_styles in zip(tables, table_col_styles):
+        # The table's column plan is compiled before any of its rows are laid out.
+        local_layout_pixels = tuple(layout_pixels(col_styles))
+        plan = column_plan(local_layout_pixels, master_layout_pixels)
+        if cache.enabled:
+            skeleton = TableSkeleton(map(dom_cell_markup, table_rows(table)))
+            fingerprint = skeleton.fingerprint(local_layout_pixels, master_layout_pixels)
+            rows = cached_rows(cache, fingerprint, skeleton, plan, document.styles, document.layouts)
+        else:
+            row_spans = RowSpans()
+            rows = [build_row(dom_cells(row), plan, document.styles, row_spans) for row in table_rows(table)]
+        document.tables.append(Table(plan, rows))
+    return document
+
+
+def cached_rows(cache, fingerprint, skeleton, plan, styles, layouts):
+    """Lay out the rows of a TableSkeleton like build_row, or, for one seen before, from its TableLayout.
+
+    A table whose skeleton fingerprint is in cache gets the start columns, spans, looks, rowspans and
+    covered blocks of its rows from there and only the text from its cells; its looks are interned
+    into styles once each. Otherwise its rows are built and their layout added to cache. layouts is
+    the {'hits': ..., 'misses': ...} count to add the lookup to.
+    """
+    layout = cache.get(fingerprint)
+    layouts['misses' if layout is None else 'hits'] += 1
+    if layout is None:
+        row_spans = RowSpans()
+        rows = [build_row(cell_data(texts, markup), plan, styles, row_spans) for texts, markup in skeleton.rows()]
+        cache.put(fingerprint, TableLayout.from_rows(rows, styles))
+        return rows
+
+    mapping = [styles.intern(key) for key in layout.keys]
+    # Rows of one shape share its arrays, which nothing changes once a row is built.
+    shapes = [
+        (array('I', columns), array('I', spans), array('I', map(mapping.__getitem__, key_ids)),
+         dict(rowspans) if rowspans else None, list(covered) if covered else None)
+        for columns, spans, key_ids, rowspans, covered in layout.shapes
+    ]
+    rows = []
+    for texts, shape in zip(skeleton.texts, layout.row_shapes):
+        row = Row()
+        row.columns, row.spans, row.style_ids, row.rowspans, row.covered = shapes[shape]
+        row.texts = texts
+        styles.lookups += len(texts)
+        rows.append(row)
+    return rows
+
+
+def streamed_document(source, table_col_styles, master_layout_pixels=None):
+    """Build a Document over the second streaming pass of source, given the layouts of the first."""
+    if master_layout_pixels is None:
+        master_layout_pixels = master_layout(table_col_styles)
+    document = Document(list(master_layout_pixels))
+    master_layout_pixels = tuple(document.master_layout_pixels)
+    plans = [column_plan(tuple(layout_pixels(col_styles)), master_layout_pixels) for col_styles in table_col_styles]
+    document.tables = _streamed_tables(iter_table_events(source), plans, document.styles)
+    return document
+
+
+def _streamed_tables(events, plans, styles):
+    events = iter(events)
+    for event in events:
+        table = Table(plans[event[1]], _streamed_rows(event, events, plans[event[1]], styles))
+        yield table
+        # Whatever the consumer left unread still belongs to this table.
+        for _ in table.rows:
+            pass
+
+
+def _streamed_rows(event, events, plan, styles):
+    row_spans = RowSpans()
+    while event[0] == 'row':
+        yield build_row(event[2], plan, styles, row_spans)
+        event = next(events, _END_OF_TABLE)
+
+
+def sheet_layouts(table_col_styles, by_layout=False):
+    """Group the tables of a document into sheets: a (master layout, table indexes) pair per sheet.
+
+    Every table gets a sheet of its own, or with by_layout one shared with the tables whose <col>
+    widths match its own, and that sheet's master layout is the table's own. Tables without <col>
+    widths are laid out on the document's master_layout(), as on a single sheet. Sheets are in the
+    order of their first table; there are none when no table has a layout at all.
+    """
+    master_layout_pixels = tuple(master_layout(table_col_styles))
+    if not master_layout_pixels:
+        return []
+    sheets = []
+    grouped = {}
+    for index, col_styles in enumerate(table_col_styles):
+        pixels = tuple(layout_pixels(col_styles)) or master_layout_pixels
+        indexes = grouped.get(pixels) if by_layout else None
+        if indexes is None:
+            indexes = grouped[pixels] = []
+            sheets.append((pixels, indexes))
+        indexes.append(index)
+    return sheets
+
+
+def fragment_document(fragment, master_layout_pixels, parser=None, streaming=False):
+    """Build the Document of top-level tables cut out of a larger document, given as text.
+
+    This is the part of a conversion that runs in worker processes, so the Document comes back
+    complete, rows and all, and pickles. fragment is parsed with parser, or with streaming by the
+    event parser, which holds no DOM.
+    """
+    if streaming:
+        document = streamed_document(fragment, scan_table_layouts(fragment), master_layout_pixels)
+        document.tables = [Table(table.plan, list(table.rows)) for table in document.tables]
+        return document
+    return dom_document(top_level_tables(parse_html(fragment, parser)), master_layout_pixels)
+
+
+def joined_document(master_layout_pixels, documents):
+    """One Document of the tables of several, on the same master layout, in order.
+
+    documents may be a lazy iterable (of worker results); like a streamed Document, the joined one
+    reads its tables as they are needed. The styles of each are interned into the joined StyleTable
+    and its rows' style ids rewritten to match, unless they already do.
+    """
+    document = Document(list(master_layout_pixels))
+    document.tables = _joined_tables(documents, document.styles)
+    return document
+
+
+def _joined_tables(documents, styles):
+    for part in documents:
+        styles.lookups += part.styles.lookups
+        mapping = [styles.intern(key) for key in part.styles.keys]
+        if mapping != list(range(len(mapping))):
+            for table in part.tables:
+                for row in table.rows:
+                    row.style_ids = array('I', map(mapping.__getitem__, row.style_ids))
+        yield from part.tables
\ No newline at end of file
@@ -0,0 +1,206 @@
+import io
+import os
+import mmap
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+from model import fragment_document
+
+# Documents at least this large are cut at their top-level tables and built in worker processes.
+DEFAULT_PARALLEL_MIN_BYTES = int(os.environ.get('PARALLEL_MIN_BYTES', 16 * 1024 * 1024))
+# Worker processes the tables of one document are parsed and laid out in; 1 builds them in-process.
+# Unset, see parse_workers().
+DEFAULT_PARSE_WORKERS = int(os.environ['PARSE_WORKERS']) if os.environ.get('PARSE_WORKERS') else None
+# Chunks are cut this small at least, so every worker gets several and a slow one holds up little.
+MIN_CHUNK_BYTES = 1024 * 1024
+CHUNKS_PER_WORKER = 4
+# Chunks each worker may have running or waiting to be written, which bounds the models held at once.
+RESULTS_PER_WORKER = 2
+
+
+def parse_workers():
+    """Worker processes to build one document's tables in: PARSE_WORKERS if set, otherwise one per CPU.
+
+    A conversion that runs in a worker process itself (of executor.ConversionPool or cli -j) builds
+    them in-process by default: that pool already spreads conversions over the CPUs and bounds how
+    many run, which a pool of its own in every worker would get around.
+    """
+    if DEFAULT_PARSE_WORKERS is not None:
+        return DEFAULT_PARSE_WORKERS
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return os.cpu_count() or 1
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def parse_pool():
+    """The process's pool of parse_workers() worker processes, created on first use.
+
+    Every conversion in the process builds its tables in it, so conversions running at once (the
+    request threads of the web service) queue for the same workers instead of each starting a pool
+    of its own per document.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(parse_workers())
+        return _parse_pool
+
+
+def forget_parse_pool(pool):
+    """Drop pool, broken by a worker that died, so the next parse_pool() call starts a new one."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SharedSource:
+    """The bytes of one HTML document, shared with worker processes instead of sent through a pipe.
+
+    A document read from a file on disk is memory-mapped from it; any other is copied once into a
+    block of shared memory, which the creating instance removes on close(). An instance is only the
+    file path or block name with the document's offset and size, so it pickles as that and mapped()
+    in a worker maps the very same memory.
+    """
+
+    def __init__(self, path=None, block_name=None, offset=0, size=0):
+        self.path = path
+        self.block_name = block_name
+        self.offset = offset
+        self.size = size
+        self._block = None  # the block this instance created
+
+    def __reduce__(self):
+        return SharedSource, (self.path, self.block_name, self.offset, self.size)
+
+    @classmethod
+    def share(cls, source):
+        """Share HTML given as text, bytes or a seekable binary stream, leaving a stream where it was.
+
+        A binary file opened from disk is mapped from its current position on; anything else,
+        including in-memory streams that merely carry a file name (uploads), is copied.
+        """
+        path = _file_path(source)
+        if path is not None:
+            source.flush()
+            offset = source.tell()
+            return cls(path, offset=offset, size=os.path.getsize(path) - offset)
+        if not isinstance(source, (str, bytes, bytearray)):
+            position = source.tell()
+            data = source.read()
+            source.seek(position)
+        else:
+            data = source
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        try:
+            block.buf[:len(data)] = data
+        finally:
+            block.close()
+        shared = cls(block_name=block.name, size=len(data))
+        shared._block = block
+        return shared
+
+    @contextmanager
+    def mapped(self):
+        """A read-only memoryview of the document, valid inside the with block."""
+        if not self.size:
+            # An empty file cannot be memory-mapped; there is nothing to map anyway.
+            yield memoryview(b'')
+            return
+        if self.path is not None:
+            with open(self.path, 'rb') as html_file:
+                mapping = mmap.mmap(html_file.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapping)
+        else:
+            mapping = shared_memory.SharedMemory(self.block_name)
+            view = mapping.buf.toreadonly()
+        buffer = view[self.offset:self.offset + self.size]
+        try:
+            yield buffer
+        finally:
+            buffer.release()
+            view.release()
+            mapping.close()
+
+    def close(self):
+        if self._block is not None:
+            self._block.unlink()
+            self._block = None
+
+
+def _file_path(source):
+    """The absolute path of a binary file object opened from disk, or None for any other source."""
+    if not isinstance(source, (io.BufferedReader, io.BufferedRandom, io.FileIO)):
+        return None
+    path = getattr(source, 'name', None)
+    if not isinstance(path, str):
+        return None
+    try:
+        if not os.path.samestat(os.fstat(source.fileno()), os.stat(path)):
+            return None
+    except OSError:
+        return None
+    return os.path.abspath(path)
+
+
+def chunk_ranges(tables, workers, min_chunk_bytes=MIN_CHUNK_BYTES):
+    """Cut a document into byte ranges of whole consecutive top-level tables (parsers.TableSlice).
+
+    Chunks aim at CHUNKS_PER_WORKER per worker, but no smaller than min_chunk_bytes; each runs from
+    its first table's start to its last one's end, so it is one contiguous slice of the document.
+    """
+    if not tables:
+        return []
+    total = tables[-1].end - tables[0].start
+    target = max(min_chunk_bytes, total // (workers * CHUNKS_PER_WORKER) + 1)
+    chunks = []
+    start = tables[0].start
+    for table, following in zip(tables, tables[1:] + [None]):
+        if following is None or table.end - start >= target:
+            chunks.append((start, table.end))
+            if following is not None:
+                start = following.start
+    return chunks
+
+
+def build_document(source, ranges, master_layout_pixels, parser=None, streaming=False):
+    """Worker side: the model.Document of the tables in the (start, end) byte ranges of a SharedSource."""
+    with source.mapped() as buffer:
+        fragment = ''.join(str(buffer[start:end], 'utf-8') for start, end in ranges)
+    return fragment_document(fragment, master_layout_pixels, parser, streaming)
+
+
+def ordered_results(pool, function, tasks, window):
+    """Yield function(*task) for each task, in task order, running them in pool (None: in this process).
+
+    At most window tasks are running or finished but not yet taken, so a slow consumer does not
+    make the results of the whole document pile up. Tasks not yet started are cancelled when the
+    consumer stops early, and the running ones are waited for, so none still reads its input after.
+    """
+    if pool is None:
+        for task in tasks:
+            yield function(*task)
+        return
+    pending = deque()
+    try:
+        for task in tasks:
+            pending.append(pool.submit(function, *task))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        wait(pending)
@@ -0,0 +1,388 @@
+import os
+import re
+import codecs
+import logging
+import importlib.util
+from html import unescape
+from collections import namedtuple
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# Backends in order of preference when the configured parser is 'auto'.
+# 'lexbor' is the selectolax fast path; the others are BeautifulSoup tree builders.
+PARSER_BACKENDS = ('lexbor', 'lxml', 'html5lib', 'html.parser')
+# html.parser unless configured otherwise: the backends repair malformed tables differently (lexbor and
+# html5lib give a <td> outside any <tr> a row of its own, lxml and html.parser drop it), and html.parser
+# reads them like the streaming converter does. 'auto' opts into the fastest installed backend.
+DEFAULT_PARSER = os.environ.get('HTML_PARSER_BACKEND', 'html.parser')
+STREAM_CHUNK_SIZE = 64 * 1024
+MAX_ROWSPAN = 65534  # the most rows HTML lets a cell span
+MAX_COLSPAN = 1000  # the most columns HTML lets a cell span
+
+# One table cell as handed to the sheet writer. style is the row style followed by the cell style (see
+# cell_style); bold/italic only reflect markup (<th>, <b>, <i>), style-based flags are resolved by the writer.
+CellData = namedtuple('CellData', ['text', 'style', 'bgcolor', 'bold', 'italic', 'colspan', 'rowspan'], defaults=(1,))
+# One top-level table found by split_tables: its byte range in the document and its own <col> styles.
+TableSlice = namedtuple('TableSlice', ['start', 'end', 'col_styles'])
+
+# What split_tables looks for: comments, and the tags that open or close a table or raw-text content.
+_TABLE_BOUNDARY = re.compile(rb'<!--|<(/?)(table|col|script|style)\b[^>]*>?', re.IGNORECASE)
+_COMMENT_END = re.compile(rb'-->')
+_RAW_TEXT_END = {
+    b'script': re.compile(rb'</script\b', re.IGNORECASE),
+    b'style': re.compile(rb'</style\b', re.IGNORECASE),
+}
+_STYLE_ATTRIBUTE = re.compile(rb'''\sstyle\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.IGNORECASE)
+
+
+def cell_style(style, row_style):
+    """Combine a cell's inline style with its row's so that the cell's own declarations come last and win."""
+    if not row_style:
+        return style
+    return f'{row_style};{style}'
+
+
+def rowspan_value(value):
+    """A rowspan attribute as a number of rows: 0 spans the rest of the table, unparseable values 1."""
+    try:
+        rowspan = int(value)
+    except (TypeError, ValueError):
+        return 1
+    if rowspan == 0:
+        # The table's end clips it, like any span that runs past the last row.
+        return MAX_ROWSPAN
+    return min(max(rowspan, 1), MAX_ROWSPAN)
+
+
+def colspan_value(value):
+    """A colspan attribute as a number of columns: at least 1, with unparseable values 1."""
+    try:
+        colspan = int(value)
+    except (TypeError, ValueError):
+        return 1
+    return min(max(colspan, 1), MAX_COLSPAN)
+
+_BACKEND_MODULES = {
+    'lexbor': 'selectolax',
+    'lxml': 'lxml',
+    'html5lib': 'html5lib',
+    'html.parser': None,
+}
+
+
+def _module_installed(name):
+    return name is None or importlib.util.find_spec(name) is not None
+
+
+def available_parsers():
+    return [name for name in PARSER_BACKENDS if _module_installed(_BACKEND_MODULES[name])]
+
+
+def resolve_parser(parser=None):
+    """Return the concrete backend name for a requested parser (None: DEFAULT_PARSER; 'auto': the fastest installed)."""
+    parser = (parser or DEFAULT_PARSER or 'html.parser').lower()
+    if parser == 'auto':
+        return available_parsers()[0]
+    if parser not in _BACKEND_MODULES:
+        raise ValueError(f"Unknown HTML parser backend '{parser}'. Choose one of: auto, {', '.join(PARSER_BACKENDS)}")
+    if not _module_installed(_BACKEND_MODULES[parser]):
+        fallback = available_parsers()[0]
+        logger.warning(f"HTML parser backend '{parser}' is not installed, falling back to '{fallback}'")
+        return fallback
+    return parser
+
+
+class LexborElement:
+    """Wraps a selectolax node with the small part of the BeautifulSoup Tag API the converter uses."""
+
+    __slots__ = ('_node',)
+
+    def __init__(self, node):
+        self._node = node
+
+    @property
+    def name(self):
+        return self._node.tag
+
+    def get(self, key, default=None):
+        value = self._node.attributes.get(key)
+        if value is None:
+            return default if key not in self._node.attributes else ''
+        return value
+
+    def find(self, name):
+        node = self._node.css_first(name)
+        return LexborElement(node) if node is not None else None
+
+    def find_all(self, names, recursive=True):
+        """Descendants (or with recursive=False, children) named names: a tag, a list of tags or True for any."""
+        if not recursive:
+            nodes = self._node.iter()
+            if names is not True:
+                names = (names,) if isinstance(names, str) else names
+                nodes = (node for node in nodes if node.tag in names)
+            return [LexborElement(node) for node in nodes]
+        selector = '*' if names is True else names if isinstance(names, str) else ', '.join(names)
+        return [LexborElement(node) for node in self._node.css(selector)]
+
+    @property
+    def descendants(self):
+        """The elements inside this one; unlike BeautifulSoup's, without text nodes."""
+        nodes = self._node.traverse()
+        next(nodes)  # the node itself
+        return (LexborElement(node) for node in nodes)
+
+    def get_text(self, separator='', strip=False):
+        return self._node.text(deep=True, separator=separator, strip=strip)
+
+
+class LexborDocument(LexborElement):
+    __slots__ = ()
+
+    def __init__(self, html_content):
+        from selectolax.lexbor import LexborHTMLParser
+        tree = LexborHTMLParser(html_content)
+        # BeautifulSoup leaves script/style contents out of get_text(); match it.
+        tree.strip_tags(['script', 'style'])
+        super().__init__(tree.root)
+
+
+def parse_html(html_content, parser=None):
+    """Parse HTML with the requested backend and return a BeautifulSoup-compatible document."""
+    backend = resolve_parser(parser)
+    if backend == 'lexbor':
+        return LexborDocument(html_content)
+    return BeautifulSoup(html_content, backend)
+
+
+def iter_chunks(source, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield text chunks from a str, bytes or (text or binary) file object without reading it all at once."""
+    if isinstance(source, (bytes, bytearray)):
+        source = source.decode('utf-8')
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+        return
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+class TableEventParser(HTMLParser):
+    """Event-driven table reader that never builds a DOM.
+
+    Fed incrementally, it records the <col> styles of every table and queues ('row', table_index, cells)
+    and ('end_table', table_index) events, holding only the row currently being read. Tables nested
+    inside a cell are flattened into that cell's text.
+    """
+
+    def __init__(self, layout_only=False):
+        super().__init__(convert_charrefs=True)
+        self.layout_only = layout_only
+        self.layouts = []
+        self.events = []
+        self._tables = []
+        self._row = None
+        self._row_style = ''
+        self._cell = None
+        self._nested = 0
+        self._skip = 0
+        self._text_node = []  # raw data of the text node being read, which may arrive in pieces
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text_node()
+        if tag in ('script', 'style'):
+            self._skip += 1
+            return
+        if self._cell is not None:
+            if self._nested or tag not in ('td', 'th', 'tr', 'table'):
+                if tag == 'b':
+                    self._cell['bold'] = True
+                elif tag == 'i':
+                    self._cell['italic'] = True
+                elif tag == 'table':
+                    self._nested += 1
+                return
+            if tag == 'table':
+                self._nested += 1
+                return
+            self._close_cell()
+
+        if tag == 'table':
+            self._tables.append(len(self.layouts))
+            self.layouts.append([])
+        elif not self._tables:
+            return
+        elif tag == 'col':
+            self.layouts[self._tables[-1]].append(dict(attrs).get('style') or '')
+        elif tag == 'tr':
+            self._close_row()
+            self._row = []
+            self._row_style = dict(attrs).get('style') or ''
+        elif tag in ('td', 'th'):
+            attrs = dict(attrs)
+            self._cell = {
+                'name': tag,
+                'text': [],
+                'style': attrs.get('style') or '',
+                'bgcolor': attrs.get('bgcolor'),
+                'colspan': attrs.get('colspan'),
+                'rowspan': attrs.get('rowspan'),
+                'bold': False,
+                'italic': False,
+            }
+
+    def handle_endtag(self, tag):
+        self._end_text_node()
+        if tag in ('script', 'style'):
+            self._skip = max(0, self._skip - 1)
+            return
+        if self._cell is not None:
+            if self._nested:
+                if tag == 'table':
+                    self._nested -= 1
+                return
+            if tag not in ('td', 'th', 'tr', 'table'):
+                return
+            self._close_cell()
+        if tag == 'tr':
+            self._close_row()
+        elif tag == 'table' and self._tables:
+            self._close_row()
+            self._close_table()
+
+    def handle_data(self, data):
+        if self._cell is None or self._skip or self.layout_only:
+            return
+        self._text_node.append(data)
+
+    def handle_comment(self, data):
+        self._end_text_node()
+
+    def _end_text_node(self):
+        """Add the text node just read to the cell stripped, as get_text(strip=True) does per node.
+
+        A text node can reach handle_data in several pieces, split where the input was fed in chunks,
+        so it is only stripped once it ends.
+        """
+        if not self._text_node:
+            return
+        text = ''.join(self._text_node).strip()
+        self._text_node.clear()
+        if text and self._cell is not None:
+            self._cell['text'].append(text)
+
+    def close(self):
+        super().close()
+        self._end_text_node()
+        if self._cell is not None:
+            self._close_cell()
+        self._close_row()
+        while self._tables:
+            self._close_table()
+
+    def _close_cell(self):
+        self._end_text_node()
+        cell, self._cell, self._nested = self._cell, None, 0
+        if self._row is None or self.layout_only:
+            return
+        self._row.append(CellData(
+            text=''.join(cell['text']),
+            style=cell_style(cell['style'], self._row_style),
+            bgcolor=cell['bgcolor'],
+            bold=cell['bold'] or cell['name'] == 'th',
+            italic=cell['italic'],
+            colspan=colspan_value(cell['colspan']),
+            rowspan=rowspan_value(cell['rowspan']),
+        ))
+
+    def _close_row(self):
+        if self._row is not None and not self.layout_only:
+            self.events.append(('row', self._tables[-1], self._row))
+        self._row = None
+
+    def _close_table(self):
+        table_index = self._tables.pop()
+        if not self.layout_only:
+            self.events.append(('end_table', table_index))
+
+
+def scan_table_layouts(source, chunk_size=STREAM_CHUNK_SIZE):
+    """First streaming pass: return the <col> style strings of every table, in document order."""
+    parser = TableEventParser(layout_only=True)
+    for chunk in iter_chunks(source, chunk_size):
+        parser.feed(chunk)
+    parser.close()
+    return parser.layouts
+
+
+def split_tables(data):
+    """Find the top-level tables of an HTML document given as bytes (or any buffer) without parsing it.
+
+    Returns a TableSlice per table, in document order: the range from its <table> tag to just past
+    its </table> (the end of data for one left open) and the style attributes of its own <col> tags,
+    as scan_table_layouts reads them. Tables nested in it are part of its range; comments, scripts
+    and styles are skipped over.
+    """
+    slices = []
+    depth = start = position = 0
+    col_styles = None
+    search = _TABLE_BOUNDARY.search
+    while True:
+        match = search(data, position)
+        if match is None:
+            break
+        position = match.end()
+        closing, tag = match.group(1, 2)
+        if tag is None:
+            end = _COMMENT_END.search(data, position)
+            position = len(data) if end is None else end.end()
+            continue
+        tag = tag.lower()
+        if tag in _RAW_TEXT_END:
+            if not closing:
+                end = _RAW_TEXT_END[tag].search(data, position)
+                position = len(data) if end is None else end.start()
+        elif tag == b'col':
+            if depth == 1 and not closing:
+                col_styles.append(_style_attribute(match.group()))
+        elif not closing:
+            if not depth:
+                start = match.start()
+                col_styles = []
+            depth += 1
+        elif depth:
+            depth -= 1
+            if not depth:
+                slices.append(TableSlice(start, position, col_styles))
+    if depth:
+        slices.append(TableSlice(start, len(data), col_styles))
+    return slices
+
+
+def _style_attribute(tag):
+    match = _STYLE_ATTRIBUTE.search(tag)
+    if match is None:
+        return ''
+    value = next(group for group in match.groups() if group is not None)
+    return unescape(value.decode('utf-8', 'replace'))
+
+
+def iter_table_events(source, chunk_size=STREAM_CHUNK_SIZE):
+    """Second streaming pass: yield row and end-of-table events as the input is consumed."""
+    parser = TableEventParser()
+    for chunk in iter_chunks(source, chunk_size):
+        parser.feed(chunk)
+        yield from parser.events
+        parser.events.clear()
+    parser.close()
+    yield from parser.events
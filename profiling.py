@@ -0,0 +1,91 @@
+import os
+import re
+import sys
+import time
+import uuid
+import pstats
+import cProfile
+import tempfile
+
+DEFAULT_PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'html-excel-profiles'))
+# Shared secret a request must present to be profiled; unset, profiling is off.
+DEFAULT_PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN') or None
+DEFAULT_MAX_PROFILES = int(os.environ.get('PROFILE_MAX_FILES', 50))  # newest artifacts kept
+TOP_FUNCTIONS = 25
+PROFILE_SUFFIX = '.pstats'
+
+_PROFILE_ID = re.compile(r'[0-9a-f]{32}')
+
+
+def profile_path(directory, profile_id):
+    """Path of a stored profile, or None for an id that cannot be one (so ids never escape directory)."""
+    if not _PROFILE_ID.fullmatch(profile_id or ''):
+        return None
+    return os.path.join(directory, profile_id + PROFILE_SUFFIX)
+
+
+def _location(filename, line):
+    if filename == '~':  # built-in functions have no source
+        return None
+    # Relative to the import path entry it was loaded from: openpyxl/cell/_writer.py, converter.py.
+    roots = [root for root in sys.path if root and filename.startswith(os.path.join(root, ''))]
+    if roots:
+        filename = os.path.relpath(filename, max(roots, key=len))
+    return f'{filename}:{line}'
+
+
+def top_functions(profile, limit=TOP_FUNCTIONS):
+    """The functions of a pstats.Stats that took the most time of their own, most expensive first."""
+    entries = sorted(profile.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            'function': name,
+            'location': _location(filename, line),
+            'calls': calls,
+            'own_seconds': round(own_seconds, 6),
+            'cumulative_seconds': round(cumulative_seconds, 6),
+        }
+        for (filename, line, name), (_, calls, own_seconds, cumulative_seconds, _) in entries
+    ]
+
+
+def run_profiled(directory, function, *args, **kwargs):
+    """Call function under cProfile and save the profile in directory; return (result, report).
+
+    The profile is written as <id>.pstats, which pstats, snakeviz or flameprof (for a flame graph)
+    read, and only the newest DEFAULT_MAX_PROFILES are kept. report has the id, the seconds the call
+    took under the profiler and its top_functions().
+    """
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    result = profiler.runcall(function, *args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    os.makedirs(directory, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+    path = profile_path(directory, profile_id)
+    profiler.dump_stats(path + '.part')
+    os.replace(path + '.part', path)
+    prune(directory)
+    return result, {
+        'id': profile_id,
+        'seconds': round(seconds, 6),
+        'top': top_functions(pstats.Stats(profiler)),
+    }
+
+
+def prune(directory, keep=DEFAULT_MAX_PROFILES):
+    """Remove all but the keep newest profiles in directory."""
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(PROFILE_SUFFIX):
+            try:
+                profiles.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+    profiles.sort(reverse=True)
+    for _, path in profiles[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from functools import partial
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the converter's output for the same input and options changes, so old entries stop matching.
+CACHE_KEY_VERSION = 7
+HASH_CHUNK_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+DEFAULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'html-excel-cache'))
+DEFAULT_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+DEFAULT_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL', 24 * 60 * 60))
+
+_DATA_SUFFIX = '.out'
+_META_SUFFIX = '.json'
+
+
+def cache_key(source, **options):
+    """Hex SHA-256 of the converter options and the HTML, given as text, bytes or a seekable binary stream.
+
+    A stream is hashed in chunks from its current position and left where it was. The key doubles as
+    the ETag of the result, since the same key always maps to the same converted output.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([CACHE_KEY_VERSION, options], sort_keys=True).encode('utf-8'))
+    digest.update(b'\0')
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        position = source.tell()
+        for chunk in iter(partial(source.read, HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        source.seek(position)
+    return digest.hexdigest()
+
+
+class CacheEntry:
+    __slots__ = ('key', 'size', 'created', 'stats', 'path')
+
+    def __init__(self, key, size, created, stats, path):
+        self.key = key
+        self.size = size
+        self.created = created
+        self.stats = stats
+        self.path = path
+
+    def open(self):
+        """The cached output as a binary file; it stays readable even if the entry is evicted meanwhile."""
+        return open(self.path, 'rb')
+
+
+class ResultCache:
+    """Content-addressed store of converted outputs on local disk.
+
+    Each entry is the output file plus a JSON sidecar with its conversion stats and creation time,
+    named after its cache_key. The index is kept in process in least-recently-used order and rebuilt
+    from the directory on start (recency from the output files' mtimes, which hits refresh). Entries
+    older than ttl seconds are dropped on access, and the least recently used ones are evicted while
+    the outputs add up to more than max_bytes. max_bytes of 0 disables storing.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + _DATA_SUFFIX, base + _META_SUFFIX
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_META_SUFFIX):
+                continue
+            key = name[:-len(_META_SUFFIX)]
+            data_path, meta_path = self._paths(key)
+            try:
+                with open(meta_path, encoding='utf-8') as meta_file:
+                    meta = json.load(meta_file)
+                last_used = os.stat(data_path).st_mtime
+            except (OSError, ValueError):
+                self._remove(key)
+                continue
+            found.append((last_used, CacheEntry(key, meta['size'], meta['created'], meta['stats'], data_path)))
+        found.sort(key=lambda item: item[0])
+        with self._lock:
+            for _, entry in found:
+                self._entries[entry.key] = entry
+                self.total_bytes += entry.size
+            self._expire(time.time())
+            self._evict()
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+        self._remove(key)
+
+    def _expire(self, now):
+        if self.ttl <= 0:
+            return
+        for key in [key for key, entry in self._entries.items() if now - entry.created > self.ttl]:
+            self._drop(key)
+            self.expirations += 1
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def get(self, key):
+        """The live CacheEntry for key, marked most recently used, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.time() - entry.created > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None and not os.path.exists(entry.path):
+                # Removed behind our back, e.g. by another process sharing the directory.
+                self._entries.pop(key)
+                self.total_bytes -= entry.size
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return entry
+
+    def _write_atomic(self, path, write):
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as temp_file:
+            try:
+                write(temp_file)
+            except BaseException:
+                temp_file.close()
+                os.remove(temp_file.name)
+                raise
+        os.replace(temp_file.name, path)
+
+    def put(self, key, output, stats):
+        """Store a converted output (a readable binary file, copied from its start) under key."""
+        if not self.enabled:
+            return
+        output.seek(0, os.SEEK_END)
+        size = output.tell()
+        if size > self.max_bytes:
+            return
+        data_path, meta_path = self._paths(key)
+        created = time.time()
+        try:
+            # Written beside the entry and renamed into place, so readers never see a partial file.
+            output.seek(0)
+            self._write_atomic(data_path, lambda data_file: shutil.copyfileobj(output, data_file, COPY_CHUNK_SIZE))
+            meta = json.dumps({'size': size, 'created': created, 'stats': stats}).encode('utf-8')
+            self._write_atomic(meta_path, lambda meta_file: meta_file.write(meta))
+        except OSError as e:
+            logger.warning(f"Could not store conversion result {key} in the cache: {e}")
+            self._remove(key)
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+            self._entries[key] = CacheEntry(key, size, created, stats, data_path)
+            self.total_bytes += size
+            self._expire(created)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+            }
\ No newline at end of file
@@ -0,0 +1,869 @@
+from flask import Blueprint, Response, current_app, request, send_file, abort, jsonify, url_for
+import io
+import os
+import hmac
+import json
+import shutil
+import tempfile
+from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException, ServiceUnavailable, Forbidden
+import logging
+import zipfile
+import traceback
+from functools import partial
+from concurrent.futures import Future
+import magic
+from flask_cors import CORS
+import base64
+from datetime import datetime
+import converter
+from parsers import DEFAULT_PARSER, resolve_parser, available_parsers
+from resultcache import ResultCache, cache_key, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, DEFAULT_TTL_SECONDS
+import executor
+from executor import ConversionPool, PoolBusy, run_conversion
+import jobs
+from jobs import JobQueue, InProcessBroker, QueueFull
+import batch
+from batch import batch_members, convert_batch
+from metrics import ConversionMetrics
+import profiling
+from profiling import profile_path
+
+logger = logging.getLogger(__name__)
+
+# The converter's routes, shared by final.py and file.py.
+service = Blueprint('service', __name__)
+
+BINARY_MIME_TYPES = ('text/html', 'multipart/form-data')
+ZIP_MIME_TYPES = ('application/zip', 'application/x-zip-compressed')
+COPY_CHUNK_SIZE = 1024 * 1024
+MIME_SNIFF_BYTES = 1024 * 1024  # libmagic itself looks at no more than this much of a file
+ALLOWED_EXTENSIONS = {'html'}
+MIME_TYPES = {
+    'html': 'text/html'
+}
+
+def init_app(app):
+    """Register the service's routes on app, with CORS for /api/* and the default config."""
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": ["*"],  # You should restrict this to your Appian domain in production
+            "methods": ["GET", "POST", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", "X-Profile-Token"],
+            "expose_headers": ["Content-Disposition", "X-Conversion-Stats", "ETag", "X-Cache", "Location"],
+            "max_age": 3600
+        }
+    })
+    app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 MB
+    app.config['HTML_PARSER'] = DEFAULT_PARSER  # 'html.parser' (default), 'lexbor', 'lxml', 'html5lib' or 'auto'
+    app.config['STREAMING_MIN_BYTES'] = converter.STREAMING_MIN_BYTES  # inputs this large skip the DOM and are converted row by row
+    app.config['OUTPUT_ENGINE'] = os.environ.get('EXCEL_OUTPUT_ENGINE')  # None: write_only when streaming, else openpyxl
+    app.config['SHEET_MODE'] = converter.DEFAULT_SHEET_MODE  # 'single', 'table' (a sheet per table) or 'layout'
+    app.config['SPOOL_MAX_BYTES'] = 8 * 1024 * 1024  # request bodies and outputs larger than this spill to a temp file
+    app.config['RESULT_CACHE_DIR'] = DEFAULT_CACHE_DIR
+    app.config['RESULT_CACHE_MAX_BYTES'] = DEFAULT_MAX_BYTES  # total size of cached outputs; 0 disables the cache
+    app.config['RESULT_CACHE_TTL'] = DEFAULT_TTL_SECONDS  # seconds; 0 keeps entries until they are evicted
+    app.config['CONVERSION_WORKERS'] = executor.DEFAULT_WORKERS  # worker processes; 0 converts in the request thread
+    # Large and multi-sheet documents are built in parallel only with 0 CONVERSION_WORKERS: then every
+    # request thread shares the one pool of PARSE_WORKERS processes (parallel.parse_pool). Each
+    # conversion worker builds its documents in-process instead, as that pool already uses the CPUs.
+    app.config['CONVERSION_MAX_TASKS_PER_CHILD'] = executor.DEFAULT_MAX_TASKS_PER_CHILD
+    app.config['CONVERSION_QUEUE_DEPTH'] = executor.DEFAULT_QUEUE_DEPTH  # conversions waiting for a worker before 503s
+    app.config['CONVERSION_RETRY_AFTER'] = executor.DEFAULT_RETRY_AFTER  # seconds, sent with the 503
+    app.config['JOB_DIR'] = jobs.DEFAULT_JOB_DIR  # inputs and results of /api/jobs
+    app.config['JOB_RUNNERS'] = jobs.DEFAULT_JOB_RUNNERS  # jobs converted at once
+    app.config['JOB_TTL'] = jobs.DEFAULT_JOB_TTL  # seconds a finished job and its result are kept
+    app.config['JOB_MAX_QUEUED'] = jobs.DEFAULT_MAX_QUEUED_JOBS  # waiting jobs before 503s
+    app.config['BATCH_MAX_FILES'] = batch.DEFAULT_MAX_FILES  # documents per /api/batch request
+    app.config['PROFILING_TOKEN'] = profiling.DEFAULT_PROFILING_TOKEN  # secret that unlocks profiled conversions; None: off
+    app.config['PROFILE_DIR'] = profiling.DEFAULT_PROFILE_DIR  # where profiles of conversions are kept
+    app.register_blueprint(service)
+
+@service.after_app_request
+def add_security_headers(response):
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['X-Frame-Options'] = 'DENY'
+    response.headers['X-XSS-Protection'] = '1; mode=block'
+    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
+    response.headers['Access-Control-Allow-Origin'] = '*'  # Restrict this in production
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Profile-Token'
+    return response
+
+# Health check endpoint
+@service.route('/health', methods=['GET'])
+def health_check():
+    pool = conversion_pool()
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'version': '1.0.0',
+        'parsers': available_parsers(),
+        'result_cache': result_cache().stats(),
+        'conversion_pool': pool.stats() if pool is not None else None,
+        'jobs': job_queue().stats()
+    })
+
+# Prometheus metrics: per-stage and per-document histograms of the conversions run by this process,
+# and the numbers /health reports as gauges.
+@service.route('/metrics', methods=['GET'])
+def metrics():
+    pool = conversion_pool()
+    body = conversion_metrics().render({
+        'result_cache': result_cache().stats(),
+        'conversion_pool': pool.stats() if pool is not None else None,
+        'jobs': job_queue().stats(),
+    })
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@service.app_errorhandler(Forbidden)
+def forbidden(e):
+    return jsonify({
+        'error': 'Forbidden',
+        'details': e.description
+    }), 403
+
+@service.app_errorhandler(ServiceUnavailable)
+def service_unavailable(e):
+    response = jsonify({
+        'error': 'Server busy',
+        'details': e.description,
+        'retry_after': current_app.config['CONVERSION_RETRY_AFTER']
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(current_app.config['CONVERSION_RETRY_AFTER'])
+    return response
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def validate_mime_type(head, ext):
+    try:
+        mime = magic.from_buffer(head, mime=True)
+        expected_mime = MIME_TYPES.get(ext)
+        logger.debug(f"File MIME type: {mime}, Expected MIME type: {expected_mime}")
+        return mime == expected_mime
+    except Exception as e:
+        logger.error(f"Error validating MIME type: {e}")
+        return False
+
+def source_size(source):
+    """Length of HTML given as text or bytes, or the bytes left in a seekable stream."""
+    if isinstance(source, (str, bytes, bytearray)):
+        return len(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END) - position
+    source.seek(position)
+    return size
+
+def conversion_pool():
+    """The app's ConversionPool, created from its CONVERSION_* config on first use; None with 0 workers."""
+    if not current_app.config['CONVERSION_WORKERS']:
+        return None
+    pool = current_app.extensions.get('conversion_pool')
+    if pool is None:
+        pool = current_app.extensions['conversion_pool'] = ConversionPool(
+            workers=current_app.config['CONVERSION_WORKERS'],
+            max_tasks_per_child=current_app.config['CONVERSION_MAX_TASKS_PER_CHILD'],
+            queue_depth=current_app.config['CONVERSION_QUEUE_DEPTH'],
+            retry_after=current_app.config['CONVERSION_RETRY_AFTER'],
+            inline_max_bytes=current_app.config['SPOOL_MAX_BYTES'],
+        )
+    return pool
+
+def conversion_metrics():
+    """The app's ConversionMetrics, which every conversion it runs is recorded in."""
+    recorder = current_app.extensions.get('conversion_metrics')
+    if recorder is None:
+        recorder = current_app.extensions['conversion_metrics'] = ConversionMetrics()
+    return recorder
+
+def convert_to_excel(source, output_file, parser=None, streaming=None, engine=None, progress=None, wait=False,
+                     profile=False, sheets=None):
+    """Convert HTML given as text, bytes or a seekable binary stream in a worker process.
+
+    Raises ServiceUnavailable (503 with Retry-After) when the pool's workers and queue are all taken,
+    unless wait is set. progress is an optional executor.ProgressCounter. With profile, the
+    conversion runs under the profiler and stats['profile'] reports where its time went.
+    """
+    engine = engine or current_app.config['OUTPUT_ENGINE']
+    parser = parser or current_app.config['HTML_PARSER']
+    sheets = sheets or current_app.config['SHEET_MODE']
+    if streaming is None:
+        streaming = source_size(source) >= current_app.config['STREAMING_MIN_BYTES']
+    profile_dir = current_app.config['PROFILE_DIR'] if profile else None
+    pool = conversion_pool()
+    try:
+        if pool is not None:
+            stats = pool.convert(source, output_file, parser, streaming, engine, progress, wait, profile_dir, sheets)
+        elif profile:
+            stats = executor.profiled_conversion(profile_dir, source, output_file, parser, streaming, engine, progress,
+                                                 sheets)
+        else:
+            stats = run_conversion(source, output_file, parser, streaming, engine, progress, sheets)
+    except PoolBusy as e:
+        logger.warning(str(e))
+        raise ServiceUnavailable(str(e), retry_after=e.retry_after)
+    except Exception:
+        conversion_metrics().failed()
+        raise
+    if profile:
+        # The profiler slows everything down, so these timings would skew the histograms.
+        stats['profile']['url'] = url_for('service.profile_artifact', profile_id=stats['profile']['id'])
+    else:
+        conversion_metrics().observe(stats)
+    return stats
+
+def profiling_token():
+    return request.headers.get('X-Profile-Token') or request.args.get('profile')
+
+def profiling_requested():
+    """Whether the request asks for a profiled conversion.
+
+    It does so with the PROFILING_TOKEN in an X-Profile-Token header or a profile query parameter;
+    a wrong token, or any token while profiling is off, raises Forbidden.
+    """
+    token = profiling_token()
+    if not token:
+        return False
+    check_profiling_token(token)
+    return True
+
+def check_profiling_token(token):
+    expected = current_app.config['PROFILING_TOKEN']
+    if not expected:
+        raise Forbidden('Profiling is not enabled')
+    if not token or not hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8')):
+        raise Forbidden('Invalid profiling token')
+
+def metrics_option(value):
+    """Whether a request asked for the per-stage timings of its conversion (the metrics option)."""
+    return streaming_option(value) or False
+
+def response_stats(stats, include_timings):
+    """Conversion stats as sent to a client: the per-stage timings only when it asked for them."""
+    if include_timings or not stats:
+        return stats
+    return {name: value for name, value in stats.items() if name != 'timings'}
+
+def streaming_option(value):
+    """The streaming option from JSON (a bool) or a form field or query string (a string); None if unset."""
+    if value is None or isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def spooled_output():
+    return tempfile.SpooledTemporaryFile(max_size=current_app.config['SPOOL_MAX_BYTES'])
+
+def spooled_copy(stream):
+    """Copy a request stream into a rewound SpooledTemporaryFile that the caller owns and closes."""
+    copy = tempfile.SpooledTemporaryFile(max_size=current_app.config['SPOOL_MAX_BYTES'])
+    shutil.copyfileobj(stream, copy, COPY_CHUNK_SIZE)
+    copy.seek(0)
+    return copy
+
+def result_cache():
+    """The app's ResultCache, created from its RESULT_CACHE_* config on first use."""
+    cache = current_app.extensions.get('result_cache')
+    if cache is None:
+        cache = current_app.extensions['result_cache'] = ResultCache(
+            current_app.config['RESULT_CACHE_DIR'], current_app.config['RESULT_CACHE_MAX_BYTES'], current_app.config['RESULT_CACHE_TTL']
+        )
+    return cache
+
+def conversion_key(source, parser, streaming, engine, sheets=None):
+    """Cache key and ETag for converting source with the options that shape its output."""
+    if streaming is None:
+        streaming = source_size(source) >= current_app.config['STREAMING_MIN_BYTES']
+    options = {
+        'parser': None if streaming else parser,
+        'streaming': streaming,
+        'engine': engine or current_app.config['OUTPUT_ENGINE'],
+    }
+    sheets = sheets or current_app.config['SHEET_MODE']
+    if sheets != 'single':
+        # Left out for single-sheet conversions, so that their keys stay what they were.
+        options['sheets'] = sheets
+    return cache_key(source, **options)
+
+def not_modified(key):
+    """304 response if the client already holds the result for key (If-None-Match), else None."""
+    if not request.if_none_match.contains_weak(key):
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(key)
+    return response
+
+def cached_conversion(key, source, output, parser=None, streaming=None, engine=None, profile=False, sheets=None):
+    """Return (output, stats, hit): the cached result for key, or source converted into output and cached.
+
+    On a hit output is closed and an open file of the cached result is returned in its place. A key
+    of None converts without the cache, as profiled conversions (profile=True) must.
+    """
+    entry = result_cache().get(key) if key is not None else None
+    if entry is not None:
+        output.close()
+        return entry.open(), entry.stats, True
+    try:
+        stats = convert_to_excel(source, output, parser=parser, streaming=streaming, engine=engine, profile=profile,
+                                 sheets=sheets)
+    except Exception:
+        output.close()
+        raise
+    if key is not None:
+        result_cache().put(key, output, stats)
+    return output, stats, False
+
+def send_output(output, download_name, key=None, hit=False):
+    """Stream a spooled result back; send_file closes it, removing any spill file, when the response closes."""
+    output.seek(0)
+    response = send_file(output, as_attachment=True, download_name=download_name)
+    if key is not None:
+        response.set_etag(key)
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+def convert_binary_request():
+    """Binary /api/convert: the HTML is the raw body or its 'file' part, the workbook the response body."""
+    try:
+        parser = resolve_parser(request.values.get('parser') or current_app.config['HTML_PARSER'])
+        engine = converter.resolve_engine(request.values.get('engine'))
+        sheets = converter.resolve_sheet_mode(request.values.get('sheets'))
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    streaming = streaming_option(request.values.get('streaming'))
+    profile = profiling_requested()
+    output_name = 'converted' + converter.output_extension(engine or current_app.config['OUTPUT_ENGINE'])
+
+    if request.mimetype == 'multipart/form-data':
+        if 'file' not in request.files:
+            return jsonify({
+                'error': 'Missing file part in request body'
+            }), 400
+        # Werkzeug has already spooled the part; it is converted from there.
+        source = request.files['file'].stream
+    else:
+        # A raw body can be read only once, so it is spooled for streaming mode's two passes.
+        source = spooled_copy(request.stream)
+
+    try:
+        if source_size(source) == 0:
+            return jsonify({
+                'error': 'Empty HTML content'
+            }), 400
+
+        # A profile is of one actual conversion, so profiled requests bypass the cache and its ETags.
+        key = None if profile else conversion_key(source, parser, streaming, engine, sheets)
+        response = not_modified(key) if key is not None else None
+        if response is not None:
+            return response
+        output, stats, hit = cached_conversion(
+            key, source, spooled_output(), parser=parser, streaming=streaming, engine=engine, profile=profile,
+            sheets=sheets
+        )
+    except HTTPException:
+        raise
+    except UnicodeDecodeError:
+        return jsonify({
+            'error': 'Invalid UTF-8 encoding in HTML content'
+        }), 400
+    except Exception as e:
+        logger.error(f"Error during Excel conversion: {str(e)}")
+        return jsonify({
+            'error': 'Error converting HTML to Excel',
+            'details': str(e)
+        }), 500
+    finally:
+        source.close()
+
+    response = send_output(output, output_name, key, hit)
+    stats = response_stats(stats, profile or metrics_option(request.values.get('metrics')))
+    response.headers['X-Conversion-Stats'] = json.dumps(stats, separators=(',', ':'))
+    return response
+
+@service.route('/api/convert', methods=['POST'])
+def convert_html_to_excel():
+    """
+    API endpoint to convert HTML to Excel
+    Expected JSON payload:
+    {
+        "html_content": "base64_encoded_html_content",
+        "parser": "auto",  # optional: lexbor, lxml, html5lib or html.parser
+        "streaming": false,  # optional: force (true) or disable (false) row-by-row conversion
+        "engine": "openpyxl",  # optional: openpyxl, write_only (constant memory) or csv
+        "sheets": "single",  # optional: table (a sheet per table) or layout (per group of tables sharing <col> widths)
+        "metrics": false  # optional: include the seconds spent per stage in stats['timings']
+    }
+
+    Binary variant: send the HTML itself, as the raw body with Content-Type: text/html or as the
+    'file' part of a multipart/form-data body, with parser/streaming/engine/sheets in the query
+    string (or form fields). The response is the workbook as an attachment, with the conversion stats as JSON in
+    the X-Conversion-Stats header. Neither direction goes through base64, so a request holds no
+    base64 or JSON copies of the document or the workbook. Peak traced memory per request
+    (benchmarks/bench_api.py) went from 24 MB to 19 MB for a 1 MB report, and from 142 MB to 5 MB
+    for a 22 MB report, which is converted in streaming mode and so never held in memory at all.
+
+    Results are cached on disk under a hash of the HTML and the options (see resultcache.py). Both
+    variants send that hash as the ETag, with X-Cache: HIT or MISS, and answer a matching
+    If-None-Match with 304 Not Modified before converting anything.
+
+    With sheets=table or layout, each sheet has its own column widths and the sheets are built in
+    parallel worker processes. Output that runs past Excel's 1,048,576 rows or 16,384 columns
+    continues on further sheets in every mode.
+
+    The stats count the tables, rows, cells, merges, sheets, distinct styles and input and output bytes of
+    the conversion; with metrics=true they also hold the seconds spent parsing, laying out, writing
+    cells, sizing rows (autofit) and saving the workbook. Every conversion is also recorded in the
+    histograms served at /metrics.
+
+    Profiling: a request carrying the server's PROFILING_TOKEN (X-Profile-Token header or profile
+    query parameter) is converted under cProfile, bypassing the result cache. Its stats then hold
+    'profile': the functions that took the most time and the URL of the full .pstats profile, which
+    /api/profiles/<id> serves to the same token. Without PROFILING_TOKEN set, profiling is off.
+    """
+    try:
+        if request.mimetype in BINARY_MIME_TYPES:
+            return convert_binary_request()
+
+        if not request.is_json:
+            return jsonify({
+                'error': 'Content-Type must be application/json, text/html or multipart/form-data'
+            }), 400
+
+        data = request.get_json()
+        if not data or 'html_content' not in data:
+            return jsonify({
+                'error': 'Missing html_content in request body'
+            }), 400
+
+        # Validate base64 content
+        html_content_b64 = data['html_content']
+        if not isinstance(html_content_b64, str):
+            return jsonify({
+                'error': 'html_content must be a string'
+            }), 400
+
+        # Check if the base64 string is valid
+        try:
+            # Try to decode a small portion first to validate format
+            base64.b64decode(html_content_b64[:100])
+        except Exception:
+            return jsonify({
+                'error': 'Invalid base64 format'
+            }), 400
+
+        # Decode full content
+        try:
+            html_content = base64.b64decode(html_content_b64).decode('utf-8')
+        except UnicodeDecodeError:
+            return jsonify({
+                'error': 'Invalid UTF-8 encoding in HTML content'
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'error': 'Error decoding base64 content',
+                'details': str(e)
+            }), 400
+
+        # Validate HTML content
+        if not html_content.strip():
+            return jsonify({
+                'error': 'Empty HTML content'
+            }), 400
+
+        try:
+            parser = resolve_parser(data.get('parser') or current_app.config['HTML_PARSER'])
+            engine = converter.resolve_engine(data.get('engine'))
+            sheets = converter.resolve_sheet_mode(data.get('sheets'))
+        except ValueError as e:
+            return jsonify({
+                'error': str(e)
+            }), 400
+
+        # Convert to Excel
+        output_name = 'converted' + converter.output_extension(engine or current_app.config['OUTPUT_ENGINE'])
+        streaming = streaming_option(data.get('streaming'))
+        profile = profiling_requested()
+        key = None if profile else conversion_key(html_content, parser, streaming, engine, sheets)
+        response = not_modified(key) if key is not None else None
+        if response is not None:
+            return response
+        try:
+            output, stats, hit = cached_conversion(
+                key, html_content, io.BytesIO(), parser=parser, streaming=streaming, engine=engine, profile=profile,
+                sheets=sheets
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error during Excel conversion: {str(e)}")
+            return jsonify({
+                'error': 'Error converting HTML to Excel',
+                'details': str(e)
+            }), 500
+
+        with output:
+            output.seek(0)
+            excel_content = base64.b64encode(output.read()).decode('utf-8')
+        response = jsonify({
+            'success': True,
+            'excel_content': excel_content,
+            'filename': output_name,
+            'timestamp': datetime.utcnow().isoformat(),
+            'stats': response_stats(stats, profile or metrics_option(data.get('metrics')))
+        })
+        if key is not None:
+            response.set_etag(key)
+            response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error during conversion: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': 'Internal server error during conversion',
+            'details': str(e)
+        }), 500
+
+@service.route('/api/profiles/<profile_id>', methods=['GET'])
+def profile_artifact(profile_id):
+    """A profile saved by a profiled /api/convert request, for pstats, snakeviz or flameprof."""
+    check_profiling_token(profiling_token())
+    path = profile_path(current_app.config['PROFILE_DIR'], profile_id)
+    try:
+        artifact = open(path, 'rb') if path is not None else None
+    except FileNotFoundError:
+        artifact = None
+    if artifact is None:
+        return jsonify({
+            'error': 'Profile not found or expired'
+        }), 404
+    return send_file(artifact, as_attachment=True, download_name=profile_id + profiling.PROFILE_SUFFIX,
+                     mimetype='application/octet-stream')
+
+def job_queue():
+    """The app's JobQueue, created from its JOB_* config on first use."""
+    queue = current_app.extensions.get('job_queue')
+    if queue is None:
+        queue = current_app.extensions['job_queue'] = JobQueue(
+            InProcessBroker(),
+            partial(run_job, current_app._get_current_object()),
+            directory=current_app.config['JOB_DIR'],
+            runners=current_app.config['JOB_RUNNERS'],
+            ttl=current_app.config['JOB_TTL'],
+            max_queued=current_app.config['JOB_MAX_QUEUED'],
+        )
+    return queue
+
+def run_job(app, job, progress):
+    """JobQueue handler: convert a job's stored input into its result file, through app's result cache."""
+    options = job.options
+    with app.app_context(), open(job.input_path, 'rb') as source:
+        key = conversion_key(source, options['parser'], options['streaming'], options['engine'], options.get('sheets'))
+        entry = result_cache().get(key)
+        if entry is not None:
+            with entry.open() as cached, open(job.result_path, 'wb') as output:
+                shutil.copyfileobj(cached, output, COPY_CHUNK_SIZE)
+            progress(entry.stats.get('rows', 0))
+            return entry.stats
+        with open(job.result_path, 'w+b') as output:
+            # Jobs wait for a worker instead of being turned away; the job queue is what bounds them.
+            stats = convert_to_excel(source, output, progress=progress, wait=True, **options)
+            result_cache().put(key, output, stats)
+    return stats
+
+def job_not_found():
+    return jsonify({
+        'error': 'Unknown or expired job'
+    }), 404
+
+@service.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a conversion and return at once, for documents too large to convert within one request.
+    Takes the same bodies as /api/convert: JSON with base64 html_content and options, or the HTML as
+    a text/html body or multipart 'file' part with the options in the query string or form fields.
+    Responds 202 with the job id and, in Location, its status URL:
+    {
+        "job_id": "...",
+        "status": "queued",
+        "status_url": "/api/jobs/<id>",  # status, rows processed so far and timings
+        "result_url": "/api/jobs/<id>/result"  # the workbook once the status is "done"
+    }
+    Finished jobs and their results expire after JOB_TTL seconds.
+    """
+    if request.mimetype in BINARY_MIME_TYPES:
+        options = request.values
+        if request.mimetype == 'multipart/form-data' and 'file' not in request.files:
+            return jsonify({
+                'error': 'Missing file part in request body'
+            }), 400
+    elif request.is_json:
+        options = request.get_json(silent=True)
+        if not isinstance(options, dict) or not isinstance(options.get('html_content'), str):
+            return jsonify({
+                'error': 'Missing html_content in request body'
+            }), 400
+    else:
+        return jsonify({
+            'error': 'Content-Type must be application/json, text/html or multipart/form-data'
+        }), 400
+
+    try:
+        parser = resolve_parser(options.get('parser') or current_app.config['HTML_PARSER'])
+        engine = converter.resolve_engine(options.get('engine'))
+        sheets = converter.resolve_sheet_mode(options.get('sheets'))
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+
+    try:
+        job = job_queue().create(
+            {'parser': parser, 'streaming': streaming_option(options.get('streaming')), 'engine': engine, 'sheets': sheets},
+            'converted' + converter.output_extension(engine or current_app.config['OUTPUT_ENGINE']),
+        )
+    except QueueFull as e:
+        logger.warning(str(e))
+        raise ServiceUnavailable(str(e), retry_after=current_app.config['CONVERSION_RETRY_AFTER'])
+
+    try:
+        with open(job.input_path, 'wb') as input_file:
+            if request.mimetype == 'multipart/form-data':
+                shutil.copyfileobj(request.files['file'].stream, input_file, COPY_CHUNK_SIZE)
+            elif request.mimetype == 'text/html':
+                shutil.copyfileobj(request.stream, input_file, COPY_CHUNK_SIZE)
+            else:
+                input_file.write(base64.b64decode(options['html_content'], validate=True))
+            empty = input_file.tell() == 0
+    except ValueError:
+        job_queue().discard(job)
+        return jsonify({
+            'error': 'Invalid base64 format'
+        }), 400
+    if empty:
+        job_queue().discard(job)
+        return jsonify({
+            'error': 'Empty HTML content'
+        }), 400
+
+    job_queue().submit(job)
+    status_url = url_for('service.job_status', job_id=job.id)
+    response = jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': status_url,
+        'result_url': url_for('service.job_result', job_id=job.id)
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+@service.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status (queued, running, done or failed), rows processed so far, timings and, once done, stats."""
+    job = job_queue().get(job_id)
+    if job is None:
+        return job_not_found()
+    status = job.to_dict()
+    status['expires_at'] = job_queue().expires_at(job)
+    if job.status == jobs.DONE:
+        status['result_url'] = url_for('service.job_result', job_id=job.id)
+    return jsonify(status)
+
+@service.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """The converted workbook of a finished job; 409 while it is queued or running, or if it failed."""
+    job = job_queue().get(job_id)
+    if job is None:
+        return job_not_found()
+    if job.status != jobs.DONE:
+        return jsonify({
+            'error': f'Job is {job.status}',
+            'status': job.status,
+            'details': job.error
+        }), 409
+    try:
+        # Opened before responding, so an expiry sweep meanwhile cannot pull the file away.
+        result = open(job.result_path, 'rb')
+    except FileNotFoundError:
+        return job_not_found()
+    response = send_output(result, job.filename)
+    response.headers['X-Conversion-Stats'] = json.dumps(job.stats, separators=(',', ':'))
+    return response
+
+def start_batch_conversion(app, data, wait, parser, streaming, engine, sheets=None):
+    """convert_batch's start callback: a Future of (output bytes, stats) for one document of a batch.
+
+    It runs as the response streams, once the request and its app context are gone, so it is
+    handed the app.
+    """
+    with app.app_context():
+        if streaming is None:
+            streaming = len(data) >= current_app.config['STREAMING_MIN_BYTES']
+        engine = engine or current_app.config['OUTPUT_ENGINE']
+        sheets = sheets or current_app.config['SHEET_MODE']
+        key = conversion_key(data, parser, streaming, engine, sheets)
+        entry = result_cache().get(key)
+        pool = conversion_pool()
+        if entry is None and pool is not None:
+            conversion = pool.submit(data, parser, streaming, engine, wait=wait, sheets=sheets)
+            conversion.add_done_callback(partial(record_batch_result, app, key))
+            return conversion
+
+        future = Future()
+        if entry is not None:
+            with entry.open() as cached:
+                future.set_result((cached.read(), entry.stats))
+            return future
+        output = io.BytesIO()
+        try:
+            stats = run_conversion(data, output, parser, streaming, engine, sheets=sheets)
+        except Exception as e:
+            conversion_metrics().failed()
+            future.set_exception(e)
+            return future
+        conversion_metrics().observe(stats)
+        result_cache().put(key, output, stats)
+        future.set_result((output.getvalue(), stats))
+        return future
+
+def record_batch_result(app, key, conversion):
+    """Cache and record a pooled batch conversion once it finishes."""
+    if conversion.cancelled():
+        return
+    with app.app_context():
+        if conversion.exception() is not None:
+            conversion_metrics().failed()
+            return
+        output, stats = conversion.result()
+        conversion_metrics().observe(stats)
+        result_cache().put(key, io.BytesIO(output), stats)
+
+@service.route('/api/batch', methods=['POST'])
+def convert_batch_request():
+    """
+    Convert many HTML documents in one request, in parallel across the worker processes.
+    Send a ZIP of .html files as the body (Content-Type: application/zip), or a multipart/form-data
+    body whose file parts are .html files or ZIPs of them; parser/streaming/engine/sheets go in the
+    query string or form fields. The response is a ZIP, streamed as the documents finish, holding one
+    workbook per document (same path, .xlsx or .csv) and a manifest.json that lists every input with
+    its status (ok, error or skipped), output name, stats, seconds and error message.
+    """
+    try:
+        parser = resolve_parser(request.values.get('parser') or current_app.config['HTML_PARSER'])
+        engine = converter.resolve_engine(request.values.get('engine'))
+        sheets = converter.resolve_sheet_mode(request.values.get('sheets'))
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    streaming = streaming_option(request.values.get('streaming'))
+
+    # The response is streamed after the request has been closed, with its file parts, so the
+    # documents are read from copies.
+    if request.mimetype in ZIP_MIME_TYPES:
+        uploads = [('batch.zip', spooled_copy(request.stream))]
+    elif request.mimetype == 'multipart/form-data':
+        uploads = [
+            (upload.filename or '', spooled_copy(upload.stream))
+            for key in request.files for upload in request.files.getlist(key)
+        ]
+    else:
+        return jsonify({
+            'error': 'Content-Type must be application/zip or multipart/form-data'
+        }), 400
+
+    try:
+        members = batch_members(uploads)
+        if not members:
+            error = {'error': 'No files in request body'}
+        elif len(members) > current_app.config['BATCH_MAX_FILES']:
+            error = {'error': f"Too many files: {len(members)} (at most {current_app.config['BATCH_MAX_FILES']})"}
+        else:
+            error = None
+    except zipfile.BadZipFile as e:
+        error = {'error': 'Invalid ZIP archive', 'details': str(e)}
+    if error is not None:
+        for _, upload in uploads:
+            upload.close()
+        return jsonify(error), 400
+
+    pool = conversion_pool()
+    archive = convert_batch(
+        members,
+        partial(start_batch_conversion, current_app._get_current_object(), parser=parser, streaming=streaming, engine=engine, sheets=sheets),
+        converter.output_extension(engine or current_app.config['OUTPUT_ENGINE']),
+        max_member_bytes=current_app.config['MAX_CONTENT_LENGTH'],
+        max_in_flight=pool.workers if pool is not None else 1,
+    )
+    response = Response(
+        archive,
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=converted.zip'}
+    )
+    for _, upload in uploads:
+        response.call_on_close(upload.close)
+    return response
+
+@service.route('/upload', methods=['POST'])
+def upload_file():
+    try:
+        if 'file' not in request.files:
+            logger.error("No file part in the request")
+            abort(400, 'No file part in the request.')
+
+        file = request.files['file']
+        if file.filename == '':
+            logger.error("No selected file")
+            abort(400, 'No selected file.')
+
+        if not allowed_file(file.filename):
+            logger.error(f"Unsupported file type: {file.filename}")
+            abort(400, f'Unsupported file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}')
+
+        filename = secure_filename(file.filename)
+        ext = filename.rsplit('.', 1)[1].lower()
+
+        # The upload is checked and converted straight from werkzeug's spooled stream.
+        head = file.stream.read(MIME_SNIFF_BYTES)
+        file.stream.seek(0)
+        if not validate_mime_type(head, ext):
+            logger.error(f"File type mismatch for {filename}")
+            abort(400, 'File type mismatch. Possible malicious or corrupted file.')
+
+        try:
+            parser = resolve_parser(request.form.get('parser') or request.args.get('parser') or current_app.config['HTML_PARSER'])
+            engine = converter.resolve_engine(request.form.get('engine') or request.args.get('engine'))
+            sheets = converter.resolve_sheet_mode(request.form.get('sheets') or request.args.get('sheets'))
+        except ValueError as e:
+            abort(400, str(e))
+        output_extension = converter.output_extension(engine or current_app.config['OUTPUT_ENGINE'])
+
+        streaming = streaming_option(request.form.get('streaming') or request.args.get('streaming'))
+        key = conversion_key(file.stream, parser, streaming, engine, sheets)
+        response = not_modified(key)
+        if response is not None:
+            return response
+        try:
+            output, _, hit = cached_conversion(key, file.stream, spooled_output(), parser=parser, streaming=streaming, engine=engine,
+                                               sheets=sheets)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error during file conversion: {str(e)}")
+            logger.error(traceback.format_exc())
+            abort(500, f'Error during file conversion: {str(e)}')
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        logger.error(traceback.format_exc())
+        abort(500, 'Internal server error.')
+
+    return send_output(output, f'converted_file{output_extension}', key, hit)
\ No newline at end of file
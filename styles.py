@@ -0,0 +1,339 @@
+import re
+import colorsys
+from collections import namedtuple
+from functools import lru_cache
+
+import webcolors
+from openpyxl.styles import PatternFill, Font, Alignment, NamedStyle
+from openpyxl.styles.borders import Border, Side
+from openpyxl.styles.fonts import DEFAULT_FONT
+
+STYLE_CACHE_SIZE = 4096
+CSS_CACHE_SIZE = 8192
+COLOR_CACHE_SIZE = 2048
+ALIGN_MAP = {'center': 'center', 'left': 'left', 'right': 'right', 'justify': 'justify'}
+
+thin_black_side = Side(style='thin', color='FF000000')
+DEFAULT_BORDER = Border(left=thin_black_side, right=thin_black_side, top=thin_black_side, bottom=thin_black_side)
+
+# CSS named colors as opaque ARGB, precomputed so lookups never go through webcolors per cell.
+NAMED_COLORS = {name: 'FF' + webcolors.name_to_hex(name)[1:].upper() for name in webcolors.names('css3')}
+NAMED_COLORS['rebeccapurple'] = 'FF663399'  # CSS Color 4
+
+_COLOR_FUNCTION = re.compile(r'(rgba?|hsla?)\(([^)]*)\)')
+_COLOR_ARGUMENT_SEPARATOR = re.compile(r'[\s,/]+')
+
+# The inline CSS the converter understands. Unset properties are None; font_size is in points.
+Declarations = namedtuple('Declarations', [
+    'background_color', 'color', 'text_align', 'font_family', 'font_size', 'bold', 'italic', 'underline', 'strike',
+])
+
+# Everything that distinguishes one cell look from another, with colors already resolved to ARGB.
+StyleKey = namedtuple('StyleKey', [
+    'font_family', 'font_size', 'bold', 'italic', 'underline', 'strike', 'font_color', 'fill_color', 'text_align',
+])
+
+
+def _number(value, percent_scale):
+    """Parse a CSS number or percentage ('none' counts as 0), scaling percentages to percent_scale."""
+    if value == 'none':
+        return 0.0
+    if value.endswith('%'):
+        return float(value[:-1]) / 100 * percent_scale
+    return float(value)
+
+
+def _hue(value):
+    """Hue as a fraction of a turn."""
+    for unit, per_turn in (('grad', 400), ('turn', 1), ('rad', 6.283185307179586), ('deg', 360)):
+        if value.endswith(unit):
+            return float(value[:-len(unit)]) / per_turn % 1
+    return _number(value, 360) / 360 % 1
+
+
+def _opaque_argb(red, green, blue, alpha):
+    """Excel colors carry no usable alpha, so translucent colors are composited over white."""
+    alpha = min(max(alpha, 0.0), 1.0)
+    if alpha == 0:
+        return None
+    channels = (min(max(channel, 0.0), 255.0) * alpha + 255 * (1 - alpha) for channel in (red, green, blue))
+    return 'FF' + ''.join(f'{round(channel):02X}' for channel in channels)
+
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def html_color_to_openpyxl_argb(html_color):
+    """Resolve a CSS color to an opaque ARGB string, or None for transparent or unparseable colors.
+
+    Supports named colors, #rgb, #rgba, #rrggbb, #rrggbbaa, rgb()/rgba() and hsl()/hsla() in both the
+    comma (CSS Color 3) and space/slash (CSS Color 4) syntaxes, and transparent. Results are memoized
+    because reports reuse a handful of colors across every cell.
+    """
+    if not html_color:
+        return None
+
+    html_color = html_color.lower().strip()
+
+    if html_color.startswith('#'):
+        hex_val = html_color[1:]
+        if len(hex_val) in (3, 4):
+            hex_val = "".join([c*2 for c in hex_val])
+        if len(hex_val) not in (6, 8):
+            return None
+        try:
+            channels = [int(hex_val[i:i + 2], 16) for i in range(0, len(hex_val), 2)]
+        except ValueError:
+            return None
+        alpha = channels[3] / 255 if len(channels) == 4 else 1.0
+        return _opaque_argb(channels[0], channels[1], channels[2], alpha)
+
+    if html_color in NAMED_COLORS:
+        return NAMED_COLORS[html_color]
+
+    match = _COLOR_FUNCTION.fullmatch(html_color)
+    if not match:
+        return None
+    function, arguments = match.groups()
+    arguments = _COLOR_ARGUMENT_SEPARATOR.split(arguments.strip())
+    if len(arguments) not in (3, 4):
+        return None
+    try:
+        alpha = _number(arguments[3], 1) if len(arguments) == 4 else 1.0
+        if function.startswith('rgb'):
+            red, green, blue = (_number(argument, 255) for argument in arguments[:3])
+        else:
+            hue = _hue(arguments[0])
+            saturation = min(max(_number(arguments[1], 1), 0.0), 1.0)
+            lightness = min(max(_number(arguments[2], 1), 0.0), 1.0)
+            red, green, blue = (channel * 255 for channel in colorsys.hls_to_rgb(hue, lightness, saturation))
+    except ValueError:
+        return None
+    return _opaque_argb(red, green, blue, alpha)
+
+
+def _font_size_points(value):
+    value = value.lower()
+    try:
+        if value.endswith('px'):
+            # Convert px to points (1pt ≈ 1.33px)
+            return float(value[:-2]) / 1.33
+        if value.endswith('pt'):
+            return float(value[:-2])
+    except ValueError:
+        pass
+    return None
+
+
+def _is_bold(value):
+    value = value.lower()
+    if value in ('bold', 'bolder'):
+        return True
+    return value.isdigit() and int(value) >= 600
+
+
+@lru_cache(maxsize=CSS_CACHE_SIZE)
+def parse_style(style):
+    """Parse an inline style attribute into Declarations in a single pass; later declarations win.
+
+    Generated reports repeat the same style attribute thousands of times, so results are memoized on
+    the raw string.
+    """
+    background_color = color = font_family = font_size = None
+    text_align = 'general'
+    bold = italic = underline = strike = False
+
+    for declaration in style.split(';'):
+        name, sep, value = declaration.partition(':')
+        if not sep:
+            continue
+        name = name.strip().lower()
+        value = value.strip()
+        if value[-10:].lower() == '!important':
+            value = value[:-10].rstrip()
+
+        if name == 'background-color':
+            background_color = value or None
+        elif name == 'color':
+            color = value or None
+        elif name == 'text-align':
+            text_align = ALIGN_MAP.get(value.lower(), 'general')
+        elif name == 'font-family':
+            font_family = value.split(',')[0].strip().strip("'\"") or None
+        elif name == 'font-size':
+            font_size = _font_size_points(value)
+        elif name == 'font-weight':
+            bold = _is_bold(value)
+        elif name == 'font-style':
+            italic = value.lower() in ('italic', 'oblique')
+        elif name in ('text-decoration', 'text-decoration-line'):
+            value = value.lower()
+            underline = 'underline' in value
+            strike = 'line-through' in value
+
+    return Declarations(background_color, color, text_align, font_family, font_size, bold, italic, underline, strike)
+
+
+def cell_style_key(style, bgcolor=None, bold=False, italic=False):
+    """Resolve a cell's inline style plus its markup flags (<th>/<b>, <i>, bgcolor) to a StyleKey."""
+    declarations = parse_style(style)
+    return StyleKey(
+        font_family=declarations.font_family,
+        font_size=declarations.font_size,
+        bold=bool(declarations.bold or bold),
+        italic=bool(declarations.italic or italic),
+        underline=declarations.underline,
+        strike=declarations.strike,
+        font_color=html_color_to_openpyxl_argb(declarations.color),
+        fill_color=html_color_to_openpyxl_argb(bgcolor or declarations.background_color),
+        text_align=declarations.text_align,
+    )
+
+
+class StyleTable:
+    """Interns the cell looks of one document as small integer style ids.
+
+    Ids are handed out in first-seen order and index keys. Cells are looked up by their raw style
+    attribute and markup flags first, so a repeated look skips CSS parsing and color resolution
+    entirely.
+    """
+
+    __slots__ = ('keys', 'lookups', '_ids', '_cell_ids')
+
+    def __init__(self):
+        self.keys = []
+        self.lookups = 0
+        self._ids = {}
+        self._cell_ids = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, style_id):
+        return self.keys[style_id]
+
+    def intern(self, key):
+        style_id = self._ids.get(key)
+        if style_id is None:
+            style_id = self._ids[key] = len(self.keys)
+            self.keys.append(key)
+        return style_id
+
+    def cell_style_id(self, style, bgcolor=None, bold=False, italic=False):
+        self.lookups += 1
+        raw = (style, bgcolor, bold, italic)
+        style_id = self._cell_ids.get(raw)
+        if style_id is None:
+            style_id = self._cell_ids[raw] = self.intern(cell_style_key(style, bgcolor, bold, italic))
+        return style_id
+
+    def stats(self):
+        distinct = len(self.keys)
+        hits = self.lookups - distinct
+        prototypes = style_prototype.cache_info()
+        return {
+            'lookups': self.lookups,
+            'distinct': distinct,
+            'hits': hits,
+            'hit_rate': round(hits / self.lookups, 4) if self.lookups else 0.0,
+            'prototype_hits': prototypes.hits,
+            'prototype_misses': prototypes.misses,
+        }
+
+
+def style_stats(style_tables):
+    """StyleTable.stats() over the tables of several documents (the sheets of one workbook), where a
+    look they share counts as one distinct style."""
+    if len(style_tables) == 1:
+        return style_tables[0].stats()
+    combined = StyleTable()
+    for style_table in style_tables:
+        combined.lookups += style_table.lookups
+        for key in style_table.keys:
+            combined.intern(key)
+    return combined.stats()
+
+
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def style_prototype(key):
+    """Build the Font, Alignment and PatternFill for a style key once per process."""
+    alignment = Alignment(horizontal=key.text_align, vertical='center', wrap_text=True)
+    font = Font(
+        name=key.font_family if key.font_family else None,
+        size=key.font_size if key.font_size else None,
+        bold=key.bold,
+        italic=key.italic,
+        underline='single' if key.underline else None,
+        strike=key.strike,
+        color=key.font_color
+    )
+    fill = None
+    if key.fill_color:
+        try: fill = PatternFill(start_color=key.fill_color, end_color=key.fill_color, fill_type="solid")
+        except ValueError: fill = None
+    return font, alignment, fill
+
+
+class StyleRegistry:
+    """Turns the style ids of a StyleTable into NamedStyles of one workbook.
+
+    Each style id becomes a NamedStyle (font, alignment, fill and the default border) the first time a
+    cell uses it; every later cell with the same id just copies its style array, so openpyxl never has
+    to hash and dedupe per-cell style objects.
+
+    The sheets of a workbook each have a registry over their own StyleTable; given the same
+    named_styles dict, they share one NamedStyle per look instead of adding it once per sheet.
+    """
+
+    BORDER_STYLE = 'HTML Border'
+
+    def __init__(self, workbook, style_table, border=DEFAULT_BORDER, named_styles=None):
+        self.workbook = workbook
+        self.style_table = style_table
+        self.border = border
+        self._names = {}
+        self._arrays = {}
+        # StyleKey (or BORDER_STYLE) -> NamedStyle already added to the workbook
+        self._named_styles = named_styles if named_styles is not None else {}
+
+    def style_name(self, style_id):
+        name = self._names.get(style_id)
+        if name is None:
+            key = self.style_table[style_id]
+            style = self._named_styles.get(key)
+            if style is None:
+                font, alignment, fill = style_prototype(key)
+                style = self._named_styles[key] = NamedStyle(
+                    name=f'HTML {len(self._named_styles) + 1}', font=font, alignment=alignment,
+                    fill=fill or PatternFill(), border=self.border
+                )
+                self.workbook.add_named_style(style)
+            name = self._names[style_id] = style.name
+        return name
+
+    def style_array(self, style_id):
+        """The style array of style_name(style_id), which cells copy instead of being assigned the name.
+
+        Assigning a style by name makes openpyxl search the workbook's named styles for every cell.
+        """
+        array = self._arrays.get(style_id)
+        if array is None:
+            self.style_name(style_id)
+            array = self._arrays[style_id] = self._named_styles[self.style_table[style_id]].as_tuple()
+        return array
+
+    def border_style_name(self):
+        """Style for cells covered by a merge, which only carry the border."""
+        if self.BORDER_STYLE not in self._named_styles:
+            style = self._named_styles[self.BORDER_STYLE] = NamedStyle(
+                name=self.BORDER_STYLE, font=DEFAULT_FONT, border=self.border
+            )
+            self.workbook.add_named_style(style)
+        return self.BORDER_STYLE
+
+    def border_style_array(self):
+        """The style array of border_style_name(), which cells covered by a merge can copy directly.
+
+        Assigning a style by name makes openpyxl search the workbook's named styles for every cell;
+        merges cover whole blocks of cells, so those take a copy of this array instead.
+        """
+        self.border_style_name()
+        return self._named_styles[self.BORDER_STYLE].as_tuple()
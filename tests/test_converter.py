@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from openpyxl import load_workbook
+
+from converter import convert_to_excel
+
+# Rowspans that cross a colspan header, a trailing rowspan="0" and one that runs past its table.
+ROWSPANS = (
+    '<table><colgroup><col style="width: 100px"><col style="width: 80px"><col style="width: 80px">'
+    '<col style="width: 80px"></colgroup>'
+    '<tr><th rowspan="2">Region</th><th colspan="2">Sales</th><th rowspan="3">Note</th></tr>'
+    '<tr><th>Q1</th><th>Q2</th></tr>'
+    '<tr><td rowspan="2">North</td><td>1</td><td>2</td></tr>'
+    '<tr><td>3</td><td>4</td><td>x</td></tr>'
+    '<tr><td>South</td><td rowspan="0">5</td><td>6</td><td>y</td></tr>'
+    '<tr><td>East</td><td>7</td></tr>'
+    '</table>'
+    '<table><col style="width: 100px"><tr><td rowspan="5">clipped</td><td>a</td></tr><tr><td>b</td></tr></table>'
+)
+ROWSPAN_VALUES = [
+    ['Region', 'Sales', None, 'Note'],
+    [None, 'Q1', 'Q2', None],
+    ['North', '1', '2', None],
+    [None, '3', '4', 'x'],
+    ['South', '5', '6', 'y'],
+    ['East', None, '7', None],
+    [None, None, None, None],
+    ['clipped', 'a', None, None],
+    [None, 'b', None, None],
+]
+ROWSPAN_MERGES = ['A1:A2', 'A3:A4', 'A8:A9', 'B1:C1', 'B5:B6', 'D1:D3']
+
+
+def converted_sheet(html, **options):
+    output = io.BytesIO()
+    stats = convert_to_excel(html, output, **options)
+    output.seek(0)
+    return load_workbook(output).active, stats
+
+
+@pytest.mark.parametrize('engine', ['openpyxl', 'write_only'])
+@pytest.mark.parametrize('streaming', [False, True])
+def test_rowspans_place_cells_and_merge(engine, streaming):
+    worksheet, stats = converted_sheet(ROWSPANS, engine=engine, streaming=streaming)
+    assert [[cell.value for cell in row] for row in worksheet.iter_rows()] == ROWSPAN_VALUES
+    assert sorted(str(merge) for merge in worksheet.merged_cells.ranges) == ROWSPAN_MERGES
+    assert stats['merges'] == len(ROWSPAN_MERGES)
+    # Cells covered by a merge carry the border, like the cell the merge starts at.
+    assert worksheet['A2'].border.left.style == worksheet['A1'].border.left.style == 'thin'
+
+
+def test_rowspans_in_csv():
+    output = io.BytesIO()
+    convert_to_excel(ROWSPANS, output, engine='csv')
+    rows = output.getvalue().decode('utf-8').splitlines()
+    assert rows[:6] == ['Region,Sales,,Note', ',Q1,Q2,', 'North,1,2,', ',3,4,x', 'South,5,6,y', 'East,,7']
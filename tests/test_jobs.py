@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+
+import jobs
+import service
+from jobs import JobBroker, JobQueue, QueueFull
+
+TABLE = (b'<table><colgroup><col style="width: 80px"><col style="width: 40px"></colgroup>'
+         b'<tr><th>Name</th><th>Rows</th></tr><tr><td>a</td><td>1</td></tr><tr><td>b</td><td>2</td></tr></table>')
+
+
+class StubBroker(JobBroker):
+    """Keeps jobs in a dict and hands them out in order, without blocking, so tests claim them one by one."""
+
+    def __init__(self):
+        self.stored = {}
+        self.waiting = []
+        self.saves = 0
+
+    def submit(self, job):
+        self.stored[job.id] = job
+        self.waiting.append(job.id)
+
+    def claim(self, timeout):
+        return self.stored.get(self.waiting.pop(0)) if self.waiting else None
+
+    def get(self, job_id):
+        return self.stored.get(job_id)
+
+    def save(self, job):
+        self.stored[job.id] = job
+        self.saves += 1
+
+    def delete(self, job_id):
+        self.stored.pop(job_id, None)
+
+    def jobs(self):
+        return list(self.stored.values())
+
+    def queued(self):
+        return len(self.waiting)
+
+
+def write_result(job, progress):
+    with open(job.result_path, 'wb') as output:
+        output.write(b'workbook')
+    progress(3)
+    return {'rows': 3}
+
+
+def fail(job, progress):
+    progress(1)
+    with open(job.result_path, 'wb') as output:
+        output.write(b'partial')
+    raise ValueError('bad table')
+
+
+def queued_job(queue, filename='converted.xlsx'):
+    job = queue.create({}, filename)
+    with open(job.input_path, 'wb') as input_file:
+        input_file.write(TABLE)
+    queue.submit(job)
+    return job
+
+
+@pytest.fixture
+def broker():
+    return StubBroker()
+
+
+def test_job_runs_to_done(broker, tmp_path):
+    # No runner threads: the test claims and runs each job itself.
+    queue = JobQueue(broker, write_result, directory=str(tmp_path), runners=0)
+    job = queued_job(queue)
+    assert queue.get(job.id).status == jobs.QUEUED
+    assert broker.queued() == 1
+
+    queue._run(broker.claim(0))
+    job = queue.get(job.id)
+    assert job.status == jobs.DONE
+    assert job.stats == {'rows': 3}
+    assert job.rows_processed == 3
+    assert job.started is not None and job.finished is not None
+    assert broker.saves == 2  # once running, once finished
+    assert not os.path.exists(job.input_path)
+    with open(job.result_path, 'rb') as result:
+        assert result.read() == b'workbook'
+    assert queue.stats()['done'] == 1 and queue.stats()['completed'] == 1
+
+
+def test_failed_job_keeps_error_and_drops_result(broker, tmp_path):
+    queue = JobQueue(broker, fail, directory=str(tmp_path), runners=0)
+    job = queued_job(queue)
+    queue._run(broker.claim(0))
+    job = queue.get(job.id)
+    assert job.status == jobs.FAILED
+    assert job.error == 'bad table'
+    assert job.rows_processed == 1
+    assert not os.path.exists(job.result_path)
+    assert not os.path.exists(job.input_path)
+    assert queue.stats()['failures'] == 1
+
+
+def test_finished_jobs_expire_after_ttl(broker, tmp_path):
+    queue = JobQueue(broker, write_result, directory=str(tmp_path), ttl=60, runners=0)
+    job = queued_job(queue)
+    queue._run(broker.claim(0))
+    assert queue.expires_at(job) is not None
+
+    job.finished -= 61
+    queue.expire()
+    assert queue.get(job.id) is None
+    assert broker.jobs() == []
+    assert os.listdir(tmp_path) == []
+    assert queue.stats()['expired'] == 1
+
+
+def test_queue_full(broker, tmp_path):
+    queue = JobQueue(broker, write_result, directory=str(tmp_path), runners=0, max_queued=1)
+    queued_job(queue)
+    with pytest.raises(QueueFull):
+        queue.create({}, 'converted.xlsx')
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = Flask(__name__)
+    service.init_app(app)
+    app.config.update(JOB_DIR=str(tmp_path / 'jobs'), RESULT_CACHE_DIR=str(tmp_path / 'cache'),
+                      CONVERSION_WORKERS=0, JOB_RUNNERS=1)
+    return app.test_client()
+
+
+def wait_for_job(client, status_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(status_url).get_json()
+        if status['status'] in (jobs.DONE, jobs.FAILED) or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def test_job_endpoints(client):
+    response = client.post('/api/jobs', data=TABLE, content_type='text/html')
+    assert response.status_code == 202
+    submitted = response.get_json()
+    assert response.headers['Location'] == submitted['status_url'] == f'/api/jobs/{submitted["job_id"]}'
+    assert submitted['result_url'] == f'/api/jobs/{submitted["job_id"]}/result'
+
+    status = wait_for_job(client, submitted['status_url'])
+    assert status['status'] == jobs.DONE
+    assert status['rows_processed'] == status['stats']['rows'] == 3
+    assert status['result_url'] == submitted['result_url']
+    assert status['expires_at'] is not None
+
+    result = client.get(submitted['result_url'])
+    assert result.status_code == 200
+    assert result.data[:2] == b'PK'
+    assert 'X-Conversion-Stats' in result.headers
+
+
+def test_job_result_before_done_and_unknown_jobs(client):
+    app = client.application
+    with app.app_context():
+        queue = service.job_queue()
+        job = queue.create({}, 'converted.xlsx')
+        queue.broker.submit(job)  # stored and queued, but never claimed: no runner is started
+    result = client.get(f'/api/jobs/{job.id}/result')
+    assert result.status_code == 409
+    assert result.get_json()['status'] == jobs.QUEUED
+
+    assert client.get('/api/jobs/unknown').status_code == 404
+    assert client.get('/api/jobs/unknown/result').status_code == 404
+
+
+def test_rejected_job_bodies(client):
+    response = client.post('/api/jobs', json={'html_content': '!!!'})
+    assert response.status_code == 400
+    response = client.post('/api/jobs', data=b'', content_type='text/html')
+    assert response.status_code == 400
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import layoutcache
+from layoutcache import LayoutCache
+from model import dom_document, top_level_tables
+from parsers import parse_html
+
+TEMPLATE = ('<table><colgroup><col style="width: 100px"><col style="width: 60px"></colgroup>'
+            '<tr style="color: #333"><th colspan="2">{title}</th></tr>'
+            '<tr><td rowspan="2"><b>{name}</b></td><td style="text-align: right">{value}</td></tr>'
+            '<tr><td bgcolor="#eeeeee"><i>{note}</i></td></tr></table>')
+
+
+def laid_out(html, parser):
+    document = dom_document(top_level_tables(parse_html(html, parser)))
+    rows = [(list(row.columns), list(row.spans), [document.styles[style_id] for style_id in row.style_ids],
+             row.rowspans, row.covered, row.texts) for table in document.tables for row in table.rows]
+    return rows, document.layouts
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LayoutCache(max_entries=16)
+    monkeypatch.setattr(layoutcache, '_layout_cache', cache)
+    return cache
+
+
+@pytest.mark.parametrize('parser', ['lexbor', 'lxml', 'html.parser'])
+def test_hit_lays_out_like_a_miss(cache, parser):
+    first = TEMPLATE.format(title='Q1', name='North', value='12', note='est.')
+    second = TEMPLATE.format(title='Q2', name='South', value='7', note='final')
+    rows, layouts = laid_out(first, parser)
+    assert layouts == {'hits': 0, 'misses': 1}
+    cached, layouts = laid_out(second, parser)
+    assert layouts == {'hits': 1, 'misses': 0}
+
+    cache.max_entries = 0
+    uncached, layouts = laid_out(second, parser)
+    assert layouts is None
+    assert cached == uncached
+    assert [row[:5] for row in cached] == [row[:5] for row in rows]
+
+
+def test_markup_change_misses(cache):
+    laid_out(TEMPLATE.format(title='Q1', name='North', value='12', note='est.'), 'lxml')
+    _, layouts = laid_out(TEMPLATE.replace('<b>', '<i>').replace('</b>', '</i>').format(
+        title='Q1', name='North', value='12', note='est.'), 'lxml')
+    assert layouts == {'hits': 0, 'misses': 1}
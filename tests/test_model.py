@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from model import dom_cells, table_rows, top_level_tables
+from parsers import iter_table_events, parse_html
+
+NESTED = (
+    '<html><body><p>Intro</p>'
+    '<table><colgroup><col style="width: 100px"><col style="width: 80px"></colgroup>'
+    '<thead><tr><th>H1</th><th>H2</th></tr></thead>'
+    '<tbody><tr><td>a</td><td>b<table><tr><td>x</td><td><b>y<table><tr><td>z</td></tr></table></b></td></tr>'
+    '</table></td></tr>'
+    '<tr><td>c</td><td>d</td></tr></tbody></table>'
+    '<div><table><col style="width: 100px"><col style="width: 80px"><tr><td>second</td><td>t</td></tr></table></div>'
+    '</body></html>'
+)
+# Nested tables stay inside the cell that holds them: their rows are not rows of the outer table.
+NESTED_TEXTS = [[['H1', 'H2'], ['a', 'bxyz'], ['c', 'd']], [['second', 't']]]
+
+
+@pytest.mark.parametrize('parser', ['lexbor', 'lxml', 'html.parser', 'html5lib'])
+def test_nested_tables_are_read_once(parser):
+    tables = top_level_tables(parse_html(NESTED, parser))
+    texts = [[[cell.text for cell in dom_cells(row)] for row in table_rows(table)] for table in tables]
+    assert texts == NESTED_TEXTS
+    # The <b> inside the nested table still makes the cell holding it bold.
+    assert dom_cells(table_rows(tables[0])[1])[1].bold
+
+
+def test_nested_tables_streamed():
+    texts = [[], []]
+    for event in iter_table_events(NESTED):
+        if event[0] == 'row':
+            texts[event[1]].append([cell.text for cell in event[2]])
+    assert texts == NESTED_TEXTS
@@ -0,0 +1,45 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import converter
+import parallel
+from parallel import SharedSource, forget_parse_pool, parse_pool
+
+
+def test_empty_file_maps_to_empty_view(tmp_path):
+    path = tmp_path / 'empty.html'
+    path.write_bytes(b'')
+    with open(path, 'rb') as source:
+        shared = SharedSource.share(source)
+    with shared.mapped() as view:
+        assert bytes(view) == b''
+    shared.close()
+
+
+def test_shared_bytes_round_trip():
+    for data in (b'', b'<table><tr><td>x</td></tr></table>'):
+        shared = SharedSource.share(data)
+        try:
+            with shared.mapped() as view:
+                assert bytes(view) == data
+        finally:
+            shared.close()
+
+
+def test_conversions_share_one_parse_pool(monkeypatch):
+    monkeypatch.setattr(parallel, 'DEFAULT_PARSE_WORKERS', 2)
+    html = ('<table><colgroup><col style="width: 50px"></colgroup><tr><td>a</td></tr></table>'
+            '<table><colgroup><col style="width: 90px"></colgroup><tr><td>b</td></tr></table>')
+    pool = parse_pool()
+    try:
+        for _ in range(2):
+            stats = converter.convert_to_excel(html, io.BytesIO(), sheets='table')
+            assert stats['sheets'] == 2
+        assert parse_pool() is pool
+    finally:
+        forget_parse_pool(pool)
+    assert parse_pool() is not pool
+    forget_parse_pool(parse_pool())
@@ -0,0 +1,70 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import converter
+from parsers import DEFAULT_PARSER, colspan_value, iter_table_events, parse_html, resolve_parser
+
+CELL_TEXT = 'hello world and more words'
+TABLE = ('<table><colgroup><col style="width: 80px"><col style="width: 80px"></colgroup>'
+         f'<tr><td>{CELL_TEXT}</td><td> a <b>bold</b> b <!-- c --> d&amp; e </td></tr></table>')
+
+
+def streamed_texts(html, chunk_size):
+    return [cell.text for event in iter_table_events(html, chunk_size) if event[0] == 'row' for cell in event[2]]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 15, 64 * 1024])
+def test_cell_text_split_across_chunks(chunk_size):
+    texts = streamed_texts(TABLE, chunk_size)
+    assert texts[0] == CELL_TEXT
+    # Each text node is stripped on its own and the pieces joined, as get_text(strip=True) does.
+    assert texts == [cell.get_text(strip=True) for cell in parse_html(TABLE, 'html.parser').find_all('td')]
+
+
+# A cell outside any <tr>: lexbor and html5lib give it a row, as the HTML spec does; the others drop it.
+STRAY_CELL = ('<table><colgroup><col style="width: 50px"></colgroup>'
+              '<td>stray</td><tr><td>kept</td></tr></table>')
+
+
+@pytest.mark.parametrize('parser, rows', [
+    ('lexbor', 2), ('html5lib', 2), ('lxml', 1), ('html.parser', 1), (None, 1),
+])
+def test_stray_cell_by_backend(parser, rows):
+    output = io.BytesIO()
+    stats = converter.convert_to_excel(STRAY_CELL, output, parser=parser, engine='csv')
+    assert stats['rows'] == rows
+    assert output.getvalue().decode('utf-8').split() == ['stray', 'kept'][2 - rows:]
+
+
+def test_default_parser_reads_like_the_streaming_converter():
+    assert resolve_parser(None) == DEFAULT_PARSER == 'html.parser'
+    dom, streamed = io.BytesIO(), io.BytesIO()
+    converter.convert_to_excel(STRAY_CELL, dom, engine='csv', streaming=False)
+    converter.convert_to_excel(STRAY_CELL, streamed, engine='csv', streaming=True)
+    assert dom.getvalue() == streamed.getvalue()
+
+
+@pytest.mark.parametrize('value, colspan', [
+    (None, 1), ('', 1), ('x', 1), ('2.5', 1), ('0', 1), ('-3', 1), (' 3 ', 3), ('3', 3), ('99999', 1000),
+])
+def test_colspan_value(value, colspan):
+    assert colspan_value(value) == colspan
+
+
+@pytest.mark.parametrize('parser', ['lexbor', 'lxml', 'html.parser', 'html5lib', 'streaming'])
+def test_bad_colspan_spans_one_column(parser):
+    html = ('<table><colgroup><col style="width: 50px"><col style="width: 50px"></colgroup>'
+            '<tr><td colspan="x">a</td><td colspan="0">b</td></tr></table>')
+    if parser == 'streaming':
+        cells = [cell for event in iter_table_events(html) if event[0] == 'row' for cell in event[2]]
+        assert [cell.colspan for cell in cells] == [1, 1]
+        return
+    output = io.BytesIO()
+    stats = converter.convert_to_excel(html, output, parser=parser, engine='csv')
+    assert stats['rows'] == 1
+    assert output.getvalue().decode('utf-8').split() == ['a,b']
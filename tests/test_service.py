@@ -0,0 +1,199 @@
+import base64
+import io
+import json
+import os
+import re
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+
+import service
+from metrics import METRIC_PREFIX
+from executor import PoolBusy
+
+TABLE = (b'<table><colgroup><col style="width: 80px"><col style="width: 40px"></colgroup>'
+         b'<tr><th>Name</th><th>Rows</th></tr><tr><td>a</td><td>1</td></tr></table>')
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    service.init_app(app)
+    app.config.update(RESULT_CACHE_DIR=str(tmp_path / 'cache'), JOB_DIR=str(tmp_path / 'jobs'),
+                      PROFILE_DIR=str(tmp_path / 'profiles'), CONVERSION_WORKERS=0)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class BusyPool:
+    """A ConversionPool whose workers and queue are all taken."""
+
+    workers = 1
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+
+    def convert(self, *args, **kwargs):
+        raise PoolBusy(self.retry_after)
+
+    def stats(self):
+        return {}
+
+# One sample of the Prometheus text format: a name, optional labels and a number.
+SAMPLE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{((?:[a-zA-Z_][a-zA-Z0-9_]*="[^"]*",?)*)\})? (\S+)')
+
+
+def scrape(client):
+    """The samples of /metrics as {(name, labels): value}, checking the exposition format on the way."""
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain' and response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert body.endswith('\n')
+    types = {}
+    samples = {}
+    for line in body.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert kind in ('counter', 'gauge', 'histogram')
+            types[name] = kind
+            continue
+        if line.startswith('# HELP '):
+            continue
+        match = SAMPLE.fullmatch(line)
+        assert match, line
+        name, labels, value = match.groups()
+        family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in types else name
+        assert family in types, f'{name} has no TYPE line before it'
+        samples[name, labels or ''] = float(value)
+    return types, samples
+
+
+def test_etag_and_not_modified(client):
+    first = client.post('/api/convert?engine=csv', data=TABLE, content_type='text/html')
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS'
+    etag = first.headers['ETag']
+
+    again = client.post('/api/convert?engine=csv', data=TABLE, content_type='text/html')
+    assert again.headers['X-Cache'] == 'HIT'
+    assert again.headers['ETag'] == etag
+    assert again.data == first.data
+
+    cached = client.post('/api/convert?engine=csv', data=TABLE, content_type='text/html',
+                         headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.data == b''
+
+    # The options that shape the output are part of the key.
+    other = client.post('/api/convert', data=TABLE, content_type='text/html', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
+
+
+def test_json_variant_etag(client):
+    body = {'html_content': base64.b64encode(TABLE).decode('ascii')}
+    first = client.post('/api/convert', json=body)
+    assert first.status_code == 200 and first.get_json()['success']
+    cached = client.post('/api/convert', json=body, headers={'If-None-Match': first.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_busy_pool_answers_503_with_retry_after(app, client, monkeypatch):
+    app.config['CONVERSION_RETRY_AFTER'] = 7
+    monkeypatch.setattr(service, 'conversion_pool', lambda: BusyPool(7))
+    for response in (client.post('/api/convert', data=TABLE, content_type='text/html'),
+                     client.post('/api/convert', json={'html_content': base64.b64encode(TABLE).decode('ascii')})):
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '7'
+        assert response.get_json()['retry_after'] == 7
+    # Nothing was converted, so nothing was cached either.
+    assert client.post('/api/convert', data=TABLE, content_type='text/html').status_code == 503
+
+
+def test_batch_zip_manifest(client):
+    upload = io.BytesIO()
+    with zipfile.ZipFile(upload, 'w') as archive:
+        archive.writestr('a.html', TABLE)
+        archive.writestr('reports/b.htm', TABLE.replace(b'>a<', b'>b<'))
+        archive.writestr('notes.txt', 'not a report')
+        archive.writestr('broken.html', b'\xff\xfe<table>')
+    response = client.post('/api/batch?engine=csv', data=upload.getvalue(), content_type='application/zip')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        names = archive.namelist()
+        manifest = json.loads(archive.read('manifest.json'))
+        assert archive.read('a.csv').decode('utf-8').splitlines() == ['Name,Rows', 'a,1']
+    assert names[-1] == 'manifest.json'
+    assert sorted(names) == ['a.csv', 'manifest.json', 'reports/b.csv']
+    assert (manifest['converted'], manifest['failed'], manifest['skipped']) == (2, 1, 1)
+    files = {record['source']: record for record in manifest['files']}
+    assert files['a.html']['status'] == 'ok' and files['a.html']['output'] == 'a.csv'
+    assert files['a.html']['stats']['rows'] == 2 and files['a.html']['bytes'] > 0
+    assert files['reports/b.htm']['output'] == 'reports/b.csv'
+    assert files['notes.txt'] == {'source': 'notes.txt', 'status': 'skipped', 'error': 'Not an HTML file'}
+    assert files['broken.html']['status'] == 'error' and files['broken.html']['error']
+
+
+def test_batch_rejects_bad_archives(client):
+    assert client.post('/api/batch', data=b'not a zip', content_type='application/zip').status_code == 400
+    assert client.post('/api/batch', data=b'<table>', content_type='text/html').status_code == 400
+
+
+def test_metrics_exposition(client):
+    types, samples = scrape(client)
+    assert samples[METRIC_PREFIX + 'conversions_total', 'outcome="ok"'] == 0
+
+    assert client.post('/api/convert?engine=csv', data=TABLE, content_type='text/html').status_code == 200
+    types, samples = scrape(client)
+    assert types[METRIC_PREFIX + 'conversions_total'] == 'counter'
+    assert types[METRIC_PREFIX + 'stage_duration_seconds'] == 'histogram'
+    assert samples[METRIC_PREFIX + 'conversions_total', 'outcome="ok"'] == 1
+    assert samples[METRIC_PREFIX + 'conversion_duration_seconds_count', ''] == 1
+    assert samples[METRIC_PREFIX + 'stage_duration_seconds_count', 'stage="parse"'] == 1
+    assert types[METRIC_PREFIX + 'result_cache_misses'] == 'gauge'
+
+    # Histogram buckets are cumulative and end in +Inf, which equals the count.
+    buckets = [value for (name, labels), value in samples.items()
+               if name == METRIC_PREFIX + 'stage_duration_seconds_bucket' and labels.startswith('stage="parse"')]
+    assert buckets == sorted(buckets)
+    assert samples[METRIC_PREFIX + 'stage_duration_seconds_bucket', 'stage="parse",le="+Inf"'] == 1
+
+
+def test_profiling_token_is_checked(app, client):
+    body = {'html_content': base64.b64encode(TABLE).decode('ascii')}
+    profile_id = '0' * 32
+
+    # Profiling is off without PROFILING_TOKEN: any token is refused.
+    assert app.config['PROFILING_TOKEN'] is None
+    assert client.post('/api/convert', json=body, headers={'X-Profile-Token': 'guess'}).status_code == 403
+    assert client.get(f'/api/profiles/{profile_id}', headers={'X-Profile-Token': 'guess'}).status_code == 403
+
+    app.config['PROFILING_TOKEN'] = 'secret'
+    for headers in ({'X-Profile-Token': 'wrong'}, {}):
+        assert client.get(f'/api/profiles/{profile_id}', headers=headers).status_code == 403
+    for url, headers in (('/api/convert', {'X-Profile-Token': 'wrong'}), ('/api/convert?profile=wrong', {})):
+        response = client.post(url, json=body, headers=headers)
+        assert response.status_code == 403
+        assert response.get_json()['error'] == 'Forbidden'
+    assert client.post('/api/convert', data=TABLE, content_type='text/html',
+                       headers={'X-Profile-Token': 'wrong'}).status_code == 403
+
+    # The right token profiles the conversion, and only that token fetches the profile.
+    response = client.post('/api/convert', json=body, headers={'X-Profile-Token': 'secret'})
+    assert response.status_code == 200
+    profile = response.get_json()['stats']['profile']
+    assert client.get(profile['url'], headers={'X-Profile-Token': 'wrong'}).status_code == 403
+    artifact = client.get(profile['url'], headers={'X-Profile-Token': 'secret'})
+    assert artifact.status_code == 200 and artifact.data
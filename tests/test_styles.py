@@ -0,0 +1,73 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from styles import cell_style_key, html_color_to_openpyxl_argb, parse_style
+
+
+@pytest.mark.parametrize('style, bold', [
+    ('font-weight:700', True),
+    ('font-weight: 600', True),
+    ('font-weight:bold', True),
+    ('FONT-WEIGHT: Bolder', True),
+    ('font-weight: 400', False),
+    ('font-weight: normal', False),
+    ('font-weight: bold; font-weight: 300', False),
+])
+def test_font_weight(style, bold):
+    assert parse_style(style).bold is bold
+
+
+def test_important_is_stripped():
+    declarations = parse_style('color: red !important; font-weight:700!important;text-align: right ! important;'
+                               'font-size: 12pt !IMPORTANT')
+    assert declarations.color == 'red'
+    assert declarations.bold is True
+    assert declarations.font_size == 12.0
+    # Only '!important' as one word is recognised; anything else leaves the value unparseable.
+    assert declarations.text_align == 'general'
+
+
+def test_single_pass_fields():
+    declarations = parse_style("background-color:#fff;font-family: 'Arial', sans-serif; font-style: italic;"
+                               "text-decoration: underline line-through; font-size: 16px; bogus; :x")
+    assert declarations.background_color == '#fff'
+    assert declarations.font_family == 'Arial'
+    assert declarations.italic and declarations.underline and declarations.strike
+    assert declarations.font_size == pytest.approx(16 / 1.33)
+
+
+def test_markup_flags_and_row_style():
+    # A cell's own declarations come after its row's (parsers.cell_style) and win.
+    key = cell_style_key('font-weight: bold;font-weight: 400', bold=True, italic=True)
+    assert key.bold and key.italic
+    assert cell_style_key('color: blue;color: red').font_color == 'FFFF0000'
+
+
+@pytest.mark.parametrize('color, argb', [
+    ('rgb(255, 0, 0)', 'FFFF0000'),
+    ('rgb(255 0 0)', 'FFFF0000'),
+    ('rgb(100%, 0%, 0%)', 'FFFF0000'),
+    ('rgba(255, 0, 0, 0.5)', 'FFFF8080'),
+    ('rgb(255 0 0 / 50%)', 'FFFF8080'),
+    ('hsl(120, 100%, 50%)', 'FF00FF00'),
+    ('hsl(120deg 100% 50%)', 'FF00FF00'),
+    ('hsla(240, 100%, 50%, 0.5)', 'FF8080FF'),
+    ('hsl(240 100% 50% / 0.5)', 'FF8080FF'),
+    ('#FF0000', 'FFFF0000'),
+    ('#f00', 'FFFF0000'),
+    ('#ff000080', 'FFFF7F7F'),
+    ('#f008', 'FFFF7777'),
+    (' Red ', 'FFFF0000'),
+    ('RebeccaPurple', 'FF663399'),
+])
+def test_color_syntaxes(color, argb):
+    assert html_color_to_openpyxl_argb(color) == argb
+
+
+@pytest.mark.parametrize('color', ['transparent', 'rgba(0, 0, 0, 0)', '#0000', 'rgb(1, 2)', '#12345', 'nocolor', '', None])
+def test_transparent_and_invalid_colors(color):
+    assert html_color_to_openpyxl_argb(color) is None
@@ -0,0 +1,53 @@
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from textwidth import (CELL_PADDING_PX, DEFAULT_FONT_SIZE, PX_PER_POINT, UNITS_PER_EM, _GLYPH_UNITS, column_pixels,
+                       font_index, line_counts)
+
+
+def word_px(word, font=None, size=DEFAULT_FONT_SIZE):
+    units = _GLYPH_UNITS[font_index(font)]
+    return sum(int(units[ord(char)]) for char in word) * size * PX_PER_POINT / UNITS_PER_EM
+
+
+def usable_px(width_units):
+    return float(column_pixels(width_units)) - CELL_PADDING_PX
+
+
+@pytest.mark.parametrize('text, lines', [
+    ('', 1),
+    ('\n', 2),
+    ('a\n', 2),
+    ('a\nb\nc', 3),
+    ('one two\n\nthree', 3),
+])
+def test_explicit_newlines(text, lines):
+    assert line_counts([text], 20.0).tolist() == [lines]
+
+
+def test_over_long_word_breaks_across_lines():
+    word = 'x' * 200
+    assert line_counts([word], 5.0).tolist() == [math.ceil(word_px(word) / usable_px(5.0))]
+
+
+def test_over_long_word_between_short_ones():
+    # 'see' fills the first line, the long word starts a new one and spills over six, and 'end' fits
+    # after the end of it.
+    word = 'x' * 60
+    assert math.ceil(word_px(word) / usable_px(10.0)) == 6
+    assert line_counts([f'see {word} end'], 10.0).tolist() == [7]
+    # Each newline-separated segment is wrapped on its own.
+    assert line_counts([f'{word}\n{word}'], 10.0).tolist() == [12]
+
+
+def test_batch_with_per_text_fonts():
+    texts = ['short', 'Total revenue by region and quarter', 'x' * 200, 'a\nb']
+    fonts = [font_index('Calibri'), font_index('Arial'), font_index('Arial'), font_index('Times New Roman')]
+    lines = line_counts(texts, [20.0, 10.0, 5.0, 20.0], fonts=fonts, sizes=11.0)
+    assert lines.tolist() == [1, 5, math.ceil(word_px('x' * 200, 'Arial') / usable_px(5.0)), 2]
+    assert line_counts([], 10.0).tolist() == []
@@ -0,0 +1,256 @@
+from array import array
+from operator import itemgetter
+from functools import lru_cache
+
+import numpy as np
+
+# Advance widths of the printable ASCII glyphs (space through '~') in 1/1000 em, per font.
+_GLYPH_WIDTHS = {
+    'calibri': (
+        '226 326 401 498 507 715 682 221 303 303 498 498 250 306 252 386 '
+        '507 507 507 507 507 507 507 507 507 507 268 268 498 498 498 463 '
+        '894 579 544 533 615 488 459 631 623 252 319 520 420 855 646 662 '
+        '517 673 543 459 487 642 567 890 519 487 468 307 386 307 498 498 '
+        '291 479 525 423 525 498 305 471 525 230 239 455 230 799 525 527 '
+        '525 525 349 391 335 525 452 715 433 453 395 314 460 314 498'
+    ),
+    'arial': (
+        '278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 '
+        '556 556 556 556 556 556 556 556 556 556 278 278 584 584 584 556 '
+        '1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 '
+        '667 778 722 667 611 722 667 944 667 667 611 278 278 278 469 556 '
+        '333 556 556 500 556 556 278 556 556 222 222 500 222 833 556 556 '
+        '556 556 333 500 278 556 500 722 500 500 500 334 260 334 584'
+    ),
+    'times new roman': (
+        '250 333 408 500 500 833 778 180 333 333 500 564 250 333 250 278 '
+        '500 500 500 500 500 500 500 500 500 500 278 278 564 564 564 444 '
+        '921 722 667 667 722 611 556 722 722 333 389 722 611 889 722 722 '
+        '556 722 667 556 611 722 722 944 722 722 611 333 278 333 469 500 '
+        '333 444 500 444 500 444 333 500 500 278 278 500 278 778 500 500 '
+        '500 500 333 389 278 500 500 722 500 500 444 480 200 480 541'
+    ),
+}
+FONT_ALIASES = {
+    'helvetica': 'arial', 'sans-serif': 'arial', 'verdana': 'arial', 'tahoma': 'arial',
+    'times': 'times new roman', 'serif': 'times new roman', 'georgia': 'times new roman',
+}
+DEFAULT_FONT = 'calibri'
+DEFAULT_FONT_SIZE = 11.0
+BOLD_WIDTH_FACTOR = 1.08
+WIDE_GLYPH_START = 0x2E80  # CJK and other full-width scripts take a full em
+
+# Excel column width units are counts of the default font's max digit width (7 px for Calibri 11),
+# plus 5 px of gridline and padding; text gets the column minus a little padding on either side.
+MAX_DIGIT_WIDTH_PX = 7
+COLUMN_PADDING_PX = 5
+CELL_PADDING_PX = 4
+PX_PER_POINT = 96 / 72
+
+# Rows are at least one default line tall; larger fonts need proportionally taller lines.
+POINTS_PER_LINE = 15.0
+LINE_HEIGHT_RATIO = POINTS_PER_LINE / DEFAULT_FONT_SIZE
+
+# Wrapping at spaces leaves the end of each wrapped line empty, on average about half a word and a
+# space. Segments are estimated with that loss, except those whose average word takes up more than
+# EXACT_WRAP_WORD_SHARE of the line: there single words decide where lines break, so they are wrapped
+# word by word.
+WRAP_LOSS_WORDS = 0.5
+EXACT_WRAP_WORD_SHARE = 0.5
+
+FONTS = tuple(_GLYPH_WIDTHS)
+
+
+# Glyph widths are quantized to 1/250 em so that every width fits in a byte; the widest ASCII glyph
+# ('@' in Arial, 1.015 em) is 254 units. Past ASCII, narrow scripts get the font's average lowercase
+# width and wide ones a full em.
+UNITS_PER_EM = 250
+_AVERAGE_GLYPH = 128
+_WIDE_GLYPH = 129
+
+
+def _width_tables():
+    """Per font, a bytes.translate table for ASCII text and a uint8 array indexed by glyph class."""
+    translate_tables = []
+    glyph_units = np.zeros((len(FONTS), _WIDE_GLYPH + 1), dtype=np.uint8)
+    for index, font in enumerate(FONTS):
+        widths = np.array(_GLYPH_WIDTHS[font].split(), dtype=np.float64) * UNITS_PER_EM / 1000
+        lowercase_average = widths[ord('a') - 32:ord('z') - 31].mean()
+        glyph_units[index, :] = round(lowercase_average)
+        glyph_units[index, 32:127] = np.round(widths)
+        # NUL separates texts and a newline ends a wrapped segment; neither takes up any width.
+        glyph_units[index, [0, 10]] = 0
+        glyph_units[index, _WIDE_GLYPH] = UNITS_PER_EM
+        translate_tables.append(bytes(glyph_units[index, :128].tolist()) + bytes(128))
+    return translate_tables, glyph_units
+
+
+_TRANSLATE_TABLES, _GLYPH_UNITS = _width_tables()
+
+
+@lru_cache(maxsize=256)
+def font_index(font_family):
+    """Index of the glyph table used for a font family; unknown fonts are measured as Calibri."""
+    name = (font_family or DEFAULT_FONT).lower()
+    name = FONT_ALIASES.get(name, name)
+    return FONTS.index(name) if name in _GLYPH_WIDTHS else FONTS.index(DEFAULT_FONT)
+
+
+def column_pixels(width_units):
+    return np.asarray(width_units, dtype=np.float64) * MAX_DIGIT_WIDTH_PX + COLUMN_PADDING_PX
+
+
+def _font_line_counts(texts, font, usable_px, scale):
+    """line_counts for texts that all use one font; scale converts glyph units to pixels per text."""
+    # Join everything into one array: NUL separates (and, appended, terminates) texts, and NUL or a
+    # newline ends a segment, so wrapping restarts at every explicit line break. Both are measured as
+    # zero width, which is how the breaks are found below.
+    joined = '\x00'.join(texts) + '\x00'
+    if joined.isascii():
+        data = joined.encode('ascii')
+        codes = np.frombuffer(data, dtype=np.uint8)
+        units = np.frombuffer(data.translate(_TRANSLATE_TABLES[font]), dtype=np.uint8)
+    else:
+        codes = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+        glyphs = np.minimum(codes, _AVERAGE_GLYPH)
+        glyphs[codes >= WIDE_GLYPH_START] = _WIDE_GLYPH
+        units = _GLYPH_UNITS[font].take(glyphs)
+
+    breaks = np.flatnonzero(units == 0)
+    segment_starts = np.concatenate(([0], breaks[:-1] + 1))
+    segment_text = np.concatenate(([0], np.cumsum(codes[breaks[:-1]] == 0)))
+    # An empty segment starts on its own break, so it sums to zero like any other.
+    segment_px = np.add.reduceat(units, segment_starts, dtype=np.float64) * scale[segment_text]
+    segment_lines = np.ones(len(segment_starts))
+    overflowing = segment_px > usable_px[segment_text]
+    if overflowing.any():
+        texts = segment_text[overflowing]
+        segment_lines[overflowing] = _wrapped_lines(
+            codes, units, segment_starts[overflowing], breaks[overflowing], segment_px[overflowing],
+            usable_px[texts], scale[texts] * float(_GLYPH_UNITS[font, 32]), scale[texts],
+        )
+    return np.bincount(segment_text, weights=segment_lines, minlength=len(usable_px)).astype(np.int64)
+
+
+def _wrapped_lines(codes, units, starts, ends, segment_px, usable_px, space_px, scale):
+    """Lines of segments wider than their usable width when wrapped at their spaces.
+
+    The segments are units[starts:ends], with per-segment width, usable width, space width and scale.
+    Segments whose average word takes up more than EXACT_WRAP_WORD_SHARE of the line are wrapped word
+    by word; the rest are estimated.
+    """
+    # Summed over [start, end) pairs; the sums over the gaps between them are dropped.
+    words = np.add.reduceat(codes == 32, np.column_stack((starts, ends)).ravel(), dtype=np.int64)[::2] + 1
+    word_px = segment_px - (words - 1) * space_px
+
+    loss = WRAP_LOSS_WORDS * (word_px / words + space_px)
+    lines = np.ceil((segment_px + space_px) / (usable_px + space_px - loss))
+    exact = word_px > EXACT_WRAP_WORD_SHARE * usable_px * words
+    if exact.any():
+        lines[exact] = _greedy_lines(codes, units, starts[exact], ends[exact], words[exact],
+                                     usable_px[exact], space_px[exact], scale[exact])
+    return lines
+
+
+def _greedy_lines(codes, units, starts, ends, words, usable_px, space_px, scale):
+    """Lines of segments wrapped word by word, as Excel wraps them.
+
+    A word moves to the next line when it does not fit after the one before it; a word longer than a
+    whole line is broken across lines. The segments are units[starts:ends], with per-segment word
+    counts, usable_px, space_px and scale. The wrap runs for all of them at once, one word position at
+    a time, so its Python loop is as long as the most words in one segment.
+    """
+    # Gather the segments' characters, each with the break that ends it, and measure their words up
+    # to and including the space or break after each; spaces are measured as zero width here.
+    lengths = ends - starts + 1
+    offsets = np.cumsum(lengths) - lengths
+    chars = np.repeat(starts - offsets, lengths) + np.arange(offsets[-1] + lengths[-1])
+    segment_units = units[chars]
+    segment_units[codes[chars] == 32] = 0
+    word_ends = np.flatnonzero(segment_units == 0)
+    widths = np.add.reduceat(segment_units, np.concatenate(([0], word_ends[:-1] + 1)), dtype=np.uint32)
+    word_px = widths * np.repeat(scale, words)
+
+    offsets = np.cumsum(words) - words
+    used = np.zeros(len(words))
+    lines = np.ones(len(words))
+    segments = np.arange(len(words))
+    rank = 0
+    while len(segments):
+        width = word_px[offsets[segments] + rank]
+        line_used = used[segments]
+        usable = usable_px[segments]
+        # Runs of spaces leave empty words, which neither take up room nor wrap.
+        spaced = np.where((line_used > 0) & (width > 0), space_px[segments], 0.0)
+        wraps = (spaced > 0) & (line_used + spaced + width > usable)
+        line_used = np.where(wraps, 0.0, line_used + spaced) + width
+        broken = np.maximum(np.ceil(line_used / usable) - 1, 0)  # lines a too-long word spills onto
+        lines[segments] += wraps + broken
+        used[segments] = line_used - broken * usable
+        rank += 1
+        segments = segments[words[segments] > rank]
+    return lines
+
+
+def line_counts(texts, width_units, fonts=None, sizes=None, bold=None):
+    """Estimate how many wrapped lines each text needs, for a whole batch of cells in one call.
+
+    texts is a sequence of strings; width_units (Excel column width units), fonts (indexes from
+    font_index), sizes (points) and bold may each be a scalar or a per-text sequence. Each text is
+    split on newlines and its segments measured with the font's glyph widths. A segment wider than the
+    usable column width is wrapped at its spaces: estimated with the width each wrap leaves unused
+    (WRAP_LOSS_WORDS) or, where single words take up most of a line, wrapped word by word. The
+    characters of all texts are measured in one vectorized pass per font.
+    """
+    count = len(texts)
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+    fonts = np.broadcast_to(np.asarray(fonts if fonts is not None else font_index(None), dtype=np.int64), (count,))
+    sizes = np.broadcast_to(np.asarray(sizes if sizes is not None else DEFAULT_FONT_SIZE, dtype=np.float64), (count,))
+    bold = np.broadcast_to(np.asarray(bold if bold is not None else False, dtype=bool), (count,))
+    usable_px = np.maximum(column_pixels(np.broadcast_to(width_units, (count,))) - CELL_PADDING_PX, 1.0)
+    scale = sizes * PX_PER_POINT / UNITS_PER_EM * np.where(bold, BOLD_WIDTH_FACTOR, 1.0)
+
+    used_fonts = np.flatnonzero(np.bincount(fonts, minlength=len(FONTS))).tolist()
+    if len(used_fonts) == 1:
+        return _font_line_counts(texts, used_fonts[0], usable_px, scale)
+    lines = np.empty(count, dtype=np.int64)
+    for font in used_fonts:
+        indexes = np.flatnonzero(fonts == font)
+        font_texts = itemgetter(*indexes.tolist())(texts) if len(indexes) > 1 else [texts[indexes[0]]]
+        lines[indexes] = _font_line_counts(font_texts, font, usable_px[indexes], scale[indexes])
+    return lines
+
+
+class RowSizer:
+    """Collects the wrapped cells of a run of rows and sizes all of them with a single line_counts call."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Typed arrays hand their buffers to NumPy without a per-element conversion.
+        self.rows = array('q')
+        self.texts = []
+        self.widths = array('d')
+        self.fonts = array('q')
+        self.sizes = array('d')
+        self.bold = array('b')
+
+    def add(self, row, text, width_units, font_family=None, font_size=None, bold=False):
+        self.rows.append(row)
+        self.texts.append(text)
+        self.widths.append(width_units)
+        self.fonts.append(font_index(font_family))
+        self.sizes.append(font_size or DEFAULT_FONT_SIZE)
+        self.bold.append(bold)
+
+    def row_heights(self, first_row, last_row):
+        """Heights in points for rows first_row..last_row; rows without text get a single line."""
+        heights = np.full(last_row - first_row + 1, POINTS_PER_LINE)
+        if self.texts:
+            sizes = np.frombuffer(self.sizes)
+            lines = line_counts(self.texts, np.frombuffer(self.widths), np.frombuffer(self.fonts, dtype=np.int64),
+                                sizes, np.frombuffer(self.bold, dtype=bool))
+            np.maximum.at(heights, np.frombuffer(self.rows, dtype=np.int64) - first_row, lines * sizes * LINE_HEIGHT_RATIO)
+        return np.round(heights, 2)